@@ -25,7 +25,7 @@ authRoutes = APIRouter( )
 async def getToken(form_data: Annotated[OAuth2PasswordRequestForm, Depends()]) -> Token :
 
 
-    user = authenticate_user( form_data.username, form_data.password)
+    user = await authenticate_user( form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -42,7 +42,7 @@ async def getToken(form_data: Annotated[OAuth2PasswordRequestForm, Depends()]) -
         )
 
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
+    access_token = await create_access_token(
         data={"sub": user.username}, expires_delta=access_token_expires
     )
 
@@ -57,12 +57,12 @@ async def signup(user: UserModel):
     if user.username == '' or user.password == '':
         return {"error": "Username and password are required"}, status.HTTP_400_BAD_REQUEST
 
-    if db.users.find_one({"username": user.username}):
+    if await db.users.find_one({"username": user.username}):
         return {"error": "Username already exists"}, status.HTTP_400_BAD_REQUEST
     
-    config = getConfiguration()
+    config = await getConfiguration()
 
-    if db.users.count_documents({}) == 1:  #If the only user is root, then this is the first real user, make them an admin
+    if await db.users.count_documents({}) == 1:  #If the only user is root, then this is the first real user, make them an admin
         user.role = 'admin'
     else:
 
@@ -76,8 +76,8 @@ async def signup(user: UserModel):
 
     user.password = pwd_context.hash(user.password)
 
-    newUser = db.users.insert_one(dict(user))
-    return serializeDict(db.users.find_one({"_id": newUser.inserted_id}))
+    newUser = await db.users.insert_one(dict(user))
+    return serializeDict(await db.users.find_one({"_id": newUser.inserted_id}))
 
 @authRoutes.post("/createUser")
 async def createUser(user: UserModel, current_user: Annotated[UserModel, Depends(get_current_user('admin'))] ):
@@ -89,7 +89,7 @@ async def createUser(user: UserModel, current_user: Annotated[UserModel, Depends
     user.password = pwd_context.hash(user.password)
 
 
-    newUser = db.users.insert_one(user.model_dump(exclude_none=True))
+    newUser = await db.users.insert_one(user.model_dump(exclude_none=True))
     return {"message": "User created"}
 
 
@@ -100,9 +100,9 @@ async def createApiKey(newKey: UserModel, expires: datetime, current_user: Annot
     newKey.email = ''
     newKey.expires = expires
 
-    inserted = db.users.insert_one(newKey.model_dump(exclude_none=True))
+    inserted = await db.users.insert_one(newKey.model_dump(exclude_none=True))
 
-    access_token = create_access_token(
+    access_token = await create_access_token(
         data={"sub": newKey.username }, expires=expires
     )
 
@@ -129,7 +129,7 @@ async def changePassword(id: str, password: str, current_user: Annotated[UserMod
     if current_user.id == id or current_user.role == 'root':
 
         hash = pwd_context.hash(password)
-        db.users.update_one({"_id": ObjectId(id)}, {"$set": {"password": hash}})
+        await db.users.update_one({"_id": ObjectId(id)}, {"$set": {"password": hash}})
 
         return {"message": "Password updated"}
     
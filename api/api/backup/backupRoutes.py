@@ -77,9 +77,9 @@ async def restoreBackup(fileName: str, clearData: bool = True, current_user: Ann
 
     if clearData:
         log.info(f"Clearing data")
-        db.drop_collection("users")
-        db.drop_collection("fs.files")
-        db.drop_collection("fs.chunks")
+        await db.drop_collection("users")
+        await db.drop_collection("fs.files")
+        await db.drop_collection("fs.chunks")
 
     await assertBackupDir()
     log.info(f"mongorestore --uri=mongodb://{mongo_host}:27017/{mongo_db_name} --gzip --archive={backup_dir}/{fileName}")
@@ -97,9 +97,9 @@ async def uploadBackup(file: UploadFile = File(...), clearData: bool = True, cur
 
     if clearData:
         log.info(f"Clearing data")
-        db.drop_collection("users")
-        db.drop_collection("fs.files")
-        db.drop_collection("fs.chunks")
+        await db.drop_collection("users")
+        await db.drop_collection("fs.files")
+        await db.drop_collection("fs.chunks")
 
     log.info(f"mongorestore --uri=mongodb://{mongo_host}:27017/{mongo_db_name} --gzip --archive={backup_dir}/{fileName}")
     os.system(f"mongorestore --uri=mongodb://{mongo_host}:27017/{mongo_db_name} --gzip --archive={backup_dir}/{fileName}")
@@ -13,6 +13,7 @@ import secrets
 
 from api.config.configModel import ConfigModel
 from util.configUtil import getConfiguration
+from config.indexes import apply_indexes, index_report
 
 
 configRoutes = APIRouter()
@@ -22,7 +23,7 @@ configRoutes = APIRouter()
 @configRoutes.get("")
 async def getConfig(useCache: bool = False):   
     
-    obj = getConfiguration(useCache)
+    obj = await getConfiguration(useCache)
 
 
     obj.pop("secret_key")
@@ -38,10 +39,10 @@ async def updateConfig(config: ConfigModel, current_user: Annotated[UserModel, D
     config_dict.pop('secret_key', None)
     config_dict.pop('algorithm', None)
 
-    resp = db.config.update_one({}, {"$set": config_dict})
+    resp = await db.config.update_one({}, {"$set": config_dict})
 
 
-    obj = getConfiguration(False)
+    obj = await getConfiguration(False)
     obj.pop("secret_key")
     obj.pop("algorithm")
 
@@ -51,3 +52,22 @@ async def updateConfig(config: ConfigModel, current_user: Annotated[UserModel, D
     return obj
 
 
+@configRoutes.get("/indexes")
+async def getIndexReport(current_user: Annotated[UserModel, Depends(get_current_user('admin'))] ):
+    """
+    Report missing, extra and unused MongoDB indexes per collection.
+    Indexes are declared in config/indexes.py.
+
+    Requires admin privileges.
+    """
+    return await index_report()
+
+
+@configRoutes.post("/indexes")
+async def applyIndexes(current_user: Annotated[UserModel, Depends(get_current_user('admin'))] ):
+    """
+    Create any missing declared indexes (they are also applied on startup).
+
+    Requires admin privileges.
+    """
+    return await apply_indexes()
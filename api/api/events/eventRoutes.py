@@ -0,0 +1,102 @@
+from fastapi import status, Depends, HTTPException, Query, Request
+from fastapi import APIRouter
+from fastapi.responses import StreamingResponse
+from typing import Annotated, List
+from util.authUtil import get_current_user
+from api.users.userModels import UserModel
+from util.eventBus import event_bus, format_event
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+eventRoutes = APIRouter()
+
+# Seconds between keep-alive comments on an idle stream, keeps proxies from
+# closing it and lets the server notice clients that went away
+EVENT_KEEPALIVE = float(os.environ.get('EVENT_KEEPALIVE', '15'))
+
+
+def _parse_topics(topics: str) -> List[str]:
+    parsed = [topic.strip() for topic in topics.split(',') if topic.strip()]
+    for topic in parsed:
+        if topic not in ('products', 'jobs') and not topic.startswith(('product:', 'job:')):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Unknown topic: {topic}"
+            )
+    if not parsed:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No topics given")
+    return parsed
+
+
+async def _check_access(request: Request, topics: List[str]):
+    """Product topics are public like the catalog, job topics need a user."""
+    if all(topic == 'products' or topic.startswith('product:') for topic in topics):
+        return
+
+    scheme, _, token = request.headers.get('authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not token:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Job topics require authentication",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    await get_current_user('user')(token)
+
+
+@eventRoutes.get("")
+async def stream_events(request: Request, topics: str = Query("products")):
+    """
+    Server-sent event stream of catalog and job updates.
+
+    Topics (comma separated):
+        products: every product upsert and delete
+        product:<upc>: updates of one product, e.g. a lane waiting for the
+            price of a product that is still being enriched
+        jobs / job:<id>: job status updates (requires authentication)
+
+    Events:
+        product.upsert: the full product, like GET /products/upc/{upc}
+        product.delete: {"id", "upc"} of a deleted product
+        products.reset: the catalog may have changed in ways not sent as events
+        job.status: the job, like GET /jobs/{id}
+        resync: the client fell behind and the stream ends
+
+    Product events carry a delta sync token as their ID. After a reconnect
+    (or products.reset / resync), catch up with
+    GET /products/changes?since=<Last-Event-ID> before relying on events again.
+    """
+    topic_list = _parse_topics(topics)
+    await _check_access(request, topic_list)
+
+    subscription = event_bus.subscribe(topic_list)
+
+    async def stream():
+        try:
+            # Tell the client the subscription is live, so it can start its catch up sync
+            yield format_event("ready", {"topics": topic_list})
+            while not subscription.done:
+                frame = await subscription.next(EVENT_KEEPALIVE)
+                yield frame if frame is not None else b": keep-alive\n\n"
+            yield format_event("resync", {})
+        finally:
+            event_bus.unsubscribe(subscription)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@eventRoutes.get("/stats")
+async def get_event_stats(
+    current_user: Annotated[UserModel, Depends(get_current_user('admin'))]
+):
+    """
+    Get the number of connected subscribers per topic and the event counters.
+
+    Requires admin privileges.
+    """
+    return event_bus.stats()
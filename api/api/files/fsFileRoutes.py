@@ -8,6 +8,7 @@ from api.users.userModels import UserModel
 from fastapi import FastAPI, File, UploadFile, HTTPException
 from fastapi.responses import FileResponse, StreamingResponse
 from pymongo import MongoClient
+from pymongo.errors import DuplicateKeyError
 import hashlib
 
 from tempfile import NamedTemporaryFile
@@ -16,11 +17,49 @@ from api.files.fsFileModel import fsFileModel
 import io
 import mimetypes
 import logging
+import os
 
 from fastapi import Depends
+from util.changeWatcher import change_watcher
+from util.lruCache import LruTtlCache
 
 logger = logging.getLogger(__name__)
 
+# File entries by id for the image endpoint, only used while the change
+# watcher invalidates it
+_file_cache = LruTtlCache(
+    max_size=int(os.environ.get('FILE_CACHE_SIZE', '10000')),
+    ttl=float(os.environ.get('FILE_CACHE_TTL', '300'))
+)
+_file_generation = 0
+
+
+async def _get_file_entry(id: str):
+    """Return the file entry with the given id, from the cache when it is kept current."""
+    if change_watcher.running:
+        cached = _file_cache.get(id)
+        if cached is not None:
+            return cached
+
+    generation = _file_generation
+    file_meta = await db.files.find_one({"_id": ObjectId(id)})
+    # Not cached if a file changed while it was read
+    if file_meta is not None and change_watcher.running and generation == _file_generation:
+        _file_cache.set(id, file_meta)
+    return file_meta
+
+
+async def _files_changed(event):
+    """Drop the cached file entries when any replica writes one."""
+    global _file_generation
+    _file_generation += 1
+    if event.get('id') is not None:
+        _file_cache.invalidate(str(event['id']))
+    else:
+        _file_cache.clear()
+
+change_watcher.subscribe('files', _files_changed)
+
 
 fileRoutes = APIRouter()
 
@@ -33,9 +72,9 @@ def calculate_md5(file):
     return md5_hash.hexdigest()
 
 
-def remove_fsFile_reference(fsFileId: str, refId: str):
+async def remove_fsFile_reference(fsFileId: str, refId: str):
     """Removes a reference from the fsFileModel."""
-    file = db.files.find_one({"_id": fsFileId})
+    file = await db.files.find_one({"_id": fsFileId})
     if file is not None:
         references = file.get("references", [])
         if refId in references:
@@ -44,21 +83,21 @@ def remove_fsFile_reference(fsFileId: str, refId: str):
             #If there are no more references to a file, delete the file from the gridFS collection and the metadata
             if len(references) == 0:
                 fileId = file.get("fileId")
-                fs.delete(ObjectId(fileId))
-                db.files.delete_one({"_id": fsFileId})
+                await fs.delete(ObjectId(fileId))
+                await db.files.delete_one({"_id": fsFileId})
 
             else: #If there are still references, update the references
-                db.files.update_one({"_id": fsFileId}, {"$set": {"references": references}})
+                await db.files.update_one({"_id": fsFileId}, {"$set": {"references": references}})
 
 
-def add_fsFile_reference(fsFileId: str, refId: str):
+async def add_fsFile_reference(fsFileId: str, refId: str):
     """Adds a reference to the fsFileModel."""
-    file = db.files.find_one({"_id": fsFileId})
+    file = await db.files.find_one({"_id": fsFileId})
     if file is not None:
         references = file.get("references", [])
         if refId not in references:
             references.append(refId)
-            db.files.update_one({"_id": fsFileId}, {"$set": {"references": references}})
+            await db.files.update_one({"_id": fsFileId}, {"$set": {"references": references}})
 
 
 @fileRoutes.get("")
@@ -67,7 +106,7 @@ async def getAll( current_user: Annotated[UserModel, Depends(get_current_user('u
 
         ret = []
 
-        for x in db.files.find():
+        async for x in db.files.find():
             obj = fsFileModel(**x).model_dump(exclude_none=True)
             ret.append(obj)
     
@@ -80,7 +119,7 @@ async def getAll( current_user: Annotated[UserModel, Depends(get_current_user('u
 async def getOne(id: str, current_user: Annotated[UserModel, Depends(get_current_user('user'))]):
 
 
-    model = db.files.find_one({"_id": ObjectId(id)})
+    model = await db.files.find_one({"_id": ObjectId(id)})
 
 
     return fsFileModel(**model).model_dump(exclude_none=True)
@@ -93,16 +132,16 @@ async def get_image(id: str):
     This endpoint does not require authentication for easy image embedding.
     """
     try:
-        file_meta = db.files.find_one({"_id": ObjectId(id)})
+        file_meta = await _get_file_entry(id)
 
         if file_meta is None:
             raise HTTPException(status_code=404, detail="Image not found")
 
         file_id = file_meta['fileId']
-        gridfs_file = fs.get(ObjectId(file_id))
+        gridfs_file = await fs.get(ObjectId(file_id))
 
         # Read file content
-        file_content = gridfs_file.read()
+        file_content = await gridfs_file.read()
 
         # Determine content type from filename or use default
         filename = file_meta.get('name', 'image')
@@ -130,7 +169,7 @@ async def get_image(id: str):
 async def downloadModel(id: str, current_user: Annotated[UserModel, Depends(get_current_user('user'))]):
 
 
-    file = db.files.find_one({"_id": ObjectId(id)})
+    file = await db.files.find_one({"_id": ObjectId(id)})
 
     if file is None:
         raise HTTPException(status_code=404, detail="Model not found")
@@ -138,9 +177,9 @@ async def downloadModel(id: str, current_user: Annotated[UserModel, Depends(get_
 
 
     file_id = file['fileId']
-    file = fs.get(ObjectId(file_id))
+    file = await fs.get(ObjectId(file_id))
     temp_file = NamedTemporaryFile(delete=False)
-    temp_file.write(file.read())
+    temp_file.write(await file.read())
     temp_file.close()
     return temp_file.name
 
@@ -149,11 +188,11 @@ async def upload_file(file: UploadFile = File(...), current_user: Annotated[User
     
     md5 = calculate_md5(file.file)
 
-    file_id = fs.put(file.file.read(), filename=file.filename, owner=current_user.id, test="test")
+    file_id = await fs.put(file.file.read(), filename=file.filename, owner=current_user.id, test="test")
 
     #check for file in fsFiles
 
-    existing = db.files.find_one({"md5": md5})
+    existing = await db.files.find_one({"md5": md5})
 
     if existing is not None:
         return fsFileModel(**existing).model_dump(exclude_none=True)
@@ -166,21 +205,27 @@ async def upload_file(file: UploadFile = File(...), current_user: Annotated[User
          "references": []
     }
 
-    inserted = db.files.insert_one(newFsFile)
+    try:
+        inserted = await db.files.insert_one(newFsFile)
+    except DuplicateKeyError:
+        # Stored by a concurrent upload, keep that one
+        await fs.delete(file_id)
+        existing = await db.files.find_one({"md5": md5})
+        return fsFileModel(**existing).model_dump(exclude_none=True)
 
-    ret = db.files.find_one({"_id": inserted.inserted_id})
+    ret = await db.files.find_one({"_id": inserted.inserted_id})
 
     return fsFileModel(**ret).model_dump(exclude_none=True)
 
 @fileRoutes.delete("/{id}")
 async def deleteModel(id: str, current_user: Annotated[UserModel, Depends(get_current_user('user'))]):
     
-    model = db.files.find_one({"_id": ObjectId(id)})
+    model = await db.files.find_one({"_id": ObjectId(id)})
     file_id = model['fileId']
 
-    fs.delete(ObjectId(file_id))
+    await fs.delete(ObjectId(file_id))
 
-    db.files.delete_one({"_id": ObjectId(id)})
+    await db.files.delete_one({"_id": ObjectId(id)})
     
     return
 
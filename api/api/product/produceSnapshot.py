@@ -0,0 +1,114 @@
+import asyncio
+from datetime import datetime
+import logging
+from typing import Any, Dict, Optional
+
+from pymongo import ASCENDING
+
+from config.db import db
+from api.product.productModel import FoodProduct
+from api.product.productSerializer import render_products
+from util.catalogVersion import catalog_version
+from util.compression import available_encodings, compress_bytes
+
+logger = logging.getLogger(__name__)
+
+
+PRODUCE_CATEGORIES = ["Fruits", "Vegetables", "Herbs"]
+
+# Products with brand "Fresh Produce" OR category in Fruits/Vegetables/Herbs
+PRODUCE_QUERY = {
+    "$or": [
+        {"brand": "Fresh Produce"},
+        {"category": {"$in": PRODUCE_CATEGORIES}}
+    ]
+}
+
+
+def is_produce(product: Optional[Dict[str, Any]]) -> bool:
+    """Check whether a product document matches PRODUCE_QUERY."""
+    if not product:
+        return False
+    return product.get('brand') == "Fresh Produce" or product.get('category') in PRODUCE_CATEGORIES
+
+
+class ProduceSnapshot:
+    """
+    The full produce list at one 'produce' catalog version, rendered as JSON
+    and compressed with every available content encoding.
+
+    A snapshot is never changed once built, a newer version replaces it.
+    """
+
+    def __init__(
+        self,
+        version: Optional[int] = None,
+        body: bytes = b"",
+        encoded: Optional[Dict[str, bytes]] = None,
+        count: int = 0,
+        built_at: Optional[datetime] = None
+    ):
+        self.version = version
+        self.body = body
+        self.encoded = encoded or {}
+        self.count = count
+        self.built_at = built_at
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "items": self.count,
+            "bytes": len(self.body),
+            "encoded_bytes": {encoding: len(data) for encoding, data in self.encoded.items()},
+            "built_at": self.built_at,
+        }
+
+
+class ProduceSnapshotCache:
+    """
+    Keeps the current ProduceSnapshot in memory.
+
+    The snapshot is rebuilt on the first request after the 'produce' catalog
+    version moves, which happens when a produce product is written or
+    seed_produce.py runs. A rebuilt snapshot is swapped in with one
+    assignment, so a request never sees the body of one version with the
+    encodings or version of another.
+    """
+
+    def __init__(self):
+        self._snapshot = ProduceSnapshot()
+        self._lock = asyncio.Lock()
+
+    async def current(self) -> ProduceSnapshot:
+        """Return the snapshot, rebuilding it first if the produce version moved."""
+        version = await catalog_version.current('produce')
+        if version != self._snapshot.version:
+            async with self._lock:
+                if version != self._snapshot.version:
+                    self._snapshot = await self._build(version)
+        return self._snapshot
+
+    async def _build(self, version: int) -> ProduceSnapshot:
+        # Version is read before the query, so a concurrent write leaves the
+        # snapshot stamped older than its content and it is rebuilt again
+        documents = await db.products.find(PRODUCE_QUERY).sort([("_id", ASCENDING)]).to_list()
+
+        body = render_products(documents, FoodProduct)
+        # Compressed once per version at the best level, not per request
+        encoded = {
+            encoding: await asyncio.to_thread(compress_bytes, body, encoding)
+            for encoding in available_encodings()
+        }
+        snapshot = ProduceSnapshot(version, body, encoded, len(documents), datetime.utcnow())
+
+        sizes = ", ".join(f"{len(data)} {encoding}" for encoding, data in encoded.items())
+        logger.info(f"Built produce snapshot v{version}: {snapshot.count} items, "
+                    f"{len(body)} bytes ({sizes})")
+        return snapshot
+
+    def stats(self) -> Dict[str, Any]:
+        return self._snapshot.stats()
+
+
+# Global instance
+produce_snapshot = ProduceSnapshotCache()
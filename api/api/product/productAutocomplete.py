@@ -0,0 +1,361 @@
+"""
+Typo tolerant autocomplete over product names and brands.
+
+The index lives in memory. Product names and brands are split into
+lowercase tokens, and every distinct token is indexed twice:
+
+- in a sorted vocabulary, for prefix matches while a word is being typed
+  ("banan" -> "banana")
+- by its trigrams, for misspellings ("honycrisp" -> "honeycrisp")
+
+A query term is first matched against the vocabulary, which is much
+smaller than the catalog, and only the matching tokens are expanded to
+the products that contain them. Products must match every query term and
+are ranked by how closely they match.
+
+The change watcher keeps the index current product by product. Without
+change streams it is rebuilt in the background when the catalog version
+moves.
+"""
+import asyncio
+import bisect
+from collections import Counter, defaultdict
+import heapq
+from itertools import chain, groupby
+import logging
+import os
+import re
+import time
+import unicodedata
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from config.db import db
+from util.catalogVersion import catalog_version
+from util.changeWatcher import change_watcher
+
+logger = logging.getLogger(__name__)
+
+
+# Vocabulary tokens considered per query term
+AUTOCOMPLETE_PREFIX_TOKENS = int(os.environ.get('AUTOCOMPLETE_PREFIX_TOKENS', '200'))
+AUTOCOMPLETE_FUZZY_TOKENS = int(os.environ.get('AUTOCOMPLETE_FUZZY_TOKENS', '50'))
+
+# Minimum trigram similarity of a misspelled term and a token
+AUTOCOMPLETE_MIN_SIMILARITY = float(os.environ.get('AUTOCOMPLETE_MIN_SIMILARITY', '0.4'))
+
+# Combinations of term matches tried before giving up on filling the results
+AUTOCOMPLETE_MAX_COMBINATIONS = 1000
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """Lowercase, accent-free word tokens of a text, in order and without duplicates."""
+    if not text:
+        return []
+    text = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('ascii').lower()
+    return list(dict.fromkeys(_TOKEN.findall(text)))
+
+
+def trigrams(token: str) -> Set[str]:
+    """Trigrams of a token padded with one space on each side."""
+    padded = f" {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class _Index:
+    """The index data. Only touched from the event loop, or by the thread building a new one."""
+
+    def __init__(self):
+        # Product id -> (name, brand, upc, product_type)
+        self.products: Dict[str, Tuple[Optional[str], Optional[str], Optional[str], Optional[str]]] = {}
+        self.product_tokens: Dict[str, List[str]] = {}
+        self.name_lengths: Dict[str, int] = {}
+        # Name length -> ids of the products with a name that long
+        self.length_products: Dict[int, Set[str]] = defaultdict(set)
+        self.type_products: Dict[Optional[str], Set[str]] = defaultdict(set)
+        # Token -> ids of the products containing it
+        self.token_products: Dict[str, Set[str]] = {}
+        # Trigram -> tokens containing it
+        self.trigram_tokens: Dict[str, Set[str]] = defaultdict(set)
+        self.vocabulary: List[str] = []
+
+    def add(self, product: Dict[str, Any], sort: bool = True):
+        product_id = str(product['_id'])
+        self.remove(product_id)
+
+        name = product.get('name')
+        brand = product.get('brand')
+        tokens = list(dict.fromkeys(tokenize(name) + tokenize(brand)))
+        self.products[product_id] = (name, brand, product.get('upc'), product.get('product_type'))
+        self.product_tokens[product_id] = tokens
+        self.name_lengths[product_id] = len(name or '')
+        self.length_products[len(name or '')].add(product_id)
+        self.type_products[product.get('product_type')].add(product_id)
+
+        for token in tokens:
+            products = self.token_products.get(token)
+            if products is None:
+                products = self.token_products[token] = set()
+                for trigram in trigrams(token):
+                    self.trigram_tokens[trigram].add(token)
+                if sort:
+                    bisect.insort(self.vocabulary, token)
+                else:
+                    self.vocabulary.append(token)
+            products.add(product_id)
+
+    def remove(self, product_id: str):
+        tokens = self.product_tokens.pop(product_id, None)
+        if tokens is None:
+            return
+        product_type = self.products.pop(product_id)[3]
+        self.length_products[self.name_lengths.pop(product_id)].discard(product_id)
+        self.type_products[product_type].discard(product_id)
+
+        for token in tokens:
+            products = self.token_products[token]
+            products.discard(product_id)
+            if not products:
+                del self.token_products[token]
+                for trigram in trigrams(token):
+                    self.trigram_tokens[trigram].discard(token)
+                index = bisect.bisect_left(self.vocabulary, token)
+                if index < len(self.vocabulary) and self.vocabulary[index] == token:
+                    del self.vocabulary[index]
+
+    def _similar_tokens(self, term: str) -> List[Tuple[str, float]]:
+        """
+        Vocabulary tokens matching a query term with their similarity (1.0
+        for the term itself), most similar first.
+        """
+        similar = {}
+
+        # Prefix matches, closer in length is better
+        start = bisect.bisect_left(self.vocabulary, term)
+        for token in self.vocabulary[start:start + AUTOCOMPLETE_PREFIX_TOKENS]:
+            if not token.startswith(term):
+                break
+            similar[token] = 1.0 if token == term else 0.8 + 0.15 * len(term) / len(token)
+
+        # Misspellings, by Dice similarity of the trigram sets. A term that is
+        # a known word is taken as spelled correctly.
+        if len(term) >= 3 and term not in self.token_products:
+            term_trigrams = trigrams(term)
+            shared = Counter(chain.from_iterable(self.trigram_tokens.get(trigram, ()) for trigram in term_trigrams))
+            scored = []
+            for token, count in shared.items():
+                if token in similar:
+                    continue
+                similarity = 2 * count / (len(term_trigrams) + len(token))
+                if similarity >= AUTOCOMPLETE_MIN_SIMILARITY:
+                    scored.append((similarity * 0.8, token))
+            for similarity, token in heapq.nlargest(AUTOCOMPLETE_FUZZY_TOKENS, scored):
+                similar[token] = similarity
+
+        return sorted(similar.items(), key=lambda item: item[1], reverse=True)
+
+    def _level_sets(self, tokens: List[Tuple[str, float]]) -> Tuple[List[float], "_LevelSets"]:
+        levels = [(similarity, [token for token, _ in group])
+                  for similarity, group in groupby(tokens, key=lambda item: item[1])]
+        return [similarity for similarity, _ in levels], _LevelSets(self, [group for _, group in levels])
+
+    def _shortest(self, products: Set[str], count: int) -> List[str]:
+        """The count products with the shortest names, shorter names rank first among equal matches."""
+        if len(products) <= 4 * count:
+            return heapq.nsmallest(count, products, key=self.name_lengths.__getitem__)
+        shortest: List[str] = []
+        for length in sorted(self.length_products):
+            shortest.extend(products & self.length_products[length])
+            if len(shortest) >= count:
+                break
+        return shortest[:count]
+
+    def search(self, query: str, limit: int, product_type: Optional[str] = None) -> List[Dict[str, Any]]:
+        terms = tokenize(query)[:6]
+        if not terms:
+            return []
+        matches = [self._similar_tokens(term) for term in terms]
+        if not all(matches):
+            return []
+        allowed = self.type_products.get(product_type, set()) if product_type is not None else None
+
+        # The products of a term are split into levels by the similarity of
+        # their best matching token. Combinations of levels (one per term)
+        # are visited best total first, so only the products that make the
+        # results are ever touched by Python code, the rest is set
+        # operations. A single short term can match much of the catalog.
+        similarities, level_sets = zip(*(self._level_sets(tokens) for tokens in matches))
+        start = (0,) * len(terms)
+        queue = [(-sum(levels[0] for levels in similarities), start)]
+        visited = {start}
+        ranked: List[Tuple[float, str]] = []
+        steps = 0
+        while queue and len(ranked) < limit and steps < AUTOCOMPLETE_MAX_COMBINATIONS:
+            total, indexes = heapq.heappop(queue)
+            steps += 1
+
+            hits = allowed
+            for term, index in enumerate(indexes):
+                products = level_sets[term][index]
+                hits = products if hits is None else hits & products
+                if not hits:
+                    break
+            if hits:
+                ranked.extend((-total / len(terms), product_id)
+                              for product_id in self._shortest(hits, limit - len(ranked)))
+
+            for term, index in enumerate(indexes):
+                if index + 1 < len(similarities[term]):
+                    following = indexes[:term] + (index + 1,) + indexes[term + 1:]
+                    if following not in visited:
+                        visited.add(following)
+                        drop = similarities[term][index] - similarities[term][index + 1]
+                        heapq.heappush(queue, (total + drop, following))
+
+        return [
+            {
+                "id": product_id,
+                "name": self.products[product_id][0],
+                "brand": self.products[product_id][1],
+                "upc": self.products[product_id][2],
+                "product_type": self.products[product_id][3],
+                "score": round(score, 3),
+            }
+            for score, product_id in ranked
+        ]
+
+
+class _LevelSets:
+    """Products per similarity level of a query term, computed when first needed."""
+
+    def __init__(self, index: _Index, levels: List[List[str]]):
+        self._index = index
+        self._levels = levels
+        self._sets: List[Set[str]] = []
+        self._covered: Set[str] = set()
+
+    def __getitem__(self, level: int) -> Set[str]:
+        while len(self._sets) <= level:
+            tokens = self._levels[len(self._sets)]
+            # Products matched at a better level stay there
+            products = set().union(*(self._index.token_products[token] for token in tokens)) - self._covered
+            self._covered |= products
+            self._sets.append(products)
+        return self._sets[level]
+
+
+class ProductAutocomplete:
+    """
+    Autocomplete index over the product catalog, see the module docstring.
+
+    Rebuilds read the products from MongoDB and index them in a worker
+    thread, then swap the new index in. Changes that arrive during a
+    rebuild are applied to the new index after the swap.
+    """
+
+    def __init__(self):
+        self._index: Optional[_Index] = None
+        self._version: Optional[int] = None
+        self._building: Optional[asyncio.Task] = None
+        self._pending: List[Tuple[str, Any]] = []
+        self.built_at: Optional[datetime] = None
+        self.build_seconds: Optional[float] = None
+
+    def upsert(self, product: Dict[str, Any]):
+        """Index a written product."""
+        if self._building is not None:
+            self._pending.append(('upsert', product))
+        if self._index is not None:
+            self._index.add(product)
+
+    def remove(self, product_id: str):
+        """Drop a deleted product."""
+        if self._building is not None:
+            self._pending.append(('remove', product_id))
+        if self._index is not None:
+            self._index.remove(product_id)
+
+    def indexed_upc(self, product_id: str) -> Optional[str]:
+        """UPC a product was last indexed with, None if it is not in the index."""
+        if self._index is None or product_id not in self._index.products:
+            return None
+        return self._index.products[product_id][2]
+
+    def schedule_rebuild(self) -> asyncio.Task:
+        """Start a rebuild unless one is running, and return it."""
+        if self._building is None:
+            self._building = asyncio.create_task(self._rebuild())
+        return self._building
+
+    async def _rebuild(self):
+        try:
+            started = time.perf_counter()
+            version = await catalog_version.current()
+            products = await db.products.find(
+                {}, {"name": 1, "brand": 1, "upc": 1, "product_type": 1}
+            ).to_list()
+
+            def build():
+                index = _Index()
+                for product in products:
+                    index.add(product, sort=False)
+                index.vocabulary.sort()
+                return index
+
+            index = await asyncio.to_thread(build)
+            for operation, argument in self._pending:
+                if operation == 'upsert':
+                    index.add(argument)
+                else:
+                    index.remove(argument)
+
+            self._index = index
+            self._version = version
+            self.built_at = datetime.utcnow()
+            self.build_seconds = time.perf_counter() - started
+            logger.info(f"Built autocomplete index: {len(index.products)} products, "
+                        f"{len(index.vocabulary)} tokens in {self.build_seconds:.2f}s")
+        except Exception as e:
+            logger.error(f"Error building autocomplete index: {str(e)}")
+        finally:
+            self._pending = []
+            self._building = None
+
+    async def search(self, query: str, limit: int = 10, product_type: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Rank products whose name or brand match the query.
+
+        Args:
+            query: Partial and possibly misspelled words
+            limit: Maximum number of results
+            product_type: Only return products of this type
+
+        Returns:
+            Matches with id, name, brand, upc, product_type and a score between 0 and 1
+        """
+        if self._index is None:
+            # Shielded, a client going away must not cancel the shared build
+            await asyncio.shield(self.schedule_rebuild())
+            if self._index is None:
+                return []
+        elif not change_watcher.running and await catalog_version.current() != self._version:
+            # Nothing tells the index about writes, refresh it in the background
+            self.schedule_rebuild()
+
+        return self._index.search(query, limit, product_type)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "products": len(self._index.products) if self._index else 0,
+            "tokens": len(self._index.vocabulary) if self._index else 0,
+            "version": self._version,
+            "built_at": self.built_at,
+            "build_seconds": self.build_seconds,
+            "rebuilding": self._building is not None,
+        }
+
+
+# Global instance
+autocomplete_index = ProductAutocomplete()
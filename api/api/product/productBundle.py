@@ -0,0 +1,209 @@
+"""
+Offline catalog bundles for kiosks.
+
+A bundle is a tar.gz holding every product (as NDJSON, in chunks), the
+product images and a manifest.json index. Its version is a delta sync
+token: a bundle built with ``since`` set to the version of an older bundle
+only holds what changed after it, plus the ids of deleted products.
+
+The archive is written while it is sent: products are read from MongoDB
+one chunk at a time and images are copied from GridFS chunk by chunk, so
+memory use does not grow with the catalog.
+
+Usage (from the api directory):
+    python -m api.product.productBundle --out catalog.tar.gz
+    python -m api.product.productBundle --out diff.tar.gz --since <version>
+"""
+import argparse
+import asyncio
+from datetime import datetime
+import json
+import logging
+import mimetypes
+import os
+import tarfile
+import time
+import zlib
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import ASCENDING
+
+from config.db import db, fs
+from api.product.productSerializer import render_ndjson_line
+from api.product.productSync import SYNC_SETTLE_SECONDS, encode_sync_token, sync_window
+
+logger = logging.getLogger(__name__)
+
+
+# Products per NDJSON file in the archive
+BUNDLE_CHUNK_SIZE = int(os.environ.get('BUNDLE_CHUNK_SIZE', '1000'))
+
+BUNDLE_FORMAT = 1
+
+
+class _TarGzWriter:
+    """Incremental tar.gz encoder, every call returns the compressed bytes produced so far."""
+
+    def __init__(self, level: int = 6):
+        # wbits 31 writes a gzip header and trailer
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        self._mtime = int(time.time())
+
+    def header(self, name: str, size: int) -> bytes:
+        info = tarfile.TarInfo(name)
+        info.size = size
+        info.mtime = self._mtime
+        info.mode = 0o644
+        return self._compressor.compress(info.tobuf(tarfile.PAX_FORMAT))
+
+    def data(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def end_member(self, size: int) -> bytes:
+        return self._compressor.compress(b"\0" * (-size % tarfile.BLOCKSIZE))
+
+    def member(self, name: str, data: bytes) -> bytes:
+        return self.header(name, len(data)) + self.data(data) + self.end_member(len(data))
+
+    def close(self) -> bytes:
+        return self._compressor.compress(b"\0" * (2 * tarfile.BLOCKSIZE)) + self._compressor.flush()
+
+
+async def plan_bundle(since: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Fix the range of changes a bundle holds. Call before streaming it, so an
+    expired token fails with 410 instead of a broken download.
+
+    Args:
+        since: Version of a previous bundle to build a diff against, None for a full bundle
+
+    Returns:
+        Bundle plan for stream_bundle, with the bundle version under "version"
+    """
+    start, now, _ = await sync_window(since)
+    state = await db.catalog_state.find_one({"_id": "sync_seq"})
+    end = max(start, state["version"] if state else 0)
+    return {"base": since, "start": start, "end": end, "version": encode_sync_token(end, now)}
+
+
+async def stream_bundle(plan: Dict[str, Any]) -> AsyncIterator[bytes]:
+    """
+    Build the bundle of a plan, yielding tar.gz bytes as they are produced.
+
+    Args:
+        plan: Result of plan_bundle
+    """
+    # Writes stamped up to the end of the range may still be landing
+    await asyncio.sleep(SYNC_SETTLE_SECONDS)
+
+    writer = _TarGzWriter()
+    query = {"sync_seq": {"$gt": plan["start"], "$lte": plan["end"]}}
+    product_files: List[str] = []
+    images: Dict[str, Dict[str, Any]] = {}
+    product_count = 0
+
+    chunk: List[Dict[str, Any]] = []
+    cursor = db.products.find(query).sort([("sync_seq", ASCENDING)]).batch_size(BUNDLE_CHUNK_SIZE)
+    async for product in cursor:
+        chunk.append(product)
+        if len(chunk) == BUNDLE_CHUNK_SIZE:
+            async for data in _write_chunk(writer, chunk, product_files, images):
+                yield data
+            product_count += len(chunk)
+            chunk = []
+    if chunk:
+        async for data in _write_chunk(writer, chunk, product_files, images):
+            yield data
+        product_count += len(chunk)
+
+    deleted = [
+        {"id": str(tombstone["_id"]), "upc": tombstone.get("upc")}
+        async for tombstone in db.product_tombstones.find(query, {"upc": 1})
+    ] if plan["base"] else []
+
+    manifest = {
+        "format": BUNDLE_FORMAT,
+        "version": plan["version"],
+        "base": plan["base"],
+        "created_at": datetime.utcnow().isoformat(),
+        "product_count": product_count,
+        "product_files": product_files,
+        "images": images,
+        "deleted": deleted,
+    }
+    yield writer.member("manifest.json", json.dumps(manifest, indent=1).encode("utf-8"))
+    yield writer.close()
+
+    logger.info(f"Built catalog bundle {plan['end']} ({'diff' if plan['base'] else 'full'}): "
+                f"{product_count} products, {len(images)} images, {len(deleted)} deleted")
+
+
+async def _write_chunk(writer: _TarGzWriter, products: List[Dict[str, Any]],
+                       product_files: List[str], images: Dict[str, Dict[str, Any]]) -> AsyncIterator[bytes]:
+    """Write one NDJSON file of products followed by the images they reference."""
+    name = f"products/{len(product_files) + 1:05d}.ndjson"
+    yield writer.member(name, b"".join(render_ndjson_line(product) for product in products))
+    product_files.append(name)
+
+    image_ids = set()
+    for product in products:
+        for image_id in product.get("images") or []:
+            if image_id not in images:
+                try:
+                    image_ids.add(ObjectId(image_id))
+                except (InvalidId, TypeError):
+                    continue
+
+    async for file_meta in db.files.find({"_id": {"$in": list(image_ids)}}):
+        async for data in _write_image(writer, file_meta, images):
+            yield data
+
+
+async def _write_image(writer: _TarGzWriter, file_meta: Dict[str, Any], images: Dict[str, Dict[str, Any]]) -> AsyncIterator[bytes]:
+    """Copy one image from GridFS into the archive, chunk by chunk."""
+    try:
+        grid_out = await fs.get(ObjectId(file_meta["fileId"]))
+    except Exception as e:
+        logger.error(f"Skipping image {file_meta['_id']} in bundle: {str(e)}")
+        return
+
+    filename = file_meta.get("name", "image")
+    extension = os.path.splitext(filename)[1] or ".jpg"
+    path = f"images/{file_meta['_id']}{extension}"
+
+    yield writer.header(path, grid_out.length)
+    while True:
+        data = await grid_out.readchunk()
+        if not data:
+            break
+        yield writer.data(data)
+    yield writer.end_member(grid_out.length)
+
+    images[str(file_meta["_id"])] = {
+        "path": path,
+        "md5": file_meta.get("md5"),
+        "content_type": mimetypes.guess_type(filename)[0] or "image/jpeg",
+    }
+
+
+async def run(out: str, since: Optional[str]):
+    plan = await plan_bundle(since)
+    with open(out, "wb") as f:
+        async for data in stream_bundle(plan):
+            f.write(data)
+    print(f"Wrote {out}, version {plan['version']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", required=True, help="Archive to write")
+    parser.add_argument("--since", help="Version of a previous bundle, builds a diff against it")
+    args = parser.parse_args()
+
+    asyncio.run(run(args.out, args.since))
+
+
+if __name__ == "__main__":
+    main()
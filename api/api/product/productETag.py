@@ -0,0 +1,62 @@
+import hashlib
+import os
+from typing import Dict
+
+from fastapi import Request, Response, status
+
+from util.catalogVersion import catalog_version
+
+
+# Seconds clients may reuse a catalog response before revalidating it
+CATALOG_MAX_AGE = int(os.environ.get('CATALOG_MAX_AGE', '0'))
+
+
+async def catalog_etag(request: Request, counter: str = 'products') -> str:
+    """
+    Build the ETag of a catalog response.
+
+    The tag combines the catalog version with a digest of the request path
+    and query, so it changes whenever any product is written and differs
+    between pages, projections and formats. Read it before querying, so a
+    write racing with the request can only make the tag older than the
+    body, never newer.
+
+    Args:
+        request: Incoming request
+        counter: Catalog version counter the response depends on
+
+    Returns:
+        Weak ETag header value
+    """
+    digest = hashlib.sha1(f"{request.url.path}?{request.url.query}".encode()).hexdigest()[:16]
+    return f'W/"{await catalog_version.current(counter)}-{digest}"'
+
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    """Check whether the If-None-Match header of the request matches the ETag."""
+    header = request.headers.get('if-none-match')
+    if not header:
+        return False
+
+    tags = [tag.strip() for tag in header.split(',')]
+    return '*' in tags or any(tag.removeprefix('W/') == etag.removeprefix('W/') for tag in tags)
+
+
+def cache_headers(etag: str, public: bool = True) -> Dict[str, str]:
+    """
+    Caching headers for a catalog response.
+
+    Args:
+        etag: ETag of the response
+        public: False for responses that depend on the authenticated user
+    """
+    scope = 'public' if public else 'private'
+    return {
+        'ETag': etag,
+        'Cache-Control': f"{scope}, max-age={CATALOG_MAX_AGE}, must-revalidate",
+    }
+
+
+def not_modified(etag: str, public: bool = True) -> Response:
+    """Empty 304 response telling the client its copy is still current."""
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=cache_headers(etag, public))
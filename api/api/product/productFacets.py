@@ -0,0 +1,144 @@
+"""
+Facet counts for browsing the product catalog.
+
+One ``$facet`` aggregation counts the products per product type, brand,
+tag, category and price band. Results are cached per filter and stamped
+with the 'products' catalog version, so the first request after a product
+write recomputes them and every other request is served from memory.
+"""
+import logging
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from config.db import db
+from util.catalogVersion import catalog_version
+from util.lruCache import LruTtlCache
+from util.singleFlight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+
+# Upper bounds of the price bands, the last band is open ended
+FACET_PRICE_BANDS = [float(bound) for bound in os.environ.get('FACET_PRICE_BANDS', '1,2,5,10,20,50').split(',')]
+
+# Values returned per facet, most frequent first
+FACET_LIMIT = int(os.environ.get('FACET_LIMIT', '100'))
+
+FACET_FIELDS = ["product_type", "brand", "tags", "category"]
+
+# Facet results by filter, each stamped with the catalog version it was computed at
+_facet_cache = LruTtlCache(
+    max_size=int(os.environ.get('FACET_CACHE_SIZE', '256')),
+    ttl=float(os.environ.get('FACET_CACHE_TTL', '0'))
+)
+_facet_flights = SingleFlight()
+
+
+def _band_label(lower: float, upper: Optional[float]) -> str:
+    return f"{lower:g}-{upper:g}" if upper is not None else f"{lower:g}+"
+
+
+def _pipeline(match: Dict[str, Any]) -> List[Dict[str, Any]]:
+    facets: Dict[str, List[Dict[str, Any]]] = {
+        "total": [{"$count": "count"}],
+        "price": [{
+            "$bucket": {
+                "groupBy": "$price",
+                "boundaries": [0.0] + FACET_PRICE_BANDS + [float('inf')],
+                # Missing, null and non-numeric prices
+                "default": "unpriced",
+                "output": {"count": {"$sum": 1}},
+            }
+        }],
+    }
+    for field in FACET_FIELDS:
+        stages: List[Dict[str, Any]] = []
+        if field == "tags":
+            stages.append({"$unwind": "$tags"})
+        stages += [
+            {"$match": {field: {"$nin": [None, ""]}}},
+            {"$group": {"_id": f"${field}", "count": {"$sum": 1}}},
+            # Ties in name order, so the cut at FACET_LIMIT is stable
+            {"$sort": {"count": -1, "_id": 1}},
+            {"$limit": FACET_LIMIT},
+        ]
+        facets[field] = stages
+
+    pipeline: List[Dict[str, Any]] = [{"$match": match}] if match else []
+    return pipeline + [{"$facet": facets}]
+
+
+def _render(result: Dict[str, Any], version: int) -> Dict[str, Any]:
+    bands = {bucket["_id"]: bucket["count"] for bucket in result["price"]}
+    bounds = [0.0] + FACET_PRICE_BANDS
+    price = []
+    for i, lower in enumerate(bounds):
+        upper = bounds[i + 1] if i + 1 < len(bounds) else None
+        price.append({
+            "value": _band_label(lower, upper),
+            "min": lower,
+            "max": upper,
+            "count": bands.get(lower, 0),
+        })
+    price.append({"value": "unpriced", "min": None, "max": None, "count": bands.get("unpriced", 0)})
+
+    facets = {
+        field: [{"value": entry["_id"], "count": entry["count"]} for entry in result[field]]
+        for field in FACET_FIELDS
+    }
+    facets["price"] = price
+
+    return {
+        "version": version,
+        "total": result["total"][0]["count"] if result["total"] else 0,
+        "facets": facets,
+    }
+
+
+async def _compute(match: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+    # Version is read before the aggregation, so a concurrent write leaves
+    # the result stamped older than its content and it is computed again
+    version = await catalog_version.current()
+    results = await (await db.products.aggregate(_pipeline(match))).to_list()
+    return version, _render(results[0], version)
+
+
+async def product_facets(
+    product_type: Optional[str] = None,
+    brand: Optional[str] = None,
+    tag: Optional[str] = None,
+    category: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Count the products matching the filters per facet value.
+
+    Args:
+        product_type: Only count products of this type
+        brand: Only count products of this brand
+        tag: Only count products with this tag
+        category: Only count products in this category
+
+    Returns:
+        {"version", "total", "facets": {field: [{"value", "count"}, ...]}}.
+        Price bands also carry their "min" and "max".
+    """
+    match = {
+        field: value
+        for field, value in (("product_type", product_type), ("brand", brand), ("tags", tag), ("category", category))
+        if value is not None
+    }
+    key = tuple(sorted(match.items()))
+
+    version = await catalog_version.current()
+    cached = _facet_cache.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    # Concurrent requests after a write share one aggregation
+    computed_version, facets = await _facet_flights.do(key, lambda: _compute(match))
+    _facet_cache.set(key, (computed_version, facets))
+    return facets
+
+
+def facet_cache_stats() -> Dict[str, Any]:
+    return {**_facet_cache.stats(), "aggregations": _facet_flights.stats()}
@@ -34,6 +34,7 @@ class Product(BaseModel):
     image_source: Optional[str] = Field(title="Image Source", description="Store where the images were obtained", default=None)
     brand: Optional[str] = Field(title="Brand", description="Product brand name", default=None)
     last_modified: Optional[datetime] = Field(title="Last Modified", description="Timestamp when the product was last modified", default=None)
+    enrichment: Optional[str] = Field(title="Enrichment", description="'pending' while the store price and image are looked up in the background, then 'complete' or 'failed'", default=None)
 
 
 class FoodProduct(Product):
@@ -56,5 +57,12 @@ class BookProduct(Product):
     categories: Optional[List[str]] = Field(title="Categories", description="Book categories or genres", default=None)
 
 
+class UpcBatchRequest(BaseModel):
+    """Request body of the batch UPC lookup"""
+    upcs: List[str] = Field(title="UPCs", description="UPCs or ISBNs to resolve", min_length=1, max_length=500)
+    cache: bool = Field(title="Cache", description="Check the database first and store looked up products", default=True)
+    product_type: Optional[str] = Field(title="Product Type", description="Force 'book' or 'food' lookups instead of detecting them per UPC", default=None)
+
+
 # Legacy alias for backward compatibility
 productModel = Product
\ No newline at end of file
@@ -0,0 +1,156 @@
+import base64
+from typing import Any, AsyncIterable, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from bson import json_util
+from fastapi import HTTPException, status
+from pymongo import ASCENDING
+
+from api.product.productModel import Product, FoodProduct, BookProduct
+
+
+# Every field a product response can contain, used to validate fields= projections
+PRODUCT_FIELDS = set(Product.model_fields) | set(FoodProduct.model_fields) | set(BookProduct.model_fields)
+
+Sort = List[Tuple[str, int]]
+
+
+def encode_cursor(values: List[Any]) -> str:
+    """
+    Encode the sort key of the last returned document into an opaque cursor.
+
+    Args:
+        values: Sort key values (BSON types such as ObjectId and datetime are allowed)
+
+    Returns:
+        URL-safe cursor string
+    """
+    raw = json_util.dumps(values).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str], size: int) -> Optional[List[Any]]:
+    """
+    Decode a cursor produced by encode_cursor.
+
+    Args:
+        cursor: Cursor string from a previous page (may be None)
+        size: Number of sort key values the cursor is expected to hold
+
+    Returns:
+        List of sort key values, or None if no cursor was given
+
+    Raises:
+        HTTPException: 400 if the cursor is malformed
+    """
+    if not cursor:
+        return None
+
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json_util.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (ValueError, TypeError, UnicodeError):
+        values = None
+
+    if not isinstance(values, list) or len(values) != size:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+    return values
+
+
+def keyset_filter(sort: Sort, after: List[Any]) -> Dict[str, Any]:
+    """
+    Build a filter matching documents that come after a sort key.
+
+    For a sort of [(a, -1), (b, 1)] and key [x, y] this yields
+    {"$or": [{a: {"$lt": x}}, {a: x, b: {"$gt": y}}]}.
+
+    Args:
+        sort: List of (field, direction) pairs the query is sorted by
+        after: Sort key values of the last document already returned
+
+    Returns:
+        MongoDB filter document
+    """
+    clauses = []
+    for i, (field, direction) in enumerate(sort):
+        clause = {prev_field: value for (prev_field, _), value in zip(sort[:i], after[:i])}
+        clause[field] = {"$gt" if direction == ASCENDING else "$lt": after[i]}
+        clauses.append(clause)
+
+    return clauses[0] if len(clauses) == 1 else {"$or": clauses}
+
+
+def paged_filter(query: Dict[str, Any], sort: Sort, cursor: Optional[str]) -> Dict[str, Any]:
+    """
+    Combine a query with the keyset condition for a cursor.
+
+    Args:
+        query: Base MongoDB filter
+        sort: Sort the cursor was produced with
+        cursor: Cursor from a previous page (may be None)
+
+    Returns:
+        MongoDB filter document
+    """
+    after = decode_cursor(cursor, len(sort))
+    if after is None:
+        return query
+
+    condition = keyset_filter(sort, after)
+    return {"$and": [query, condition]} if query else condition
+
+
+def cursor_for(document: Dict[str, Any], sort: Sort) -> str:
+    """Build the cursor that continues after the given document."""
+    return encode_cursor([document.get(field) for field, _ in sort])
+
+
+def parse_fields(fields: Optional[str]) -> Optional[Dict[str, int]]:
+    """
+    Turn a comma separated fields= parameter into a MongoDB projection.
+
+    product_type is always included so documents can still be dumped through
+    the matching model, and the id is always returned.
+
+    Args:
+        fields: Comma separated list of product fields (e.g. "name,price,images")
+
+    Returns:
+        Projection document, or None to return all fields
+
+    Raises:
+        HTTPException: 400 if an unknown field is requested
+    """
+    if not fields:
+        return None
+
+    requested = {field.strip() for field in fields.split(",") if field.strip()}
+    unknown = requested - PRODUCT_FIELDS
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown product fields: {', '.join(sorted(unknown))}"
+        )
+
+    requested.discard("id")
+    requested.add("product_type")
+
+    return {field: 1 for field in requested}
+
+
+async def stream_ndjson(documents: AsyncIterable[Dict[str, Any]], render: Callable[[Dict[str, Any]], bytes]) -> AsyncIterator[bytes]:
+    """
+    Write documents as newline delimited JSON while the cursor yields them.
+
+    Args:
+        documents: Async iterable of documents (typically a live pymongo cursor)
+        render: Function turning a document into one encoded NDJSON line
+
+    Yields:
+        One encoded JSON line per document
+    """
+    async for document in documents:
+        yield render(document)
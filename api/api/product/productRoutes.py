@@ -1,24 +1,220 @@
 from bson import ObjectId
-from fastapi import status, Depends, File, UploadFile, HTTPException, Form
+from fastapi import status, Depends, File, UploadFile, HTTPException, Form, Query, Request
 from typing import Annotated, List, Optional, Any
 from util.authUtil import get_current_user
 from fastapi import APIRouter
+from fastapi.responses import StreamingResponse
 from config.db import db, fs
 from api.users.userModels import UserModel
-from api.product.productModel import productModel, NutritionInfo, Product, FoodProduct, BookProduct
+from api.product.productModel import productModel, NutritionInfo, Product, FoodProduct, BookProduct, UpcBatchRequest
+from api.product.productSearch import search_products
+from api.product.produceSnapshot import PRODUCE_QUERY, is_produce, produce_snapshot
+from api.product.productETag import cache_headers, catalog_etag, is_not_modified, not_modified
+from api.product.productPaging import cursor_for, paged_filter, parse_fields, stream_ndjson
+from api.product.productSerializer import (
+    ProductJSONResponse, dump_product, render_batch_item, render_changes, render_product, render_products, render_search_page,
+    render_ndjson_line
+)
+from api.product.productAutocomplete import autocomplete_index
+from api.product.productFacets import facet_cache_stats, product_facets
+from api.product.productBundle import plan_bundle, stream_bundle
+from api.product.productSync import changes_since, encode_sync_token, record_delete, record_reset, sync_stamp
+from pymongo import ASCENDING, DESCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+import asyncio
 import hashlib
-from typing import Dict, Union
+from typing import Dict, Tuple
 import json
 import logging
 from util.OpenFoodFactsUtil import openfoodfacts_lookup
 from util.BookLookupUtil import lookup_book_by_isbn
-import requests
-from datetime import datetime
+import os
+from datetime import datetime, timedelta
+from util.lruCache import LruTtlCache
+from util.lookupMissCache import lookup_miss_cache
+from util.amazonResultCache import amazon_result_cache
+from util.lookupErrors import ProviderUnavailableError
+from util.singleFlight import lookup_flights, lookup_lease
+from util.catalogVersion import catalog_version
+from util.backgroundWorker import BackgroundWorker
+from util.changeWatcher import change_watcher
+from util.eventBus import event_bus
+from util.compression import negotiate_encoding
+from util.httpClient import http_client
+from util.browserPool import browser_pool
+from util.providerRegistry import provider_registry
 
 logger = logging.getLogger(__name__)
 
 productRoutes = APIRouter()
 
+# Rendered product bytes by UPC for the barcode scan endpoint. Every write
+# path below invalidates the affected UPCs.
+_upc_cache = LruTtlCache(
+    max_size=int(os.environ.get('UPC_CACHE_SIZE', '10000')),
+    ttl=float(os.environ.get('UPC_CACHE_TTL', '300'))
+)
+# Moved by every invalidation, so a render read before a write is not cached after it
+_upc_generation = 0
+
+# Sync sequence numbers of the product changes pushed to event stream
+# subscribers. The replica that writes a product pushes it right away and
+# its change watcher reports the same change again later.
+_pushed_changes = LruTtlCache(
+    max_size=int(os.environ.get('PUSHED_CHANGES_SIZE', '10000')),
+    ttl=float(os.environ.get('PUSHED_CHANGES_TTL', '600'))
+)
+
+# External lookups a single batch request runs at the same time
+BATCH_LOOKUP_CONCURRENCY = int(os.environ.get('BATCH_LOOKUP_CONCURRENCY', '4'))
+
+# 'inline' looks up the store price and image before answering a food scan,
+# 'background' answers with the Open Food Facts data and enriches it later
+FOOD_ENRICHMENT_MODE = os.environ.get('FOOD_ENRICHMENT_MODE', 'inline')
+
+# Seconds after which an enrichment claimed by a replica that died is retried
+ENRICHMENT_CLAIM_TIMEOUT = float(os.environ.get('ENRICHMENT_CLAIM_TIMEOUT', '300'))
+
+enrichment_worker = BackgroundWorker(
+    'enrichment',
+    concurrency=int(os.environ.get('ENRICHMENT_CONCURRENCY', '2'))
+)
+
+
+async def _products_written(*products: Optional[Dict[str, Any]], tombstone: Optional[Dict[str, Any]] = None):
+    """
+    Record a write to the products collection: drop the cached renders of
+    the affected UPCs and move the catalog version, which changes the ETag
+    of every catalog response. Writes touching produce also move the
+    produce version so the produce snapshot is rebuilt. The change is
+    pushed to the event stream subscribers of this replica, the other
+    replicas push it when their change watcher reports it.
+
+    Args:
+        products: Product documents as they were before and after the write
+        tombstone: Tombstone left by a delete, pushed instead of the last document
+    """
+    _invalidate_upcs([product['upc'] for product in products if product and product.get('upc')])
+
+    if any(is_produce(product) for product in products):
+        await catalog_version.bump('products', 'produce')
+    else:
+        await catalog_version.bump('products')
+
+    if tombstone is not None:
+        _push_delete(tombstone)
+    elif products and products[-1] is not None:
+        _push_upsert(products[-1])
+
+
+def _invalidate_upcs(upcs: Optional[List[str]] = None):
+    """Drop the cached renders of some UPCs, or of all of them when upcs is None."""
+    global _upc_generation
+    _upc_generation += 1
+    if upcs is None:
+        _upc_cache.clear()
+    else:
+        for upc in upcs:
+            _upc_cache.invalidate(upc)
+
+
+async def _product_changed(event: Dict[str, Any]):
+    """
+    Drop the cached render of a product written through any replica and
+    update the autocomplete index. Deletes, UPC changes and resets do not
+    say which cached UPC is affected, so they clear the whole cache.
+    Polled changes do not say which fields changed, the UPC the product was
+    indexed with is dropped along with its current one.
+    """
+    document = event.get('document')
+    updated_fields = event.get('updated_fields')
+    if document is None or not document.get('upc'):
+        _invalidate_upcs()
+    elif updated_fields is None:
+        previous = autocomplete_index.indexed_upc(str(document['_id']))
+        _invalidate_upcs([document['upc']] + ([previous] if previous else []))
+    elif 'upc' in updated_fields:
+        _invalidate_upcs()
+    else:
+        _invalidate_upcs([document['upc']])
+
+    if document is not None:
+        autocomplete_index.upsert(document)
+    elif event['operation'] == 'delete':
+        autocomplete_index.remove(str(event['id']))
+    elif event['operation'] == 'reset':
+        autocomplete_index.schedule_rebuild()
+
+    # Deletes are pushed from their tombstone, which still knows the UPC
+    if event['operation'] == 'reset':
+        event_bus.publish(['products'], 'products.reset', {})
+    elif document is not None:
+        _push_upsert(document)
+
+
+async def _product_deleted(event: Dict[str, Any]):
+    """
+    Drop a deleted product from the caches and push the delete to the event
+    stream subscribers. When polling, the tombstone is the only sign of a delete.
+    """
+    tombstone = event.get('document')
+    if tombstone is not None and event['operation'] in ('insert', 'replace', 'update'):
+        if tombstone.get('upc'):
+            _invalidate_upcs([tombstone['upc']])
+        autocomplete_index.remove(str(tombstone['_id']))
+        _push_delete(tombstone)
+
+
+def _push_upsert(document: Dict[str, Any]):
+    """Push a written product to the event stream subscribers, once per change."""
+    if _first_push(document):
+        event_bus.publish(
+            ['products', f"product:{document.get('upc')}"],
+            'product.upsert',
+            lambda: render_product(document),
+            id=_sync_event_id(document)
+        )
+
+
+def _push_delete(tombstone: Dict[str, Any]):
+    """Push a product delete to the event stream subscribers, once per change."""
+    if _first_push(tombstone):
+        event_bus.publish(
+            ['products', f"product:{tombstone.get('upc')}"],
+            'product.delete',
+            {"id": str(tombstone['_id']), "upc": tombstone.get('upc')},
+            id=_sync_event_id(tombstone)
+        )
+
+
+def _first_push(document: Dict[str, Any]) -> bool:
+    """Whether a change has not been pushed yet, judged by its sync sequence number."""
+    seq = document.get('sync_seq')
+    if seq is None:
+        return True
+    if _pushed_changes.get(seq) is not None:
+        return False
+    _pushed_changes.set(seq, True)
+    return True
+
+
+def _sync_event_id(document: Dict[str, Any]) -> Optional[str]:
+    """Delta sync token of a change, so a client can catch up from the last event it saw."""
+    if document.get('sync_seq') is None:
+        return None
+    return encode_sync_token(document['sync_seq'], datetime.utcnow())
+
+
+# When polling, writes are read by their sync sequence number and only
+# deleting every product (which leaves no tombstones) resets the caches
+change_watcher.subscribe(
+    'products',
+    _product_changed,
+    fingerprint=lambda: db.catalog_state.find_one({"_id": "sync_reset"}),
+    sequence_field='sync_seq'
+)
+change_watcher.subscribe('product_tombstones', _product_deleted, sequence_field='sync_seq')
+
 
 async def _download_and_store_image(image_url: str, filename: str, owner_id: Optional[str] = None) -> Optional[str]:
     """
@@ -34,7 +230,7 @@ async def _download_and_store_image(image_url: str, filename: str, owner_id: Opt
     """
     try:
         logger.info(f"Downloading image from: {image_url}")
-        response = requests.get(image_url, timeout=10)
+        response = await http_client.get(image_url)
 
         if response.status_code != 200:
             logger.error(f"Failed to download image: HTTP {response.status_code}")
@@ -46,14 +242,14 @@ async def _download_and_store_image(image_url: str, filename: str, owner_id: Opt
         md5_hash = hashlib.md5(image_data).hexdigest()
 
         # Check if file already exists
-        existing = db.files.find_one({"md5": md5_hash})
+        existing = await db.files.find_one({"md5": md5_hash})
 
         if existing is not None:
             logger.info(f"Image already exists with MD5: {md5_hash}")
             return str(existing['_id'])
 
         # Store in GridFS
-        gridfs_file_id = fs.put(
+        gridfs_file_id = await fs.put(
             image_data,
             filename=filename,
             owner=owner_id or 'system',
@@ -68,8 +264,7 @@ async def _download_and_store_image(image_url: str, filename: str, owner_id: Opt
             "references": []
         }
 
-        inserted = db.files.insert_one(new_fs_file)
-        file_id = str(inserted.inserted_id)
+        file_id = str(await _insert_fs_file(new_fs_file))
 
         logger.info(f"Image stored in GridFS with ID: {file_id}")
         return file_id
@@ -79,6 +274,45 @@ async def _download_and_store_image(image_url: str, filename: str, owner_id: Opt
         return None
 
 
+async def _insert_fs_file(fs_file: Dict[str, Any]) -> ObjectId:
+    """
+    Insert a file metadata entry for a file just stored in GridFS.
+
+    If a concurrent request stored the same image first, the unique md5
+    index rejects the insert. The duplicate GridFS file is then removed and
+    the existing entry is used.
+
+    Returns:
+        ID of the file metadata entry
+    """
+    try:
+        return (await db.files.insert_one(fs_file)).inserted_id
+    except DuplicateKeyError:
+        await fs.delete(ObjectId(fs_file['fileId']))
+        return (await db.files.find_one({"md5": fs_file['md5']}))['_id']
+
+
+async def _store_product_image(candidates: List[Tuple[Optional[str], str]], name: str) -> Tuple[List[str], Optional[str]]:
+    """
+    Download and store the first usable image out of a list of candidates.
+
+    Args:
+        candidates: (image URL, source) pairs in order of preference, URLs may be None
+        name: Product name the file is named after
+
+    Returns:
+        List with the stored file ID (empty if no image could be stored) and its source
+    """
+    for image_url, source in candidates:
+        if not image_url:
+            continue
+        image_id = await _download_and_store_image(image_url, f"{name}.jpg")
+        if image_id:
+            logger.info(f"Downloaded image from {source}")
+            return [image_id], source
+    return [], None
+
+
 def calculate_md5(file):
     """Calculates the MD5 hash of the uploaded file."""
     md5_hash = hashlib.md5()
@@ -88,14 +322,14 @@ def calculate_md5(file):
     return md5_hash.hexdigest()
 
 
-def add_fsFile_reference(fsFileId: str, refId: str):
+async def add_fsFile_reference(fsFileId: str, refId: str):
     """Adds a reference to the fsFileModel."""
-    file = db.files.find_one({"_id": ObjectId(fsFileId)})
+    file = await db.files.find_one({"_id": ObjectId(fsFileId)})
     if file is not None:
         references = file.get("references", [])
         if refId not in references:
             references.append(refId)
-            db.files.update_one({"_id": ObjectId(fsFileId)}, {"$set": {"references": references}})
+            await db.files.update_one({"_id": ObjectId(fsFileId)}, {"$set": {"references": references}})
 
 
 @productRoutes.post("")
@@ -123,14 +357,14 @@ async def create_product(
             md5 = calculate_md5(image_file.file)
 
             # Check if file already exists
-            existing = db.files.find_one({"md5": md5})
+            existing = await db.files.find_one({"md5": md5})
 
             if existing is not None:
                 # File already exists, use existing file ID
                 file_id = existing['_id']
             else:
                 # Upload new file to GridFS
-                gridfs_file_id = fs.put(
+                gridfs_file_id = await fs.put(
                     image_file.file.read(),
                     filename=image_file.filename,
                     owner=current_user.id,
@@ -145,8 +379,7 @@ async def create_product(
                     "references": []
                 }
 
-                inserted = db.files.insert_one(new_fs_file)
-                file_id = inserted.inserted_id
+                file_id = await _insert_fs_file(new_fs_file)
 
             # Add file ID to image_ids list
             image_ids.append(str(file_id))
@@ -176,100 +409,343 @@ async def create_product(
     product_dict = {
         "name": name,
         "description": description,
-        "upc": upc,
+        "upc": _normalize_upc(upc) if upc else upc,
         "price": price,
         "tags": parsed_tags,
         "metadata": parsed_metadata,
         "images": image_ids,
-        "last_modified": datetime.utcnow()
+        "last_modified": datetime.utcnow(),
+        **await sync_stamp()
     }
 
     # Remove None values
     product_dict = {k: v for k, v in product_dict.items() if v is not None}
 
     # Insert product into database
-    result = db.products.insert_one(product_dict)
+    try:
+        result = await db.products.insert_one(product_dict)
+    except DuplicateKeyError:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"A product with UPC {upc} already exists"
+        )
     product_id = str(result.inserted_id)
 
+    await _products_written(product_dict)
+
     # Add product reference to each image file
     for image_id in image_ids:
-        add_fsFile_reference(image_id, product_id)
+        await add_fsFile_reference(image_id, product_id)
 
     # Retrieve and return the created product
-    created_product = db.products.find_one({"_id": result.inserted_id})
+    created_product = await db.products.find_one({"_id": result.inserted_id})
     created_product['id'] = str(created_product.pop('_id'))
 
     return productModel(**created_product).model_dump(exclude_none=True)
 
 
+async def _list_products(
+    request: Request,
+    query: Dict[str, Any],
+    sort: List,
+    limit: Optional[int],
+    cursor: Optional[str],
+    fields: Optional[str],
+    format: str,
+    model=None
+):
+    """
+    Run a keyset paginated, optionally projected product listing.
+
+    When a page is cut short by limit, the cursor for the next page is
+    returned in the X-Next-Cursor header. In ndjson mode documents are
+    encoded and written as the cursor yields them. Responses carry an ETag
+    and a request with a matching If-None-Match gets 304 Not Modified
+    without querying the products.
+
+    Args:
+        request: Incoming request
+        query: Base MongoDB filter
+        sort: List of (field, direction) pairs, must end with a unique field
+        limit: Maximum number of products to return (None for all)
+        cursor: Cursor from a previous page
+        fields: Comma separated projection
+        format: 'json' or 'ndjson'
+        model: Response model for every document, picked from product_type when None
+    """
+    etag = await catalog_etag(request)
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+
+    projection = parse_fields(fields)
+    page_filter = paged_filter(query, sort, cursor)
+
+    # Sort keys are needed to build the next cursor even if not requested
+    hidden = []
+    if projection is not None:
+        hidden = [field for field, _ in sort if field != '_id' and field not in projection]
+        projection.update({field: 1 for field in hidden})
+
+    def strip_hidden(product):
+        for field in hidden:
+            product.pop(field, None)
+        return product
+
+    headers = cache_headers(etag)
+
+    if format == 'ndjson':
+        if limit is not None:
+            # Peek at the keys around the page boundary to know if there is a next page
+            keys = await (
+                db.products.find(page_filter, {field: 1 for field, _ in sort})
+                .sort(sort).skip(limit - 1).limit(2)
+            ).to_list()
+            if len(keys) == 2:
+                headers['X-Next-Cursor'] = cursor_for(keys[0], sort)
+
+        documents = db.products.find(page_filter, projection).sort(sort)
+        if limit is not None:
+            documents = documents.limit(limit)
+
+        return StreamingResponse(
+            stream_ndjson(documents, lambda product: render_ndjson_line(strip_hidden(product), model)),
+            media_type="application/x-ndjson",
+            headers=headers
+        )
+
+    documents = db.products.find(page_filter, projection).sort(sort)
+    if limit is None:
+        documents = await documents.to_list()
+    else:
+        documents = await documents.limit(limit + 1).to_list()
+        if len(documents) > limit:
+            documents = documents[:limit]
+            headers['X-Next-Cursor'] = cursor_for(documents[-1], sort)
+
+    return ProductJSONResponse(
+        render_products((strip_hidden(product) for product in documents), model),
+        headers=headers
+    )
+
+
 @productRoutes.get("")
-async def get_all_products():
-    """Get all products with appropriate models based on product type. No auth required."""
-    products = []
-
-    for product in db.products.find():
-        product['id'] = str(product.pop('_id'))
-
-        # Return appropriate model based on product_type
-        product_type = product.get('product_type', 'generic')
-        if product_type == 'book':
-            products.append(BookProduct(**product).model_dump(exclude_none=True))
-        elif product_type == 'food':
-            products.append(FoodProduct(**product).model_dump(exclude_none=True))
-        else:
-            products.append(Product(**product).model_dump(exclude_none=True))
+async def get_all_products(
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    format: str = Query("json", pattern="^(json|ndjson)$")
+):
+    """
+    Get all products with appropriate models based on product type. No auth required.
 
-    return products
+    Args:
+        limit: Maximum number of products per page (default: all)
+        cursor: X-Next-Cursor value from a previous page
+        fields: Comma separated list of fields to return (e.g. "name,price,images")
+        format: 'json' for a JSON array or 'ndjson' to stream one product per line
+    """
+    return await _list_products(request, {}, [("_id", ASCENDING)], limit, cursor, fields, format)
 
 
 @productRoutes.get("/recent")
-async def get_recent_products(limit: int = 100):
+async def get_recent_products(
+    request: Request,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    format: str = Query("json", pattern="^(json|ndjson)$")
+):
     """
     Get recently added/modified products sorted by last_modified timestamp.
     No auth required.
 
     Args:
         limit: Maximum number of products to return (default: 100)
+        cursor: X-Next-Cursor value from a previous page
+        fields: Comma separated list of fields to return
+        format: 'json' for a JSON array or 'ndjson' to stream one product per line
     """
-    products = []
-
-    # Find products sorted by last_modified (newest first)
     # Filter to only include products that have last_modified field
-    for product in db.products.find({"last_modified": {"$exists": True}}).sort("last_modified", -1).limit(limit):
-        product['id'] = str(product.pop('_id'))
-
-        # Return appropriate model based on product_type
-        product_type = product.get('product_type', 'generic')
-        if product_type == 'book':
-            products.append(BookProduct(**product).model_dump(exclude_none=True))
-        elif product_type == 'food':
-            products.append(FoodProduct(**product).model_dump(exclude_none=True))
-        else:
-            products.append(Product(**product).model_dump(exclude_none=True))
+    query = {"last_modified": {"$exists": True}}
+    sort = [("last_modified", DESCENDING), ("_id", DESCENDING)]
+
+    return await _list_products(request, query, sort, limit, cursor, fields, format)
+
+
+@productRoutes.get("/changes")
+async def get_product_changes(
+    since: Optional[str] = None,
+    limit: int = Query(1000, ge=1, le=5000)
+):
+    """
+    Get the products created, updated or deleted since a sync token, for
+    terminals keeping a local copy of the catalog. No auth required.
+
+    Without a token every product is returned (page through it with
+    has_more). Apply the changes in order: "upsert" items carry the full
+    product, "delete" items its id and UPC. Then sync from "next". Changes
+    are held back for a couple of seconds after they are written, so a
+    write shows up on the sync after that.
+
+    Args:
+        since: "next" token of the previous sync
+        limit: Maximum number of changes to return
+
+    Returns:
+        {"changes": [...], "next": token, "has_more": bool}. 410 Gone when the
+        token is too old to be answered with changes, the terminal then syncs
+        again without a token.
+    """
+    changes, next_token, has_more = await changes_since(since, limit)
+    return ProductJSONResponse(render_changes(changes, next_token, has_more))
+
+
+@productRoutes.get("/autocomplete")
+async def autocomplete_products(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(10, ge=1, le=50),
+    product_type: Optional[str] = None
+):
+    """
+    Suggest products while a name or brand is being typed. Tolerates
+    partial words ("banan") and typos ("honycrisp"). No auth required.
+
+    Args:
+        q: Text typed so far
+        limit: Maximum number of suggestions
+        product_type: Only suggest products of this type
+
+    Returns:
+        Suggestions with id, name, brand, upc, product_type and score, best first
+    """
+    return await autocomplete_index.search(q, limit, product_type)
+
+
+@productRoutes.get("/facets")
+async def get_product_facets(
+    request: Request,
+    product_type: Optional[str] = None,
+    brand: Optional[str] = None,
+    tag: Optional[str] = None,
+    category: Optional[str] = None
+):
+    """
+    Get product counts by product type, brand, tag, category and price band
+    for browse filters. Counts are cached until the next product write.
+    No auth required.
+
+    Args:
+        product_type: Only count products of this type
+        brand: Only count products of this brand
+        tag: Only count products with this tag
+        category: Only count products in this category
+
+    Returns:
+        {"version", "total", "facets": {"product_type": [{"value", "count"}, ...], "brand", "tags",
+        "category", "price"}}, most frequent values first. Price bands are in
+        ascending order and carry their "min" and "max".
+    """
+    etag = await catalog_etag(request)
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+
+    facets = await product_facets(product_type, brand, tag, category)
+    return ProductJSONResponse(facets, headers=cache_headers(etag))
 
-    return products
+
+@productRoutes.get("/bundle")
+async def get_catalog_bundle(since: Optional[str] = None):
+    """
+    Download the catalog as a tar.gz bundle for kiosks: products as NDJSON,
+    their images and a manifest.json index. No auth required.
+
+    The bundle version is returned in the X-Bundle-Version header and in
+    the manifest. Pass it as since to get a diff bundle with only the
+    products changed after it and the ids of deleted ones. The version is
+    also a delta sync token for GET /products/changes.
+
+    Args:
+        since: Version of a previous bundle
+    """
+    plan = await plan_bundle(since)
+    kind = "diff" if since else "full"
+    return StreamingResponse(
+        stream_bundle(plan),
+        media_type="application/gzip",
+        headers={
+            "X-Bundle-Version": plan["version"],
+            "Content-Disposition": f"attachment; filename=catalog-{plan['end']}-{kind}.tar.gz",
+        }
+    )
 
 
 @productRoutes.get("/produce")
-async def get_produce_items():
-    """Get all produce items (Fresh Produce brand or Fruits/Vegetables/Herbs category). No auth required."""
-    products = []
-
-    # Query for products with brand "Fresh Produce" OR category in Fruits/Vegetables/Herbs
-    query = {
-        "$or": [
-            {"brand": "Fresh Produce"},
-            {"category": {"$in": ["Fruits", "Vegetables", "Herbs"]}}
-        ]
-    }
+async def get_produce_items(
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    format: str = Query("json", pattern="^(json|ndjson)$")
+):
+    """
+    Get all produce items (Fresh Produce brand or Fruits/Vegetables/Herbs category). No auth required.
 
-    for product in db.products.find(query):
-        product['id'] = str(product.pop('_id'))
+    The full list is served from an in-memory snapshot that is only rebuilt
+    when produce changes, precompressed in every encoding the API offers.
 
-        # All produce items should be food type
-        products.append(FoodProduct(**product).model_dump(exclude_none=True))
+    Args:
+        limit: Maximum number of products per page (default: all)
+        cursor: X-Next-Cursor value from a previous page
+        fields: Comma separated list of fields to return
+        format: 'json' for a JSON array or 'ndjson' to stream one product per line
+    """
+    if limit is None and cursor is None and fields is None and format == 'json':
+        etag = await catalog_etag(request, 'produce')
+        if is_not_modified(request, etag):
+            return not_modified(etag)
+
+        snapshot = await produce_snapshot.current()
+        headers = cache_headers(etag)
+        headers['Vary'] = 'Accept-Encoding'
+        headers['X-Produce-Version'] = str(snapshot.version)
+
+        encoding = negotiate_encoding(request.headers.get('accept-encoding'))
+        if encoding in snapshot.encoded:
+            headers['Content-Encoding'] = encoding
+            return ProductJSONResponse(snapshot.encoded[encoding], headers=headers)
+        return ProductJSONResponse(snapshot.body, headers=headers)
+
+    # All produce items should be food type
+    return await _list_products(request, PRODUCE_QUERY, [("_id", ASCENDING)], limit, cursor, fields, format, model=FoodProduct)
+
+
+@productRoutes.get("/search")
+async def search_product_catalog(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None
+):
+    """
+    Search products by name, brand, UPC and tags using the product text index.
+    Partial and misspelled words ("bana") are matched through the autocomplete
+    index, ranked below whole word matches.
+    Results are ranked by relevance and paginated with an opaque cursor.
+    Only list fields are returned. No auth required.
 
-    return products
+    Args:
+        q: Search terms
+        limit: Maximum number of products to return (default: 20, max: 100)
+        cursor: next_cursor value from a previous page
+    """
+    etag = await catalog_etag(request)
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+
+    products, next_cursor = await search_products(q, limit, cursor)
+
+    return ProductJSONResponse(render_search_page(products, next_cursor), headers=cache_headers(etag))
 
 
 def _detect_product_type(upc: str) -> str:
@@ -299,7 +775,7 @@ def _detect_product_type(upc: str) -> str:
 
 
 @productRoutes.get("/upc/{upc}")
-async def get_product_by_upc( upc: str, cache: bool = True, product_type: Optional[str] = None):
+async def get_product_by_upc(request: Request, upc: str, cache: bool = True, product_type: Optional[str] = None):
     """
     Get a single product by UPC or ISBN.
     First checks the database. If not found, automatically detects whether
@@ -313,55 +789,233 @@ async def get_product_by_upc( upc: str, cache: bool = True, product_type: Option
                If False, always performs fresh lookup and doesn't save to database.
         product_type: Optional override to force 'book' or 'food' lookup.
                      If not provided, will auto-detect based on UPC format.
+
+    Products served from the database carry an ETag, a request with a
+    matching If-None-Match gets 304 Not Modified.
     """
+    # Spellings of one barcode ("012345-67890", "01234567890") share the
+    # cache entry, the stored product and the lookup
+    scanned, upc = upc, _normalize_upc(upc)
+
     # Check if product exists in database (unless cache is disabled)
     if cache:
-        product = db.products.find_one({"upc": upc})
+        etag = await catalog_etag(request)
+        if is_not_modified(request, etag):
+            return not_modified(etag)
+
+        cached = _upc_cache.get(upc)
+        if cached is not None:
+            return ProductJSONResponse(cached, headers=cache_headers(etag))
+
+        generation = _upc_generation
+        # Products stored before UPCs were normalized keep the scanned spelling
+        product = await db.products.find_one({"upc": {"$in": list(dict.fromkeys([upc, scanned]))}})
 
         if product is not None:
             logger.info(f"Product found in database for UPC: {upc}")
-            product['id'] = str(product.pop('_id'))
 
-            # Return appropriate model based on product_type
-            detected_type = product.get('product_type', 'food')
-            if detected_type == 'book':
-                return BookProduct(**product).model_dump(exclude_none=True)
+            # Return appropriate model based on product_type, products without one are food
+            model = BookProduct if product.get('product_type', 'food') == 'book' else FoodProduct
+            body = render_product(product, model)
+            # Not cached if a product was written while it was read
+            if generation == _upc_generation:
+                _upc_cache.set(upc, body)
+            return ProductJSONResponse(body, headers=cache_headers(etag))
+
+    return await _lookup_product(upc, product_type, cache)
+
+
+@productRoutes.post("/upc/batch")
+async def get_products_by_upc_batch(
+    batch: UpcBatchRequest,
+    format: str = Query("json", pattern="^(json|ndjson)$")
+):
+    """
+    Resolve many UPCs or ISBNs in one request, e.g. when receiving a pallet
+    or restoring a saved cart.
+
+    Products already in the database are fetched with a single query. The
+    remaining codes are looked up with the external providers, at most
+    BATCH_LOOKUP_CONCURRENCY at a time. Every result has the UPC, the status
+    the single UPC endpoint would have returned and either the product or an
+    error detail.
+
+    No authentication required - this endpoint is publicly accessible.
+
+    Args:
+        batch: UPCs to resolve, cache flag and optional product type override
+        format: 'json' for an array in input order, 'ndjson' to stream each result as it resolves
+    """
+    upcs = list(dict.fromkeys(_normalize_upc(upc) for upc in batch.upcs))
+    results: Dict[str, bytes] = {}
+
+    if batch.cache:
+        missing = []
+        for upc in upcs:
+            cached = _upc_cache.get(upc)
+            if cached is not None:
+                results[upc] = render_batch_item(upc, status.HTTP_200_OK, cached)
             else:
-                return FoodProduct(**product).model_dump(exclude_none=True)
+                missing.append(upc)
+
+        if missing:
+            # Products stored before UPCs were normalized keep the scanned spelling
+            spellings = missing + [upc for upc in batch.upcs if upc not in missing and _normalize_upc(upc) in missing]
+            generation = _upc_generation
+            async for product in db.products.find({"upc": {"$in": spellings}}):
+                upc = _normalize_upc(product['upc'])
+                if upc in results:
+                    continue
+                model = BookProduct if product.get('product_type', 'food') == 'book' else FoodProduct
+                body = render_product(product, model)
+                if generation == _upc_generation:
+                    _upc_cache.set(upc, body)
+                results[upc] = render_batch_item(upc, status.HTTP_200_OK, body)
+
+    semaphore = asyncio.Semaphore(BATCH_LOOKUP_CONCURRENCY)
+
+    async def resolve(upc: str):
+        async with semaphore:
+            try:
+                product = await _lookup_product(upc, batch.product_type, batch.cache)
+                return upc, render_batch_item(upc, status.HTTP_200_OK, product)
+            except HTTPException as e:
+                return upc, render_batch_item(upc, e.status_code, detail=e.detail)
+
+    pending = [upc for upc in upcs if upc not in results]
+
+    if format == 'ndjson':
+        async def stream():
+            for line in results.values():
+                yield line + b"\n"
+
+            tasks = [asyncio.ensure_future(resolve(upc)) for upc in pending]
+            try:
+                for task in asyncio.as_completed(tasks):
+                    _, line = await task
+                    yield line + b"\n"
+            finally:
+                # Client went away, stop the lookups that have not started
+                for task in tasks:
+                    task.cancel()
+
+        return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+    results.update(await asyncio.gather(*(resolve(upc) for upc in pending)))
+    return ProductJSONResponse(b"[" + b",".join(results[_normalize_upc(upc)] for upc in batch.upcs) + b"]")
+
 
+async def _lookup_product(upc: str, product_type: Optional[str], cache: bool) -> Dict[str, Any]:
+    """
+    Look up a product that is not in the database with the external providers.
+
+    Args:
+        upc: Universal Product Code or ISBN, normalized with _normalize_upc
+        product_type: 'book' or 'food', detected from the UPC when None
+        cache: Whether to store the result in the database
+
+    Returns:
+        Product data dictionary
+    """
     # Detect product type if not specified
     if product_type is None:
         product_type = _detect_product_type(upc)
         logger.info(f"Auto-detected product type: {product_type}")
 
-    # Route to appropriate lookup service
+    # Concurrent scans of the same barcode share one lookup instead of each
+    # running the full lookup pipeline and inserting a duplicate product
+    key = (upc, product_type, cache)
+    if cache and lookup_lease is not None:
+        return await lookup_flights.do(key, lambda: _leased_lookup(upc, product_type))
+    return await lookup_flights.do(key, lambda: _lookup(upc, product_type, cache))
+
+
+def _normalize_upc(upc: str) -> str:
+    """Strip the dashes and spaces barcodes and ISBNs are often written with."""
+    return upc.replace('-', '').replace(' ', '')
+
+
+async def _lookup(upc: str, product_type: str, cache: bool) -> Dict[str, Any]:
+    """
+    Route a lookup to the service for the product type. The providers it
+    asks share one deadline, LOOKUP_BUDGET seconds from now.
+    """
+    deadline = provider_registry.deadline()
     if product_type == 'book':
         logger.info(f"{'Cache disabled' if not cache else 'Book not in database'}, looking up ISBN {upc}")
-        product_data = await _lookup_book(upc, cache)
-    else:
-        logger.info(f"{'Cache disabled' if not cache else 'Product not in database'}, looking up UPC {upc} using OpenFoodFacts")
-        product_data = await _lookup_food(upc, cache)
+        return await _lookup_book(upc, cache, deadline)
+
+    logger.info(f"{'Cache disabled' if not cache else 'Product not in database'}, looking up UPC {upc} using OpenFoodFacts")
+    return await _lookup_food(upc, cache, deadline)
+
+
+async def _leased_lookup(upc: str, product_type: str, attempts: int = 3) -> Dict[str, Any]:
+    """
+    Look up a product while holding a MongoDB lease on its barcode, so only
+    one replica runs the lookup. The other replicas wait for the lease to be
+    released and then read the product the holder stored.
 
-    return product_data
+    Args:
+        upc: Universal Product Code or ISBN
+        product_type: 'book' or 'food'
+        attempts: Times to wait for another replica before looking up regardless
+
+    Returns:
+        Product data dictionary
+    """
+    name = f"upc:{upc}"
+    model = BookProduct if product_type == 'book' else FoodProduct
+
+    for _ in range(attempts):
+        if await lookup_lease.acquire(name):
+            try:
+                # Another replica may have stored it between our read and the lease
+                product = await db.products.find_one({"upc": upc})
+                if product is not None:
+                    return dump_product(product, model)
+                return await _lookup(upc, product_type, True)
+            finally:
+                await lookup_lease.release(name)
+
+        logger.info(f"Lookup of {upc} is running on another replica, waiting for it")
+        await lookup_lease.wait(name)
+
+        product = await db.products.find_one({"upc": upc})
+        if product is not None:
+            return dump_product(product, model)
+
+    return await _lookup(upc, product_type, True)
 
 
-async def _lookup_food(upc: str, cache: bool) -> Dict[str, Any]:
+async def _lookup_food(upc: str, cache: bool, deadline: Optional[float] = None) -> Dict[str, Any]:
     """
     Look up a food product using OpenFoodFacts.
 
     Args:
         upc: Universal Product Code
         cache: Whether to cache the result in database
+        deadline: Event loop time by which the providers must have answered
 
     Returns:
         Food product data dictionary
     """
     try:
-        # Use async version for better performance in FastAPI
-        # Include store lookups (Amazon) to get pricing and images
-        product_data = await openfoodfacts_lookup.lookup_by_upc_async(upc, include_stores=True)
+        # Known misses answer straight away instead of repeating the external lookups
+        if cache and await lookup_miss_cache.is_miss(upc, 'openfoodfacts'):
+            logger.info(f"UPC {upc} is a known Open Food Facts miss")
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Product not found for UPC: {upc}"
+            )
+
+        # In background mode the store lookups (Amazon) for pricing and images
+        # run after the product is stored, see _enrich_food_product
+        background = cache and FOOD_ENRICHMENT_MODE == 'background'
+        product_data = await openfoodfacts_lookup.lookup_by_upc_async(upc, include_stores=not background, deadline=deadline)
 
         if product_data is None:
+            if cache:
+                await lookup_miss_cache.record(upc, 'openfoodfacts')
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"Product not found for UPC: {upc}"
@@ -374,43 +1028,23 @@ async def _lookup_food(upc: str, cache: bool) -> Dict[str, Any]:
         if product_data.get('price') is None:
             product_data['price'] = 4.04
 
-        # Download and store images - try Amazon first, then OpenFoodFacts
-        image_ids = []
-        image_source = None
-
-        # 1. Try Amazon/store images first
-        try:
-            stores = product_data.get('stores', [])
-            if stores and len(stores) > 0 and stores[0].get('image_url'):
-                logger.info(f"Trying to download image from {stores[0].get('store_name', 'store')}")
-                image_id = await _download_and_store_image(
-                    stores[0]['image_url'],
-                    f"{product_data.get('name', 'product')}.jpg"
-                )
-                if image_id:
-                    image_ids.append(image_id)
-                    image_source = stores[0].get('store_name', 'External Source')
-                    logger.info(f"Downloaded image from {image_source}")
-        except Exception as e:
-            logger.error(f"Error downloading store image: {str(e)}")
-
-        # 2. Fallback to OpenFoodFacts image if Amazon fails
-        if not image_ids and product_data.get('image_url'):
-            try:
-                logger.info("Using OpenFoodFacts image as fallback")
-                image_id = await _download_and_store_image(
-                    product_data['image_url'],
-                    f"{product_data.get('name', 'product')}.jpg"
-                )
-                if image_id:
-                    image_ids.append(image_id)
-                    image_source = 'OpenFoodFacts'
-                    logger.info(f"Downloaded image from OpenFoodFacts")
-            except Exception as e:
-                logger.error(f"Error downloading OpenFoodFacts image: {str(e)}")
+        if background:
+            # The image_url is kept for the enrichment to fall back on
+            product_data['enrichment'] = 'pending'
+            image_ids, image_source = [], None
+        else:
+            # Download and store images - try Amazon/store images first, then OpenFoodFacts
+            stores = product_data.get('stores') or [{}]
+            image_ids, image_source = await _store_product_image(
+                [
+                    (stores[0].get('image_url'), stores[0].get('store_name', 'External Source')),
+                    (product_data.get('image_url'), 'OpenFoodFacts'),
+                ],
+                product_data.get('name', 'product')
+            )
 
-        # Remove the image_url from product_data as we now have GridFS IDs
-        product_data.pop('image_url', None)
+            # Remove the image_url from product_data as we now have GridFS IDs
+            product_data.pop('image_url', None)
 
         # Add image IDs and source to product data
         if image_ids:
@@ -422,30 +1056,44 @@ async def _lookup_food(upc: str, cache: bool) -> Dict[str, Any]:
         if cache:
             # Add last_modified timestamp
             product_data['last_modified'] = datetime.utcnow()
+            product_data.update(await sync_stamp())
 
-            # Insert into database
-            result = db.products.insert_one(product_data)
+            # Insert into database, unless the product was stored meanwhile
+            try:
+                result = await db.products.insert_one(product_data)
+            except DuplicateKeyError:
+                logger.info(f"Product for UPC {upc} was stored by a concurrent lookup")
+                return dump_product(await db.products.find_one({"upc": upc}), FoodProduct)
             product_id = str(result.inserted_id)
+            await _products_written(product_data)
 
             # Add product reference to each image file
             for image_id in image_ids:
-                add_fsFile_reference(image_id, product_id)
+                await add_fsFile_reference(image_id, product_id)
+
+            if background:
+                enrichment_worker.submit(_enrich_food_product, result.inserted_id)
 
             logger.info(f"Food product saved to database with ID: {product_id}")
 
             # Retrieve and return the created product
-            created_product = db.products.find_one({"_id": result.inserted_id})
-            created_product['id'] = str(created_product.pop('_id'))
+            created_product = await db.products.find_one({"_id": result.inserted_id})
 
-            return FoodProduct(**created_product).model_dump(exclude_none=True)
+            return dump_product(created_product, FoodProduct)
         else:
             # Return product without saving to database
             logger.info(f"Cache disabled, returning product without saving to database")
             product_data['id'] = None  # No database ID since it wasn't saved
-            return FoodProduct(**product_data).model_dump(exclude_none=True)
+            return dump_product(product_data, FoodProduct)
 
     except HTTPException:
         raise
+    except ProviderUnavailableError as e:
+        logger.error(f"Lookup provider unavailable for UPC {upc}: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Product lookup unavailable: {str(e)}"
+        )
     except Exception as e:
         logger.error(f"Error looking up food product by UPC {upc}: {str(e)}")
         raise HTTPException(
@@ -454,21 +1102,100 @@ async def _lookup_food(upc: str, cache: bool) -> Dict[str, Any]:
         )
 
 
-async def _lookup_book(isbn: str, cache: bool) -> Dict[str, Any]:
+async def _enrich_food_product(product_id: ObjectId):
+    """
+    Fill in the store price and image of a product stored with enrichment
+    'pending', then record the write like any other product update so
+    clients holding the pending version see it change.
+
+    The product is claimed first, so when several replicas resume the same
+    pending products only one of them enriches each.
+
+    Args:
+        product_id: ID of the product to enrich
+    """
+    now = datetime.utcnow()
+    product = await db.products.find_one_and_update(
+        {
+            "_id": product_id,
+            "enrichment": "pending",
+            "$or": [
+                {"enrichment_claimed_at": {"$exists": False}},
+                {"enrichment_claimed_at": {"$lt": now - timedelta(seconds=ENRICHMENT_CLAIM_TIMEOUT)}},
+            ],
+        },
+        {"$set": {"enrichment_claimed_at": now}}
+    )
+    if product is None:
+        return
+
+    update = {}
+    try:
+        store_result = await openfoodfacts_lookup.search_stores_async(product)
+        if store_result.price is not None:
+            update['price'] = store_result.price
+
+        image_ids, image_source = await _store_product_image(
+            [(store_result.image_url, 'Amazon'), (product.get('image_url'), 'OpenFoodFacts')],
+            product.get('name', 'product')
+        )
+        if image_ids:
+            update['images'] = image_ids
+            update['image_source'] = image_source
+        update['enrichment'] = 'complete'
+    except Exception as e:
+        logger.error(f"Error enriching product {product_id}: {str(e)}")
+        update['enrichment'] = 'failed'
+
+    update['last_modified'] = datetime.utcnow()
+    update.update(await sync_stamp())
+    updated = await db.products.find_one_and_update(
+        {"_id": product_id},
+        {"$set": update, "$unset": {"image_url": "", "enrichment_claimed_at": ""}},
+        return_document=ReturnDocument.AFTER
+    )
+    if updated is None:
+        # Deleted while it was being enriched
+        return
+
+    for image_id in update.get('images', []):
+        await add_fsFile_reference(image_id, str(product_id))
+    await _products_written(product, updated)
+    logger.info(f"Enrichment of product {product_id} {update['enrichment']}")
+
+
+async def resume_enrichment():
+    """Queue the products still waiting for enrichment, e.g. after a restart."""
+    async for product in db.products.find({"enrichment": "pending"}, {"_id": 1}):
+        enrichment_worker.submit(_enrich_food_product, product['_id'])
+
+
+async def _lookup_book(isbn: str, cache: bool, deadline: Optional[float] = None) -> Dict[str, Any]:
     """
     Look up a book using Open Library and Google Books APIs.
 
     Args:
         isbn: ISBN-10 or ISBN-13 number
         cache: Whether to cache the result in database
+        deadline: Event loop time by which the providers must have answered
 
     Returns:
         Book product data dictionary
     """
     try:
-        book_data = lookup_book_by_isbn(isbn)
+        # Known misses answer straight away instead of repeating the external lookups
+        if cache and await lookup_miss_cache.is_miss(isbn, 'books'):
+            logger.info(f"ISBN {isbn} is a known book lookup miss")
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Book not found for ISBN: {isbn}"
+            )
+
+        book_data = await lookup_book_by_isbn(isbn, deadline)
 
         if book_data is None:
+            if cache:
+                await lookup_miss_cache.record(isbn, 'books')
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"Book not found for ISBN: {isbn}"
@@ -507,30 +1234,41 @@ async def _lookup_book(isbn: str, cache: bool) -> Dict[str, Any]:
         if cache:
             # Add last_modified timestamp
             book_data['last_modified'] = datetime.utcnow()
+            book_data.update(await sync_stamp())
 
-            # Insert into database
-            result = db.products.insert_one(book_data)
+            # Insert into database, unless the book was stored meanwhile
+            try:
+                result = await db.products.insert_one(book_data)
+            except DuplicateKeyError:
+                logger.info(f"Book for ISBN {isbn} was stored by a concurrent lookup")
+                return dump_product(await db.products.find_one({"upc": isbn}), BookProduct)
             product_id = str(result.inserted_id)
+            await _products_written(book_data)
 
             # Add product reference to each image file
             for image_id in image_ids:
-                add_fsFile_reference(image_id, product_id)
+                await add_fsFile_reference(image_id, product_id)
 
             logger.info(f"Book saved to database with ID: {product_id}")
 
             # Retrieve and return the created book
-            created_book = db.products.find_one({"_id": result.inserted_id})
-            created_book['id'] = str(created_book.pop('_id'))
+            created_book = await db.products.find_one({"_id": result.inserted_id})
 
-            return BookProduct(**created_book).model_dump(exclude_none=True)
+            return dump_product(created_book, BookProduct)
         else:
             # Return book without saving to database
             logger.info(f"Cache disabled, returning book without saving to database")
             book_data['id'] = None  # No database ID since it wasn't saved
-            return BookProduct(**book_data).model_dump(exclude_none=True)
+            return dump_product(book_data, BookProduct)
 
     except HTTPException:
         raise
+    except ProviderUnavailableError as e:
+        logger.error(f"Book lookup provider unavailable for ISBN {isbn}: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Book lookup unavailable: {str(e)}"
+        )
     except Exception as e:
         logger.error(f"Error looking up book by ISBN {isbn}: {str(e)}")
         raise HTTPException(
@@ -539,13 +1277,92 @@ async def _lookup_book(isbn: str, cache: bool) -> Dict[str, Any]:
         )
 
 
+@productRoutes.get("/cache/stats")
+async def get_cache_stats(
+    current_user: Annotated[UserModel, Depends(get_current_user('admin'))]
+):
+    """
+    Get hit, miss and eviction counters of the UPC lookup cache and the
+    lookup miss cache, the number of coalesced lookups, the background
+    enrichment queue, the change watcher that invalidates the caches, the
+    outgoing HTTP client, the browser pool used for store searches, the
+    cache of their results and the lookup providers with their circuit breakers.
+    Size and TTL are set with the UPC_CACHE_SIZE and UPC_CACHE_TTL environment variables.
+
+    Requires admin privileges.
+    """
+    return {
+        "upc": _upc_cache.stats(),
+        "lookup_misses": await lookup_miss_cache.stats(),
+        "lookups": lookup_flights.stats(),
+        "produce_snapshot": produce_snapshot.stats(),
+        "enrichment": enrichment_worker.stats(),
+        "change_watcher": change_watcher.stats(),
+        "autocomplete": autocomplete_index.stats(),
+        "facets": facet_cache_stats(),
+        "http": http_client.stats(),
+        "browsers": browser_pool.stats(),
+        "amazon_selectors": openfoodfacts_lookup.amazon_util.selector_stats(),
+        "amazon_results": await amazon_result_cache.stats(),
+        "providers": provider_registry.stats(),
+    }
+
+
+@productRoutes.delete("/lookup-misses")
+async def purge_lookup_misses(
+    current_user: Annotated[UserModel, Depends(get_current_user('admin'))],
+    upc: Optional[str] = None,
+    provider: Optional[str] = None
+):
+    """
+    Purge recorded lookup misses so the next scan queries the external providers again.
+    Misses expire on their own after LOOKUP_MISS_TTL seconds.
+
+    Requires admin privileges.
+
+    Args:
+        upc: Only purge misses for this UPC/ISBN (default: all)
+        provider: Only purge misses for this provider ('openfoodfacts' or 'books')
+    """
+    deleted = await lookup_miss_cache.purge(upc=upc, provider=provider)
+    logger.info(f"Purged {deleted} lookup misses")
+    return {"message": "Lookup misses purged", "deleted": deleted}
+
+
+@productRoutes.delete("/amazon-cache")
+async def purge_amazon_cache(
+    current_user: Annotated[UserModel, Depends(get_current_user('admin'))],
+    query: Optional[str] = None
+):
+    """
+    Purge cached Amazon search results so the next lookup searches Amazon again.
+    Results expire on their own after AMAZON_CACHE_TTL seconds.
+
+    Requires admin privileges.
+
+    Args:
+        query: Only purge the result of this search (brand and name, default: all)
+    """
+    deleted = await amazon_result_cache.purge(query=query)
+    logger.info(f"Purged {deleted} cached Amazon results")
+    return {"message": "Amazon results purged", "deleted": deleted}
+
+
 @productRoutes.get("/{id}")
 async def get_product(
+    request: Request,
     id: str,
     current_user: Annotated[UserModel, Depends(get_current_user('user'))]
 ):
-    """Get a single product by ID. Returns appropriate model based on product type."""
-    product = db.products.find_one({"_id": ObjectId(id)})
+    """
+    Get a single product by ID. Returns appropriate model based on product type.
+    Supports If-None-Match with the returned ETag.
+    """
+    etag = await catalog_etag(request)
+    if is_not_modified(request, etag):
+        return not_modified(etag, public=False)
+
+    product = await db.products.find_one({"_id": ObjectId(id)})
 
     if product is None:
         raise HTTPException(
@@ -553,16 +1370,8 @@ async def get_product(
             detail="Product not found"
         )
 
-    product['id'] = str(product.pop('_id'))
-
     # Return appropriate model based on product_type
-    product_type = product.get('product_type', 'generic')
-    if product_type == 'book':
-        return BookProduct(**product).model_dump(exclude_none=True)
-    elif product_type == 'food':
-        return FoodProduct(**product).model_dump(exclude_none=True)
-    else:
-        return Product(**product).model_dump(exclude_none=True)
+    return ProductJSONResponse(render_product(product), headers=cache_headers(etag, public=False))
 
 
 @productRoutes.put("/{id}")
@@ -573,7 +1382,7 @@ async def update_product(
 ):
     """Update a product and manage image references."""
     # Get existing product
-    existing_product = db.products.find_one({"_id": ObjectId(id)})
+    existing_product = await db.products.find_one({"_id": ObjectId(id)})
 
     if existing_product is None:
         raise HTTPException(
@@ -583,9 +1392,12 @@ async def update_product(
 
     product_dict = product.model_dump(exclude_none=True)
     product_dict.pop('id', None)
+    if product_dict.get('upc'):
+        product_dict['upc'] = _normalize_upc(product_dict['upc'])
 
     # Add last_modified timestamp
     product_dict['last_modified'] = datetime.utcnow()
+    product_dict.update(await sync_stamp())
 
     # Handle image reference updates
     old_images = set(existing_product.get("images", []))
@@ -594,19 +1406,27 @@ async def update_product(
     # Add references for new images
     added_images = new_images - old_images
     for image_id in added_images:
-        add_fsFile_reference(image_id, id)
+        await add_fsFile_reference(image_id, id)
 
     # Remove references for deleted images
     removed_images = old_images - new_images
     for image_id in removed_images:
         from api.files.fsFileRoutes import remove_fsFile_reference
-        remove_fsFile_reference(image_id, id)
+        await remove_fsFile_reference(image_id, id)
 
     # Update product
-    result = db.products.update_one(
-        {"_id": ObjectId(id)},
-        {"$set": product_dict}
-    )
+    try:
+        result = await db.products.update_one(
+            {"_id": ObjectId(id)},
+            {"$set": product_dict}
+        )
+    except DuplicateKeyError:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"A product with UPC {product_dict.get('upc')} already exists"
+        )
+
+    await _products_written(existing_product, {**existing_product, **product_dict})
 
     return {"message": "Product updated"}
 
@@ -617,7 +1437,7 @@ async def delete_product(
     current_user: Annotated[UserModel, Depends(get_current_user('user'))]
 ):
     """Delete a product and remove references from image files."""
-    product = db.products.find_one({"_id": ObjectId(id)})
+    product = await db.products.find_one({"_id": ObjectId(id)})
 
     if product is None:
         raise HTTPException(
@@ -629,10 +1449,13 @@ async def delete_product(
     image_ids = product.get("images", [])
     for image_id in image_ids:
         from api.files.fsFileRoutes import remove_fsFile_reference
-        remove_fsFile_reference(image_id, id)
+        await remove_fsFile_reference(image_id, id)
+
+    # Delete the product, leaving a tombstone for delta sync
+    await db.products.delete_one({"_id": ObjectId(id)})
+    tombstone = await record_delete(product)
 
-    # Delete the product
-    db.products.delete_one({"_id": ObjectId(id)})
+    await _products_written(product, tombstone=tombstone)
 
     return {"message": "Product deleted"}
 
@@ -649,23 +1472,26 @@ async def reset_database(
     """
     try:
         # Count documents before deletion
-        products_count = db.products.count_documents({})
-        files_count = db.files.count_documents({})
+        products_count = await db.products.count_documents({})
+        files_count = await db.files.count_documents({})
 
         # Delete all products
-        db.products.delete_many({})
+        await db.products.delete_many({})
+        await record_reset()
+        _invalidate_upcs()
+        await catalog_version.bump('products', 'produce')
         logger.info(f"Deleted {products_count} products")
 
         # Delete all file metadata
-        db.files.delete_many({})
+        await db.files.delete_many({})
         logger.info(f"Deleted {files_count} file metadata records")
 
         # Delete all files from GridFS
         # Get all file IDs from GridFS and delete them
         gridfs_files = fs.find({})
         gridfs_count = 0
-        for gridfs_file in gridfs_files:
-            fs.delete(gridfs_file._id)
+        async for gridfs_file in gridfs_files:
+            await fs.delete(gridfs_file._id)
             gridfs_count += 1
         logger.info(f"Deleted {gridfs_count} files from GridFS")
 
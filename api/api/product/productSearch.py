@@ -0,0 +1,113 @@
+from typing import Any, Dict, List, Optional, Tuple
+import logging
+import os
+
+from bson import ObjectId
+from fastapi import HTTPException, status
+from pymongo import ASCENDING, DESCENDING, TEXT
+
+from config.db import db
+from api.product.productPaging import cursor_for, decode_cursor, keyset_filter
+from api.product.productAutocomplete import autocomplete_index
+
+logger = logging.getLogger(__name__)
+
+
+SEARCH_INDEX_NAME = "product_search"
+
+# Text index over the fields cashiers search by. Weights rank a name or UPC
+# match above a brand match, and both above a tag match.
+SEARCH_INDEX_KEYS = [("name", TEXT), ("brand", TEXT), ("upc", TEXT), ("tags", TEXT)]
+SEARCH_INDEX_WEIGHTS = {"name": 10, "upc": 10, "brand": 5, "tags": 1}
+
+# Products taken from the autocomplete index for partial and misspelled words
+SEARCH_PREFIX_LIMIT = int(os.environ.get('SEARCH_PREFIX_LIMIT', '200'))
+
+# Best match first, _id breaks ties so pages are stable
+SEARCH_SORT = [("_score", DESCENDING), ("_id", ASCENDING)]
+
+# Fields returned for list/search views. Heavy fields such as nutrition,
+# description and metadata are left out.
+LIST_FIELDS = [
+    "product_type",
+    "name",
+    "brand",
+    "upc",
+    "price",
+    "price_source",
+    "images",
+    "image_source",
+    "last_modified",
+]
+
+
+async def search_products(q: str, limit: int, cursor: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Run a ranked text search over the product catalog.
+
+    The text index only matches whole (stemmed) words, so products the
+    autocomplete index finds for partial or misspelled words ("bana") are
+    matched as well. They score between 0 and 1, below any text match.
+    Results are ordered by score (best first) and then by _id, which gives
+    a stable keyset to page on.
+
+    Args:
+        q: Search terms
+        limit: Maximum number of products to return
+        cursor: Cursor returned with a previous page
+
+    Returns:
+        Tuple of (projected product documents, next cursor or None)
+    """
+    after = decode_cursor(cursor, len(SEARCH_SORT))
+
+    prefix_matches = await autocomplete_index.search(q, SEARCH_PREFIX_LIMIT)
+    prefix_ids = [ObjectId(match["id"]) for match in prefix_matches]
+    prefix_scores = [match["score"] for match in prefix_matches]
+
+    match: Dict[str, Any] = {"$text": {"$search": q}}
+    score: Any = {"$meta": "textScore"}
+    if prefix_ids:
+        # $text may only be combined with indexed clauses, _id is
+        match = {"$or": [match, {"_id": {"$in": prefix_ids}}]}
+        # Products without a text match take their autocomplete score
+        score = {"$cond": [
+            {"$gt": [{"$meta": "textScore"}, 0]},
+            {"$meta": "textScore"},
+            {"$arrayElemAt": [prefix_scores, {"$indexOfArray": [prefix_ids, "$_id"]}]},
+        ]}
+
+    pipeline: List[Dict[str, Any]] = [
+        {"$match": match},
+        {"$addFields": {"_score": score}},
+    ]
+
+    if after is not None:
+        if not isinstance(after[0], (int, float)) or not isinstance(after[1], ObjectId):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid cursor"
+            )
+
+        pipeline.append({"$match": keyset_filter(SEARCH_SORT, after)})
+
+    projection = {field: 1 for field in LIST_FIELDS}
+    projection["_score"] = 1
+
+    pipeline += [
+        {"$sort": dict(SEARCH_SORT)},
+        {"$limit": limit + 1},
+        {"$project": projection},
+    ]
+
+    products = await (await db.products.aggregate(pipeline)).to_list()
+
+    next_cursor = None
+    if len(products) > limit:
+        products = products[:limit]
+        next_cursor = cursor_for(products[-1], SEARCH_SORT)
+
+    for product in products:
+        product.pop("_score", None)
+
+    return products, next_cursor
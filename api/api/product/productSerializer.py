@@ -0,0 +1,384 @@
+"""
+Fast serialization of trusted product documents.
+
+Product documents read from MongoDB are normally run through the Pydantic
+models (``FoodProduct(**doc).model_dump(exclude_none=True)``) and then
+encoded again by FastAPI's ``jsonable_encoder``. For list endpoints that
+work dominates CPU time.
+
+This module compiles a plan per product model once at import time and uses
+it to turn well-formed documents straight into JSON-ready dictionaries and
+response bytes. The output is byte-identical to the model path: the same
+field order, the same int to float coercions, defaults and ``exclude_none``
+behaviour. Any value the plan does not recognise (wrong type, unexpected
+nested object, ...) sends that document through the model path instead, so
+unusual documents still validate, or fail, exactly as before.
+"""
+from datetime import datetime
+import json
+import math
+import typing
+from typing import Any, Dict, Iterable, List, Optional, Type
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+from api.product.productModel import Product, FoodProduct, BookProduct, NutritionInfo
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+
+_MISSING = object()
+
+# Python's json module switches floats to exponent notation outside this
+# range while orjson does not (1e-05 vs 0.00001), so only payloads whose
+# floats all fall inside it are handed to orjson.
+_ORJSON_FLOAT_MIN = 1e-4
+_ORJSON_FLOAT_MAX = 1e16
+
+
+class _Fallback(Exception):
+    """Raised when a value must go through the Pydantic model instead."""
+
+
+class _Dumper:
+    """Converts documents for one payload and tracks whether orjson may encode it."""
+
+    def __init__(self):
+        self.orjson_safe = orjson is not None
+
+    def float_value(self, value):
+        value_type = type(value)
+        if value_type is int:
+            value = float(value)
+        elif value_type is not float:
+            raise _Fallback()
+
+        if not math.isfinite(value):
+            raise _Fallback()
+        if value != 0 and not (_ORJSON_FLOAT_MIN <= abs(value) < _ORJSON_FLOAT_MAX):
+            self.orjson_safe = False
+        return value
+
+    def int_value(self, value):
+        value_type = type(value)
+        if value_type is int:
+            return value
+        if value_type is float and value.is_integer():
+            return int(value)
+        raise _Fallback()
+
+    def str_value(self, value):
+        if type(value) is not str:
+            raise _Fallback()
+        return value
+
+    def str_list_value(self, value):
+        if type(value) is not list:
+            raise _Fallback()
+        for item in value:
+            if type(item) is not str:
+                raise _Fallback()
+        return list(value)
+
+    def datetime_value(self, value):
+        if type(value) is not datetime:
+            raise _Fallback()
+        return value.isoformat()
+
+    def any_value(self, value):
+        """Mirror jsonable_encoder for plain JSON values, fall back on anything else."""
+        value_type = type(value)
+        if value_type is str or value_type is bool or value_type is int or value is None:
+            return value
+        if value_type is float:
+            if not math.isfinite(value):
+                raise _Fallback()
+            if value != 0 and not (_ORJSON_FLOAT_MIN <= abs(value) < _ORJSON_FLOAT_MAX):
+                self.orjson_safe = False
+            return value
+        if value_type is list:
+            return [self.any_value(item) for item in value]
+        if value_type is dict:
+            return self.dict_value(value)
+        if value_type is datetime:
+            return value.isoformat()
+        raise _Fallback()
+
+    def dict_value(self, value):
+        if type(value) is not dict:
+            raise _Fallback()
+        out = {}
+        for key, item in value.items():
+            if type(key) is not str:
+                raise _Fallback()
+            out[key] = self.any_value(item)
+        return out
+
+    def model_value(self, plan, value):
+        if type(value) is not dict:
+            raise _Fallback()
+        return self.apply(plan, value)
+
+    def apply(self, plan, document):
+        out = {}
+        for name, convert, nullable, default in plan:
+            value = document.get(name, _MISSING)
+            if value is _MISSING:
+                value = default
+                if value is None:
+                    continue
+                out[name] = value
+                continue
+            if value is None:
+                if not nullable:
+                    raise _Fallback()
+                continue
+            if convert is _str_value:
+                # Most fields are plain strings, skip the call for them
+                if type(value) is not str:
+                    raise _Fallback()
+                out[name] = value
+                continue
+            out[name] = convert(self, value)
+        return out
+
+
+_str_value = _Dumper.str_value
+
+
+def _literal(expected):
+    def convert(dumper, value):
+        if value != expected or type(value) is not str:
+            raise _Fallback()
+        return value
+    return convert
+
+
+def _nested(plan):
+    def convert(dumper, value):
+        return dumper.model_value(plan, value)
+    return convert
+
+
+def _compile(model: Type[BaseModel]):
+    """
+    Build the conversion plan for a model.
+
+    Returns:
+        List of (field name, converter, nullable, default) tuples in model
+        field order, or None if the model has a field type the plan cannot
+        handle (all documents then use the model path).
+    """
+    plan = []
+    for name, field in model.model_fields.items():
+        annotation = field.annotation
+        nullable = False
+
+        args = typing.get_args(annotation)
+        if typing.get_origin(annotation) is typing.Union and type(None) in args:
+            nullable = True
+            remaining = [arg for arg in args if arg is not type(None)]
+            if len(remaining) != 1:
+                return None
+            annotation = remaining[0]
+
+        origin = typing.get_origin(annotation)
+        args = typing.get_args(annotation)
+
+        if annotation is str:
+            convert = _Dumper.str_value
+        elif annotation is float:
+            convert = _Dumper.float_value
+        elif annotation is int:
+            convert = _Dumper.int_value
+        elif annotation is datetime:
+            convert = _Dumper.datetime_value
+        elif origin is list and args == (str,):
+            convert = _Dumper.str_list_value
+        elif origin is dict and args == (str, Any):
+            convert = _Dumper.dict_value
+        elif origin is typing.Literal and len(args) == 1 and isinstance(args[0], str):
+            convert = _literal(args[0])
+        elif isinstance(annotation, type) and issubclass(annotation, BaseModel):
+            nested = _compile(annotation)
+            if nested is None:
+                return None
+            convert = _nested(nested)
+        else:
+            return None
+
+        default = field.get_default(call_default_factory=True)
+        if isinstance(default, BaseModel):
+            return None
+        plan.append((name, convert, nullable, default))
+
+    return plan
+
+
+_PLANS = {model: _compile(model) for model in (Product, FoodProduct, BookProduct, NutritionInfo)}
+
+
+def model_for(product: Dict[str, Any], default_type: str = 'generic') -> Type[Product]:
+    """
+    Pick the response model for a product document.
+
+    Args:
+        product: Product document
+        default_type: Type assumed when the document has no product_type
+
+    Returns:
+        BookProduct, FoodProduct or Product
+    """
+    product_type = product.get('product_type', default_type)
+    if product_type == 'book':
+        return BookProduct
+    elif product_type == 'food':
+        return FoodProduct
+    return Product
+
+
+def _with_id(product: Dict[str, Any]) -> Dict[str, Any]:
+    if '_id' in product:
+        product = dict(product)
+        product['id'] = str(product.pop('_id'))
+    return product
+
+
+def _dump(dumper: _Dumper, product: Dict[str, Any], model: Type[Product]) -> Dict[str, Any]:
+    product = _with_id(product)
+    plan = _PLANS.get(model)
+
+    if plan is not None:
+        try:
+            return dumper.apply(plan, product)
+        except _Fallback:
+            pass
+
+    # Slow path, identical to the original route code
+    dumper.orjson_safe = False
+    return jsonable_encoder(model(**product).model_dump(exclude_none=True))
+
+
+def dump_product(product: Dict[str, Any], model: Optional[Type[Product]] = None, default_type: str = 'generic') -> Dict[str, Any]:
+    """
+    Convert a product document into its JSON-ready response dictionary.
+
+    Equivalent to ``jsonable_encoder(model(**product).model_dump(exclude_none=True))``
+    with ``_id`` renamed to ``id``.
+
+    Args:
+        product: Product document (with ``_id`` or ``id``)
+        model: Response model, picked from product_type when omitted
+        default_type: Type assumed when picking the model and product_type is missing
+
+    Returns:
+        Dictionary containing only JSON types
+    """
+    return _dump(_Dumper(), product, model or model_for(product, default_type))
+
+
+def _encode(content: Any, orjson_safe: bool) -> bytes:
+    if orjson_safe:
+        try:
+            return orjson.dumps(content)
+        except (TypeError, orjson.JSONEncodeError):
+            pass
+
+    # Same settings as starlette's JSONResponse
+    return json.dumps(
+        content,
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+def render_product(product: Dict[str, Any], model: Optional[Type[Product]] = None, default_type: str = 'generic') -> bytes:
+    """Render a single product document to JSON response bytes."""
+    dumper = _Dumper()
+    content = _dump(dumper, product, model or model_for(product, default_type))
+    return _encode(content, dumper.orjson_safe)
+
+
+def render_products(products: Iterable[Dict[str, Any]], model: Optional[Type[Product]] = None, default_type: str = 'generic') -> bytes:
+    """
+    Render product documents to a JSON array.
+
+    Each document is encoded on its own so one document that needs the
+    standard json encoder does not slow down the whole payload.
+    """
+    return b"[" + b",".join(render_product(product, model, default_type) for product in products) + b"]"
+
+
+def render_search_page(products: Iterable[Dict[str, Any]], next_cursor: Optional[str]) -> bytes:
+    """Render a page of search results with its next cursor."""
+    return (
+        b'{"items":' + render_products(products)
+        + b',"next_cursor":' + _encode(next_cursor, orjson is not None) + b"}"
+    )
+
+
+def render_ndjson_line(product: Dict[str, Any], model: Optional[Type[Product]] = None, default_type: str = 'generic') -> bytes:
+    """Render a product document as one NDJSON line."""
+    return render_product(product, model, default_type) + b"\n"
+
+
+def render_batch_item(upc: str, status_code: int, product: Any = None, detail: Optional[str] = None) -> bytes:
+    """
+    Render one result of a batch UPC lookup.
+
+    Args:
+        upc: Requested UPC
+        status_code: HTTP status the single UPC endpoint would have answered with
+        product: Rendered product bytes or a dictionary from dump_product
+        detail: Error detail for failed lookups
+    """
+    head = b'{"upc":' + _encode(upc, False) + b',"status":' + str(status_code).encode()
+    if product is None:
+        return head + b',"detail":' + _encode(detail, False) + b"}"
+    if not isinstance(product, bytes):
+        product = _encode(product, False)
+    return head + b',"product":' + product + b"}"
+
+
+def render_changes(changes: Iterable[Dict[str, Any]], next_token: str, has_more: bool) -> bytes:
+    """
+    Render a page of the delta sync feed.
+
+    Args:
+        changes: Product documents and tombstones (documents with deleted_at)
+        next_token: Token to sync from next
+        has_more: Whether more changes are ready
+    """
+    items = []
+    for change in changes:
+        if 'deleted_at' in change:
+            items.append(b'{"op":"delete","id":' + _encode(str(change['_id']), False)
+                         + b',"upc":' + _encode(change.get('upc'), False) + b"}")
+        else:
+            items.append(b'{"op":"upsert","product":' + render_product(change) + b"}")
+
+    return (
+        b'{"changes":[' + b",".join(items) + b'],"next":' + _encode(next_token, False)
+        + b',"has_more":' + (b"true" if has_more else b"false") + b"}"
+    )
+
+
+class ProductJSONResponse(JSONResponse):
+    """
+    JSON response for product payloads.
+
+    Content that is already bytes (from the render_* helpers) is sent as is,
+    anything else is encoded like starlette's JSONResponse.
+    """
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        return super().render(content)
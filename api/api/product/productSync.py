@@ -0,0 +1,191 @@
+"""
+Delta sync of the product catalog.
+
+Every product write is stamped with a ``sync_seq`` taken from a counter in
+``catalog_state``, and deletes leave a tombstone in ``product_tombstones``
+with a sequence number of its own. A terminal keeps the token of its last
+sync and asks for everything stamped after it.
+
+Sequence numbers are handed out before the write that carries them, so a
+write can become visible after one with a higher number. Changes younger
+than SYNC_SETTLE_SECONDS are therefore held back until the writes that
+were stamped before them have landed.
+"""
+from datetime import datetime, timedelta
+import logging
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, status
+from pymongo import ASCENDING, ReturnDocument, UpdateOne
+
+from config.db import db
+from api.product.productPaging import decode_cursor, encode_cursor
+
+logger = logging.getLogger(__name__)
+
+
+# Seconds a change waits before it is handed out, see the module docstring
+SYNC_SETTLE_SECONDS = float(os.environ.get('SYNC_SETTLE_SECONDS', '2'))
+
+# Days tombstones are kept. Terminals that have not synced for longer must
+# download the full catalog again.
+TOMBSTONE_TTL_DAYS = int(os.environ.get('PRODUCT_TOMBSTONE_TTL_DAYS', '30'))
+
+
+async def _allocate(count: int = 1) -> int:
+    """Reserve count sequence numbers and return the highest one."""
+    state = await db.catalog_state.find_one_and_update(
+        {"_id": "sync_seq"},
+        {"$inc": {"version": count}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return state["version"]
+
+
+async def sync_stamp() -> Dict[str, Any]:
+    """
+    Allocate the sync fields of a product write. Merge them into the
+    inserted document or the $set of the update.
+    """
+    return {"sync_seq": await _allocate(), "synced_at": datetime.utcnow()}
+
+
+async def record_delete(product: Dict[str, Any]) -> Dict[str, Any]:
+    """Leave a tombstone for a deleted product and return it."""
+    stamp = await sync_stamp()
+    tombstone = {"upc": product.get("upc"), "deleted_at": stamp["synced_at"], **stamp}
+    await db.product_tombstones.replace_one({"_id": product["_id"]}, tombstone, upsert=True)
+    return {"_id": product["_id"], **tombstone}
+
+
+async def record_reset():
+    """
+    Record that every product was deleted at once. Tokens from before the
+    reset are refused, so terminals start over instead of receiving a
+    tombstone per product.
+    """
+    seq = await _allocate()
+    await db.catalog_state.update_one({"_id": "sync_reset"}, {"$set": {"version": seq}}, upsert=True)
+    await db.product_tombstones.delete_many({})
+
+
+async def stamp_unsynced_products(batch_size: int = 1000) -> int:
+    """
+    Give products written before delta sync existed (or written directly
+    to MongoDB) a sequence number. Runs on startup and is cheap once every
+    product is stamped.
+
+    Returns:
+        Number of products stamped
+    """
+    stamped = 0
+    while True:
+        ids = [product["_id"] async for product in
+               db.products.find({"sync_seq": {"$exists": False}}, {"_id": 1}).limit(batch_size)]
+        if not ids:
+            break
+
+        last = await _allocate(len(ids))
+        now = datetime.utcnow()
+        await db.products.bulk_write([
+            UpdateOne({"_id": product_id, "sync_seq": {"$exists": False}},
+                      {"$set": {"sync_seq": last - len(ids) + 1 + i, "synced_at": now}})
+            for i, product_id in enumerate(ids)
+        ], ordered=False)
+        stamped += len(ids)
+
+    if stamped:
+        logger.info(f"Stamped {stamped} products with a sync sequence number")
+    return stamped
+
+
+def encode_sync_token(seq: int, issued_at: datetime) -> str:
+    return encode_cursor([seq, issued_at])
+
+
+def decode_sync_token(token: Optional[str]) -> Tuple[int, Optional[datetime]]:
+    """
+    Decode a sync token.
+
+    Returns:
+        Sequence number and issue time, (0, None) when no token was given
+
+    Raises:
+        HTTPException: 400 if the token is malformed
+    """
+    values = decode_cursor(token, 2)
+    if values is None:
+        return 0, None
+    seq, issued_at = values
+    if not isinstance(seq, int) or not isinstance(issued_at, datetime):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid sync token")
+    return seq, issued_at.replace(tzinfo=None)
+
+
+async def sync_window(since: Optional[str]) -> Tuple[int, datetime, datetime]:
+    """
+    Work out which changes a sync from a token may hand out.
+
+    Args:
+        since: Token from a previous sync, None to start from scratch
+
+    Returns:
+        Sequence number to continue after, the time of this sync (for the
+        next token), and the cutoff: changes stamped later are not settled yet
+
+    Raises:
+        HTTPException: 410 if the token is too old to be answered with changes
+    """
+    seq, issued_at = decode_sync_token(since)
+    now = datetime.utcnow()
+
+    reset = await db.catalog_state.find_one({"_id": "sync_reset"})
+    reset_seq = reset["version"] if reset else 0
+    if issued_at is not None and (now - issued_at > timedelta(days=TOMBSTONE_TTL_DAYS) or reset_seq > seq):
+        raise HTTPException(
+            status_code=status.HTTP_410_GONE,
+            detail="Sync token expired, sync again without a token"
+        )
+
+    # Nothing from before a reset exists any more
+    return max(seq, reset_seq), now, now - timedelta(seconds=SYNC_SETTLE_SECONDS)
+
+
+async def changes_since(since: Optional[str], limit: int) -> Tuple[List[Dict[str, Any]], str, bool]:
+    """
+    Collect the products and tombstones stamped after a sync token.
+
+    Args:
+        since: Token from a previous sync, None for the full catalog
+        limit: Maximum number of changes to return
+
+    Returns:
+        Changed product documents and tombstones (tombstones have a
+        ``deleted_at`` field) in sequence order, the token to sync from
+        next, and whether more changes are ready right away
+
+    Raises:
+        HTTPException: 410 if the token is too old to be answered with changes
+    """
+    seq, now, settled = await sync_window(since)
+
+    query = {"sync_seq": {"$gt": seq}}
+    sort = [("sync_seq", ASCENDING)]
+    products = await db.products.find(query).sort(sort).limit(limit + 1).to_list()
+    tombstones = await db.product_tombstones.find(query).sort(sort).limit(limit + 1).to_list()
+
+    changes = []
+    has_more = False
+    for change in sorted(products + tombstones, key=lambda change: change["sync_seq"]):
+        if change["synced_at"] > settled:
+            break
+        if len(changes) == limit:
+            has_more = True
+            break
+        changes.append(change)
+
+    if changes:
+        seq = changes[-1]["sync_seq"]
+    return changes, encode_sync_token(seq, now), has_more
@@ -27,11 +27,11 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 @userRoutes.get("")
 async def getAll( current_user: Annotated[UserModel, Depends(get_current_user('admin'))] ):
 
-    return usersEntity(db.users.find())
+    return usersEntity(await db.users.find().to_list())
 
 @userRoutes.get( "/{id}")
 async def getOne(id: str, current_user: Annotated[UserModel, Depends(get_current_user('user'))]):
-    return userEntity(db.users.find_one({"_id": ObjectId(id)}))
+    return userEntity(await db.users.find_one({"_id": ObjectId(id)}))
 
 @userRoutes.put("/{id}")
 async def updateOne(id: str, user: UserModel, current_user: Annotated[UserModel, Depends(get_current_user('admin'))] ):
@@ -51,7 +51,7 @@ async def updateOne(id: str, user: UserModel, current_user: Annotated[UserModel,
     user_dict.pop('id', None)
     user_dict.pop('password', None)
 
-    resp = db.users.update_one({"_id": ObjectId(id)}, {"$set": user_dict})
+    resp = await db.users.update_one({"_id": ObjectId(id)}, {"$set": user_dict})
     return {"message": "User updated"}
 
 @userRoutes.put( "/{id}/role")
@@ -65,7 +65,7 @@ async def updateRole(id: str, role: str, current_user: Annotated[UserModel, Depe
         )
 
     
-    resp = db.users.update_one({"_id": ObjectId(id)}, {"$set": {"role": role}})
+    resp = await db.users.update_one({"_id": ObjectId(id)}, {"$set": {"role": role}})
     return {"message": "Role updated"}
 
 @userRoutes.post("")
@@ -75,7 +75,7 @@ async def createOne(user: UserModel, current_user: Annotated[UserModel, Depends(
     user_dict.pop('id', None)
     user_dict.pop('password', None)
 
-    resp = db.users.insert_one(user_dict)
+    resp = await db.users.insert_one(user_dict)
     return {"message": "User created"}
 
 @userRoutes.delete("/{id}")
@@ -83,7 +83,7 @@ async def deleteOne(id: str, current_user: Annotated[UserModel, Depends(get_curr
 
     
     #Check for root 
-    user = db.users.find_one({"_id": ObjectId(id)})
+    user = await db.users.find_one({"_id": ObjectId(id)})
 
     if user == None:
         raise HTTPException(
@@ -100,7 +100,7 @@ async def deleteOne(id: str, current_user: Annotated[UserModel, Depends(get_curr
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    db.users.delete_one({"_id": ObjectId(id)})
+    await db.users.delete_one({"_id": ObjectId(id)})
     return {"message": "User deleted"}
 
 
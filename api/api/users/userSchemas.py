@@ -28,11 +28,11 @@ def userEntity(user) -> dict:
 def usersEntity(users) -> list:
     return [userEntity(user) for user in users]
 
-def resolveUser(user) -> dict:
+async def resolveUser(user) -> dict:
 
     if isinstance(user, str):
         
-        userRecord = db.users.find_one({"_id": ObjectId(user)})
+        userRecord = await db.users.find_one({"_id": ObjectId(user)})
         if userRecord is None:
             return {
                 'id': 'unknown',
@@ -0,0 +1,106 @@
+"""
+Load test for concurrent barcode scans against a running API.
+
+Simulates checkout lanes scanning known products through
+GET /products/upc/{upc} while optional background clients run slow catalog
+requests (full product list), and prints latency percentiles of the scans.
+Run it against the same data set before and after a change to compare p99
+latency, e.g. with the API started from the previous commit and then from
+the current one.
+
+Usage (from the api directory, with the API running):
+    python -m benchmarks.load_test --url http://localhost:8000 \\
+        [--lanes 50] [--duration 30] [--heavy 2] [--upcs 200]
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from typing import List
+
+import httpx
+
+
+BASE_PATH = "/api/v1/products"
+
+
+async def load_upcs(client: httpx.AsyncClient, count: int) -> List[str]:
+    """Fetch UPCs of existing products so every scan is a database hit."""
+    response = await client.get(BASE_PATH, params={"fields": "upc", "limit": count})
+    response.raise_for_status()
+    return [product["upc"] for product in response.json() if product.get("upc")]
+
+
+async def lane(client: httpx.AsyncClient, upcs: List[str], deadline: float, latencies: List[float], errors: List[str]):
+    """One checkout lane scanning random products back to back until the deadline."""
+    while time.perf_counter() < deadline:
+        upc = random.choice(upcs)
+        start = time.perf_counter()
+        try:
+            response = await client.get(f"{BASE_PATH}/upc/{upc}")
+            if response.status_code != 200:
+                errors.append(f"HTTP {response.status_code}")
+        except httpx.HTTPError as e:
+            errors.append(type(e).__name__)
+        latencies.append(time.perf_counter() - start)
+
+
+async def heavy_client(client: httpx.AsyncClient, deadline: float, count: List[int]):
+    """Repeatedly download the full catalog, the kind of slow request that stalls a blocking worker."""
+    while time.perf_counter() < deadline:
+        try:
+            await client.get(BASE_PATH, params={"format": "ndjson"})
+        except httpx.HTTPError:
+            pass
+        count[0] += 1
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+async def run(url: str, lanes: int, duration: float, heavy: int, upc_count: int):
+    limits = httpx.Limits(max_connections=lanes + heavy, max_keepalive_connections=lanes + heavy)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+        upcs = await load_upcs(client, upc_count)
+        if not upcs:
+            raise SystemExit("No products with a UPC found, seed the database first")
+
+        latencies: List[float] = []
+        errors: List[str] = []
+        heavy_count = [0]
+        deadline = time.perf_counter() + duration
+
+        await asyncio.gather(
+            *[lane(client, upcs, deadline, latencies, errors) for _ in range(lanes)],
+            *[heavy_client(client, deadline, heavy_count) for _ in range(heavy)],
+        )
+
+    print(f"lanes:            {lanes} ({heavy} background full catalog clients)")
+    print(f"scans:            {len(latencies)} in {duration:.0f} s ({len(latencies) / duration:.0f}/s)")
+    print(f"errors:           {len(errors)}")
+    print(f"catalog fetches:  {heavy_count[0]}")
+    print(f"p50:              {percentile(latencies, 50) * 1000:8.1f} ms")
+    print(f"p95:              {percentile(latencies, 95) * 1000:8.1f} ms")
+    print(f"p99:              {percentile(latencies, 99) * 1000:8.1f} ms")
+    print(f"max:              {max(latencies) * 1000:8.1f} ms")
+    print(f"mean:             {statistics.mean(latencies) * 1000:8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000", help="API base URL")
+    parser.add_argument("--lanes", type=int, default=50, help="Concurrent scanning lanes")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds to run")
+    parser.add_argument("--heavy", type=int, default=2, help="Background clients downloading the full catalog")
+    parser.add_argument("--upcs", type=int, default=200, help="Number of distinct products to scan")
+    args = parser.parse_args()
+
+    asyncio.run(run(args.url, args.lanes, args.duration, args.heavy, args.upcs))
+
+
+if __name__ == "__main__":
+    main()
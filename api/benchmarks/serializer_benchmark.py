@@ -0,0 +1,152 @@
+"""
+Compare the Pydantic product serialization path with the fast serializer.
+
+Builds synthetic product documents shaped like the ones stored by the
+lookup routes and seed scripts, renders them both ways, checks that the
+response bytes are identical and prints the timings.
+
+Usage, from the api directory and as a module so the ``api`` package can
+be imported (``python benchmarks/serializer_benchmark.py`` fails with
+ModuleNotFoundError):
+    cd api
+    python -m benchmarks.serializer_benchmark [--count 10000] [--rounds 5]
+"""
+import argparse
+import json
+import random
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+
+from api.product.productModel import Product, FoodProduct, BookProduct
+from api.product.productSerializer import render_products
+
+
+def make_documents(count: int, seed: int = 42):
+    """Generate a mix of food, book, produce and generic product documents."""
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1)
+    documents = []
+
+    for i in range(count):
+        kind = rng.choice(["food", "food", "food", "book", "produce", "generic"])
+        document = {
+            "_id": ObjectId(),
+            "upc": f"{rng.randrange(10 ** 11, 10 ** 12)}",
+            "name": f"Product {i} ñ",
+            "price": rng.choice([4.04, rng.randrange(1, 50), round(rng.uniform(0.5, 99), 2)]),
+            "images": [str(ObjectId())],
+            "image_source": "Amazon",
+            "last_modified": start + timedelta(seconds=i, milliseconds=rng.randrange(1000)),
+        }
+
+        if kind == "food":
+            document.update({
+                "product_type": "food",
+                "brand": rng.choice(["Kellogg's", "General Mills", "Nestlé"]),
+                "description": "Breakfast cereal",
+                "ingredients": "Whole grain oats, sugar, salt",
+                "allergens": ["gluten"],
+                "tags": ["breakfast-cereals", "cereals-and-potatoes", "plant-based-foods"],
+                "nutrition": {
+                    "serving_size": "30 g",
+                    "calories": rng.randrange(100, 400),
+                    "fat": round(rng.uniform(0, 10), 1),
+                    "sugars": rng.uniform(0, 30),
+                    "sodium": 0.00003 if i % 10 == 0 else 0.3,
+                    "nutrition_grade": "b",
+                },
+                "metadata": {
+                    "openfoodfacts_id": f"{i}",
+                    "ecoscore_grade": None,
+                    "nova_group": 4,
+                    "packaging": "Cardboard",
+                },
+            })
+        elif kind == "book":
+            document.update({
+                "product_type": "book",
+                "isbn": document["upc"],
+                "author": "Jane Doe",
+                "publisher": "Example Press",
+                "publication_date": "2020",
+                "page_count": rng.randrange(50, 900),
+                "categories": ["Fiction"],
+                "tags": ["Fiction"],
+                "metadata": {"source": "Open Library"},
+            })
+        elif kind == "produce":
+            document.update({
+                "product_type": "food",
+                "brand": "Fresh Produce",
+                "category": "Fruits",
+                "nutrition": {"serving_size": "1 item", "calories": 0, "total_fat": 0},
+                "ingredients": "",
+                "allergens": [],
+            })
+
+        documents.append(document)
+
+    return documents
+
+
+def render_with_models(documents):
+    """The original route code: validate and dump every document, then encode like FastAPI."""
+    products = []
+    for product in documents:
+        product = dict(product)
+        product['id'] = str(product.pop('_id'))
+
+        product_type = product.get('product_type', 'generic')
+        if product_type == 'book':
+            products.append(BookProduct(**product).model_dump(exclude_none=True))
+        elif product_type == 'food':
+            products.append(FoodProduct(**product).model_dump(exclude_none=True))
+        else:
+            products.append(Product(**product).model_dump(exclude_none=True))
+
+    return json.dumps(
+        jsonable_encoder(products),
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+def timed(fn, documents, rounds):
+    best = None
+    result = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        result = fn(documents)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=10000, help="Number of documents")
+    parser.add_argument("--rounds", type=int, default=5, help="Rounds per path, the best is reported")
+    args = parser.parse_args()
+
+    documents = make_documents(args.count)
+
+    model_time, model_bytes = timed(render_with_models, documents, args.rounds)
+    fast_time, fast_bytes = timed(render_products, documents, args.rounds)
+
+    if model_bytes != fast_bytes:
+        raise SystemExit("Payloads differ between the model path and the fast serializer")
+
+    print(f"documents:        {args.count}")
+    print(f"payload:          {len(fast_bytes) / 1024:.0f} KiB (identical)")
+    print(f"pydantic path:    {model_time * 1000:8.1f} ms")
+    print(f"fast serializer:  {fast_time * 1000:8.1f} ms")
+    print(f"speedup:          {model_time / fast_time:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,31 @@
-from pymongo import MongoClient
+from pymongo import AsyncMongoClient
 import os
-from gridfs import GridFS
+from gridfs import AsyncGridFS
 
 #get mongourl from environment variable
 mongo_host = os.environ.get('MONGO_HOST', 'localhost')
 mongo_db = os.environ.get('MONGO_DB_NAME', 'app')
 
+# Connection pool. Every concurrent database operation of a worker holds a
+# connection, operations beyond maxPoolSize wait for one to be returned.
+mongo_max_pool_size = int(os.environ.get('MONGO_MAX_POOL_SIZE', '100'))
+mongo_min_pool_size = int(os.environ.get('MONGO_MIN_POOL_SIZE', '10'))
+mongo_max_idle_time_ms = int(os.environ.get('MONGO_MAX_IDLE_TIME_MS', '60000'))
+mongo_max_connecting = int(os.environ.get('MONGO_MAX_CONNECTING', '4'))
+mongo_server_selection_timeout_ms = int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', '5000'))
+
 print(f'Connecting to mongodb://{mongo_host}:27017')
 
-client = MongoClient(f'mongodb://{mongo_host}:27017')
+# Async client: database calls yield to the event loop instead of blocking
+# every other request of the worker while they wait on MongoDB
+client = AsyncMongoClient(
+    f'mongodb://{mongo_host}:27017',
+    maxPoolSize=mongo_max_pool_size,
+    minPoolSize=mongo_min_pool_size,
+    maxIdleTimeMS=mongo_max_idle_time_ms,
+    maxConnecting=mongo_max_connecting,
+    serverSelectionTimeoutMS=mongo_server_selection_timeout_ms,
+)
 
 db = client[mongo_db]
-fs = GridFS(db)
-
+fs = AsyncGridFS(db)
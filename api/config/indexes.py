@@ -0,0 +1,187 @@
+"""
+Index registry.
+
+Declares the indexes every collection needs in one place. ``apply_indexes``
+creates them idempotently (it runs on API startup) and ``index_report``
+compares the declared indexes with the ones that exist, using
+``$indexStats`` to spot indexes that are never used.
+
+Usage (from the api directory):
+    python -m config.indexes            # report missing, extra and unused indexes
+    python -m config.indexes --apply    # create missing indexes, then report
+"""
+import argparse
+import asyncio
+import json
+import logging
+from typing import Any, Dict, List
+
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+
+from config.db import db
+from api.product.productSearch import SEARCH_INDEX_KEYS, SEARCH_INDEX_NAME, SEARCH_INDEX_WEIGHTS
+from api.product.productSync import TOMBSTONE_TTL_DAYS
+
+logger = logging.getLogger(__name__)
+
+
+# Collection name -> index declarations. "keys" and "name" are required, any
+# other entry is passed to create_index as an option.
+INDEXES: Dict[str, List[Dict[str, Any]]] = {
+    "products": [
+        # Barcode scans. Products without a UPC (or with an empty one) are left
+        # out of the index so they do not collide with each other.
+        {"keys": [("upc", ASCENDING)], "name": "upc_unique", "unique": True,
+         "partialFilterExpression": {"upc": {"$gt": ""}}},
+        # /products/recent
+        {"keys": [("last_modified", DESCENDING), ("_id", DESCENDING)], "name": "last_modified"},
+        # /products/produce ($or over brand and category)
+        {"keys": [("brand", ASCENDING)], "name": "brand"},
+        {"keys": [("category", ASCENDING)], "name": "category"},
+        # /products/facets filters, brand and category are covered above
+        {"keys": [("product_type", ASCENDING)], "name": "product_type"},
+        {"keys": [("tags", ASCENDING)], "name": "tags"},
+        # /products/changes
+        {"keys": [("sync_seq", ASCENDING)], "name": "sync_seq"},
+        # Products waiting for background enrichment, resumed on startup
+        {"keys": [("enrichment", ASCENDING)], "name": "enrichment_pending",
+         "partialFilterExpression": {"enrichment": "pending"}},
+        # /products/search
+        {"keys": SEARCH_INDEX_KEYS, "name": SEARCH_INDEX_NAME, "weights": SEARCH_INDEX_WEIGHTS,
+         "default_language": "english"},
+    ],
+    "files": [
+        # Image deduplication
+        {"keys": [("md5", ASCENDING)], "name": "md5_unique", "unique": True},
+    ],
+    "users": [
+        # Login. API keys share the collection, so this is not unique.
+        {"keys": [("username", ASCENDING)], "name": "username"},
+    ],
+    "lookup_misses": [
+        {"keys": [("expires_at", ASCENDING)], "name": "expires_at_ttl", "expireAfterSeconds": 0},
+        {"keys": [("upc", ASCENDING)], "name": "upc"},
+    ],
+    "product_tombstones": [
+        {"keys": [("sync_seq", ASCENDING)], "name": "sync_seq"},
+        {"keys": [("deleted_at", ASCENDING)], "name": "deleted_at_ttl", "expireAfterSeconds": TOMBSTONE_TTL_DAYS * 24 * 3600},
+    ],
+    "change_stream_state": [
+        # Resume tokens of replicas that are gone
+        {"keys": [("updated_at", ASCENDING)], "name": "updated_at_ttl", "expireAfterSeconds": 7 * 24 * 3600},
+    ],
+    "amazon_results": [
+        {"keys": [("expires_at", ASCENDING)], "name": "expires_at_ttl", "expireAfterSeconds": 0},
+    ],
+    "lookup_leases": [
+        {"keys": [("expires_at", ASCENDING)], "name": "expires_at_ttl", "expireAfterSeconds": 0},
+    ],
+    # Created by GridFS itself, declared so they are not reported as extra
+    "fs.files": [
+        {"keys": [("filename", ASCENDING), ("uploadDate", ASCENDING)], "name": "filename_1_uploadDate_1"},
+    ],
+    "fs.chunks": [
+        {"keys": [("files_id", ASCENDING), ("n", ASCENDING)], "name": "files_id_1_n_1", "unique": True},
+    ],
+}
+
+
+async def apply_indexes(database=db) -> Dict[str, List[str]]:
+    """
+    Create every declared index. Indexes that already exist are left alone,
+    so this is safe to run on every startup.
+
+    Args:
+        database: Database to apply the indexes to
+
+    Returns:
+        Dictionary with the names of the indexes that were applied and the ones that failed
+    """
+    applied = []
+    failed = []
+
+    for collection_name, indexes in INDEXES.items():
+        for index in indexes:
+            options = {k: v for k, v in index.items() if k != "keys"}
+            try:
+                await database[collection_name].create_index(index["keys"], **options)
+                applied.append(f"{collection_name}.{index['name']}")
+            except OperationFailure as e:
+                # Typically duplicate values blocking a unique index, or an
+                # existing index with the same name and different options
+                logger.error(f"Could not create index {collection_name}.{index['name']}: {str(e)}")
+                failed.append(f"{collection_name}.{index['name']}")
+
+    return {"applied": applied, "failed": failed}
+
+
+async def _index_usage(collection) -> Dict[str, int]:
+    """Return the number of operations that used each index since the server started."""
+    try:
+        stats = await collection.aggregate([{"$indexStats": {}}])
+        return {stat["name"]: stat["accesses"]["ops"] async for stat in stats}
+    except OperationFailure as e:
+        logger.error(f"Could not read index stats for {collection.name}: {str(e)}")
+        return {}
+
+
+async def index_report(database=db) -> Dict[str, Dict[str, Any]]:
+    """
+    Compare the declared indexes with the indexes in the database.
+
+    Usage counts come from $indexStats and reset when mongod restarts, so an
+    index reported as unused shortly after a restart may simply not have been
+    needed yet.
+
+    Args:
+        database: Database to inspect
+
+    Returns:
+        Per collection: missing (declared, not present), extra (present, not declared),
+        unused (present, no recorded use) and the usage count of every index
+    """
+    report = {}
+    existing_collections = set(await database.list_collection_names())
+
+    for collection_name in sorted(existing_collections | set(INDEXES)):
+        declared = {index["name"] for index in INDEXES.get(collection_name, [])}
+
+        if collection_name in existing_collections:
+            collection = database[collection_name]
+            present = set(await collection.index_information()) - {"_id_"}
+            usage = await _index_usage(collection)
+        else:
+            present = set()
+            usage = {}
+
+        report[collection_name] = {
+            "missing": sorted(declared - present),
+            "extra": sorted(present - declared),
+            "unused": sorted(name for name in present if usage.get(name) == 0),
+            "usage": {name: usage.get(name) for name in sorted(present)},
+        }
+
+    return report
+
+
+async def run(apply: bool):
+    if apply:
+        result = await apply_indexes()
+        print(f"Applied {len(result['applied'])} indexes, {len(result['failed'])} failed")
+        for name in result["failed"]:
+            print(f"  failed: {name}")
+
+    print(json.dumps(await index_report(), indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--apply", action="store_true", help="Create missing indexes before reporting")
+    args = parser.parse_args()
+
+    asyncio.run(run(args.apply))
+
+
+if __name__ == "__main__":
+    main()
@@ -17,7 +17,15 @@ from api.auth.authRoutes import authRoutes
 from api.backup.backupRoutes import backupRoutes
 from api.files.fsFileRoutes import fileRoutes
 from api.jobs.jobRoutes import jobRoutes
-from api.product.productRoutes import productRoutes
+from api.events.eventRoutes import eventRoutes
+from api.product.productRoutes import productRoutes, enrichment_worker, resume_enrichment
+from config.indexes import apply_indexes
+from api.product.productSync import stamp_unsynced_products
+from api.product.productAutocomplete import autocomplete_index
+from util.changeWatcher import change_watcher
+from util.compression import CompressionMiddleware
+from util.httpClient import http_client
+from util.browserPool import browser_pool
 import time
 from typing import Callable
 
@@ -35,7 +43,21 @@ currentConfig = None
 
 @app.on_event("startup")
 async def startup_event():
-    pass
+    await apply_indexes()
+    await stamp_unsynced_products()
+    await change_watcher.start()
+    await getConfiguration()
+    await checkAndCreateAdmin()
+    enrichment_worker.start()
+    autocomplete_index.schedule_rebuild()
+    await resume_enrichment()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await enrichment_worker.stop()
+    await http_client.close()
+    await browser_pool.close()
+    await change_watcher.stop()
 
 # Allow requests from all origins
 app.add_middleware(
@@ -46,6 +68,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress JSON and NDJSON responses (zstd, brotli or gzip, as negotiated)
+app.add_middleware(CompressionMiddleware)
+
 @app.middleware("http")
 async def add_process_time_header(request: Request, call_next: Callable):
     start_time = time.time()
@@ -62,6 +87,7 @@ app.include_router(backupRoutes, tags=["backup"], prefix= base +  "/backups"  )
 app.include_router(fileRoutes, tags=["files"], prefix= base +  "/files"  )
 app.include_router(jobRoutes, tags=["jobs"], prefix= base +  "/jobs"  )
 app.include_router(productRoutes, tags=["products"], prefix= base +  "/products"  )
+app.include_router(eventRoutes, tags=["events"], prefix= base +  "/events"  )
 
 @app.get("/")
 async def root():
@@ -77,7 +103,3 @@ def secure_endpoint(token: str = Depends(oauth2_scheme)):
     return {"message": "Secure data"}
 
 logging.getLogger("uvicorn.access").setLevel(logging.CRITICAL)
-
-
-getConfiguration()
-checkAndCreateAdmin()
@@ -7,7 +7,8 @@ This script adds 100 common produce items to the database with images.
 
 import os
 import sys
-from pymongo import MongoClient
+from pymongo import MongoClient, ReplaceOne, ReturnDocument
+from pymongo.errors import DuplicateKeyError
 from bson import ObjectId
 import gridfs
 from datetime import datetime
@@ -224,7 +225,24 @@ def seed_produce():
     if existing_count > 0:
         response = input("Do you want to delete existing produce items first? (y/n): ")
         if response.lower() == 'y':
-            result = db.products.delete_many({"product_type": "food", "category": {"$in": ["Fruits", "Vegetables", "Herbs"]}})
+            produce = list(db.products.find({"product_type": "food", "category": {"$in": ["Fruits", "Vegetables", "Herbs"]}}, {"upc": 1}))
+
+            # Tombstones so terminals syncing via /products/changes drop the
+            # old items, see record_delete in api/product/productSync.py
+            state = db.catalog_state.find_one_and_update(
+                {"_id": "sync_seq"}, {"$inc": {"version": len(produce)}}, upsert=True, return_document=ReturnDocument.AFTER
+            )
+            first = state["version"] - len(produce) + 1
+            now = datetime.utcnow()
+            if produce:
+                db.product_tombstones.bulk_write([
+                    ReplaceOne({"_id": product["_id"]},
+                               {"upc": product.get("upc"), "deleted_at": now, "sync_seq": first + i, "synced_at": now},
+                               upsert=True)
+                    for i, product in enumerate(produce)
+                ])
+
+            result = db.products.delete_many({"_id": {"$in": [product["_id"] for product in produce]}})
             print(f"🗑️  Deleted {result.deleted_count} existing produce items")
 
     print()
@@ -285,10 +303,25 @@ def seed_produce():
             "allergens": []
         }
 
-        db.products.insert_one(product)
+        # Delta sync sequence number, see api/product/productSync.py
+        state = db.catalog_state.find_one_and_update(
+            {"_id": "sync_seq"}, {"$inc": {"version": 1}}, upsert=True, return_document=ReturnDocument.AFTER
+        )
+        product["sync_seq"] = state["version"]
+        product["synced_at"] = datetime.utcnow()
+
+        try:
+            db.products.insert_one(product)
+        except DuplicateKeyError:
+            print(f"    ⏭️  PLU {plu} already exists, skipping")
+            continue
         inserted_count += 1
         print()
 
+    # Move the catalog versions so API replicas rebuild their produce snapshot
+    for counter in ("products", "produce"):
+        db.catalog_state.update_one({"_id": counter}, {"$inc": {"version": 1}}, upsert=True)
+
     print()
     print("=" * 60)
     print(f"✅ Successfully added {inserted_count} produce items!")
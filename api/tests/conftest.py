@@ -0,0 +1,13 @@
+"""
+Shared setup of the unit tests.
+
+The tests cover logic that needs no running MongoDB, Amazon or Open Food
+Facts. Run them from the api directory:
+    cd api
+    python -m pytest -q
+"""
+import os
+import sys
+
+# The application imports its modules relative to the api directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
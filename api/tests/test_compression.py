@@ -0,0 +1,156 @@
+import asyncio
+import json
+import zlib
+
+import pytest
+
+from util.compression import CompressionMiddleware, compress_bytes, available_encodings, negotiate_encoding
+
+
+def _app(headers, chunks, status=200):
+    """ASGI app sending a response with the given headers, one body message per chunk."""
+    async def app(scope, receive, send):
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(name.encode(), value.encode()) for name, value in headers],
+        })
+        for i, chunk in enumerate(chunks):
+            await send({"type": "http.response.body", "body": chunk, "more_body": i < len(chunks) - 1})
+    return app
+
+
+def _run(app, accept_encoding="gzip", method="GET", **options):
+    """Call the middleware around app, return the response headers and body messages."""
+    messages = []
+    scope = {
+        "type": "http",
+        "method": method,
+        "headers": [(b"accept-encoding", accept_encoding.encode())] if accept_encoding else [],
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(CompressionMiddleware(app, **options)(scope, receive, send))
+    headers = {name.decode().lower(): value.decode() for name, value in messages[0]["headers"]}
+    return headers, messages[1:]
+
+
+def _gunzip(data):
+    return zlib.decompress(data, 31)
+
+
+JSON = [("content-type", "application/json")]
+BODY = json.dumps([{"id": i, "name": f"Product {i}"} for i in range(200)]).encode()
+
+
+def test_json_is_compressed():
+    headers, messages = _run(_app(JSON + [("content-length", str(len(BODY)))], [BODY]))
+    assert headers["content-encoding"] == "gzip"
+    assert "content-length" not in headers
+    assert headers["vary"] == "Accept-Encoding"
+    assert _gunzip(b"".join(message["body"] for message in messages)) == BODY
+
+
+def test_strong_etag_becomes_weak():
+    headers, _ = _run(_app(JSON + [("etag", '"v1"')], [BODY]))
+    assert headers["etag"] == 'W/"v1"'
+
+
+def test_small_body_is_sent_as_is():
+    headers, messages = _run(_app(JSON, [b'{"ok":true}']))
+    assert "content-encoding" not in headers
+    assert headers["vary"] == "Accept-Encoding"
+    assert messages == [{"type": "http.response.body", "body": b'{"ok":true}', "more_body": False}]
+
+
+def test_client_without_accept_encoding_gets_identity():
+    headers, messages = _run(_app(JSON, [BODY]), accept_encoding=None)
+    assert "content-encoding" not in headers
+    assert b"".join(message["body"] for message in messages) == BODY
+
+
+@pytest.mark.parametrize("headers", [
+    [("content-type", "image/jpeg")],
+    [("content-type", "application/gzip")],
+    [("content-type", "text/event-stream")],
+    JSON + [("content-encoding", "br")],
+    JSON + [("cache-control", "no-transform")],
+])
+def test_pass_through(headers):
+    sent_headers, messages = _run(_app(headers, [BODY]))
+    assert sent_headers.get("content-encoding") == dict(headers).get("content-encoding")
+    assert "vary" not in sent_headers
+    assert messages == [{"type": "http.response.body", "body": BODY, "more_body": False}]
+
+
+def test_not_modified_passes_through():
+    headers, messages = _run(_app(JSON, [b""], status=304))
+    assert "content-encoding" not in headers
+    assert messages[0]["body"] == b""
+
+
+def test_head_request_passes_through():
+    headers, _ = _run(_app(JSON, [BODY]), method="HEAD")
+    assert "content-encoding" not in headers
+
+
+def test_each_streamed_chunk_is_sent_before_the_next():
+    lines = [json.dumps({"upc": f"0{i}", "status": 200}).encode() + b"\n" for i in range(5)]
+    decoder = zlib.decompressobj(31)
+    delivered = []
+    received_before = []
+
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"application/x-ndjson")]})
+        for line in lines:
+            await send({"type": "http.response.body", "body": line, "more_body": True})
+            # What the client can decode before the application sends anything else
+            received_before.append(b"".join(decoder.decompress(body) for body in delivered))
+            delivered.clear()
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+    async def send(message):
+        if message["type"] == "http.response.body":
+            delivered.append(message["body"])
+        else:
+            headers = dict(message["headers"])
+            assert headers[b"content-encoding"] == b"gzip"
+
+    scope = {"type": "http", "method": "POST", "headers": [(b"accept-encoding", b"gzip")]}
+    asyncio.run(CompressionMiddleware(app)(scope, None, send))
+
+    assert received_before == lines
+    assert decoder.decompress(b"".join(delivered)) + decoder.flush() == b""
+
+
+def test_long_stream_decodes_to_the_whole_body():
+    lines = [json.dumps({"id": i, "name": f"Product {i}"}).encode() + b"\n" for i in range(400)]
+    headers, messages = _run(_app([("content-type", "application/x-ndjson")], lines))
+
+    assert headers["content-encoding"] == "gzip"
+    assert len(messages) == len(lines)
+    assert messages[-1]["more_body"] is False
+    assert _gunzip(b"".join(message["body"] for message in messages)) == b"".join(lines)
+    assert sum(len(message["body"]) for message in messages) < len(b"".join(lines))
+
+
+def test_negotiation_honours_q_values():
+    assert negotiate_encoding(None) is None
+    assert negotiate_encoding("identity") is None
+    assert negotiate_encoding("gzip;q=0") is None
+    assert negotiate_encoding("gzip;q=0.5, *;q=0.1") == "gzip"
+    assert negotiate_encoding("*") == available_encodings()[0]
+
+
+@pytest.mark.parametrize("encoding", available_encodings())
+def test_precompressed_bodies_use_the_encoding(encoding):
+    data = compress_bytes(BODY, encoding)
+    if encoding == "gzip":
+        assert _gunzip(data) == BODY
+    assert len(data) < len(BODY)
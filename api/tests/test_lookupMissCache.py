@@ -0,0 +1,139 @@
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+from api.product import productRoutes
+from util.lookupErrors import ProviderUnavailableError
+from util.lookupMissCache import LookupMissCache
+from util.providerRegistry import ProviderRegistry
+
+
+class FakeMisses:
+    """The parts of a MongoDB collection LookupMissCache uses."""
+
+    def __init__(self):
+        self.documents = {}
+        self.reads = 0
+
+    async def find_one(self, query, projection=None):
+        self.reads += 1
+        document = self.documents.get(query["_id"])
+        if document is None or document["expires_at"] <= query["expires_at"]["$gt"]:
+            return None
+        return document
+
+    async def update_one(self, query, update, upsert=False):
+        self.documents[query["_id"]] = dict(update["$set"])
+
+    async def delete_many(self, query):
+        removed = [key for key, document in self.documents.items()
+                   if all(document.get(field) == value for field, value in query.items())]
+        for key in removed:
+            del self.documents[key]
+        return SimpleNamespace(deleted_count=len(removed))
+
+
+class RecordingMissCache:
+    def __init__(self):
+        self.recorded = []
+
+    async def is_miss(self, upc, provider):
+        return False
+
+    async def record(self, upc, provider):
+        self.recorded.append((upc, provider))
+
+
+def test_recorded_miss_is_remembered_per_provider():
+    async def run():
+        cache = LookupMissCache(FakeMisses())
+        await cache.record("0123", "openfoodfacts")
+        return await cache.is_miss("0123", "openfoodfacts"), await cache.is_miss("0123", "books")
+
+    assert asyncio.run(run()) == (True, False)
+
+
+def test_expired_miss_is_forgotten():
+    async def run():
+        collection = FakeMisses()
+        cache = LookupMissCache(collection, memo_ttl=0.01)
+        await cache.record("0123", "openfoodfacts")
+        collection.documents["openfoodfacts:0123"]["expires_at"] = datetime.utcnow() - timedelta(seconds=1)
+        await asyncio.sleep(0.02)
+        return await cache.is_miss("0123", "openfoodfacts")
+
+    assert asyncio.run(run()) is False
+
+
+def test_known_miss_is_answered_from_memory():
+    async def run():
+        collection = FakeMisses()
+        cache = LookupMissCache(collection)
+        await cache.record("0123", "openfoodfacts")
+        for _ in range(3):
+            assert await cache.is_miss("0123", "openfoodfacts")
+        return collection.reads
+
+    assert asyncio.run(run()) == 0
+
+
+def test_purge_by_upc():
+    async def run():
+        cache = LookupMissCache(FakeMisses())
+        await cache.record("0123", "openfoodfacts")
+        await cache.record("0456", "openfoodfacts")
+        deleted = await cache.purge(upc="0123")
+        return deleted, await cache.is_miss("0123", "openfoodfacts"), await cache.is_miss("0456", "openfoodfacts")
+
+    assert asyncio.run(run()) == (1, False, True)
+
+
+def _lookup_food(monkeypatch, lookup, cache=True):
+    misses = RecordingMissCache()
+    monkeypatch.setattr(productRoutes, "lookup_miss_cache", misses)
+    monkeypatch.setattr(productRoutes.openfoodfacts_lookup, "lookup_by_upc_async", lookup)
+    with pytest.raises(HTTPException) as raised:
+        asyncio.run(productRoutes._lookup_food("0123", cache))
+    return raised.value.status_code, misses.recorded
+
+
+def test_definitive_miss_is_recorded(monkeypatch):
+    async def not_found(upc, include_stores=True, deadline=None):
+        return None
+
+    assert _lookup_food(monkeypatch, not_found) == (404, [("0123", "openfoodfacts")])
+
+
+def test_provider_failure_is_not_recorded(monkeypatch):
+    async def unavailable(upc, include_stores=True, deadline=None):
+        raise ProviderUnavailableError("openfoodfacts", "HTTP 502")
+
+    assert _lookup_food(monkeypatch, unavailable) == (503, [])
+
+
+def test_miss_without_cache_is_not_recorded(monkeypatch):
+    async def not_found(upc, include_stores=True, deadline=None):
+        return None
+
+    assert _lookup_food(monkeypatch, not_found, cache=False) == (404, [])
+
+
+def test_miss_is_only_definitive_when_no_provider_failed():
+    async def miss(query):
+        return None
+
+    async def fail(query):
+        raise ProviderUnavailableError("second", "timed out")
+
+    async def run(second):
+        registry = ProviderRegistry()
+        registry.register("first", ("book",), miss)
+        registry.register("second", ("book",), second)
+        return await registry.lookup("book", "9780000000001")
+
+    assert asyncio.run(run(miss)) == (None, None)
+    with pytest.raises(ProviderUnavailableError):
+        asyncio.run(run(fail))
@@ -0,0 +1,53 @@
+from datetime import datetime
+
+from bson import ObjectId
+
+from api.product.productModel import BookProduct, FoodProduct
+from api.product.productSerializer import dump_product, render_product, render_products
+from benchmarks.serializer_benchmark import make_documents, render_with_models
+
+
+def test_render_products_matches_model_path():
+    documents = make_documents(500)
+    assert render_products(documents) == render_with_models(documents)
+
+
+def test_render_product_matches_model_path_per_document():
+    for document in make_documents(50, seed=7):
+        assert render_product(document) == render_with_models([document])[1:-1]
+
+
+def test_float_formatting_matches_json_module():
+    # orjson writes 1e-05 as 0.00001 and big floats without an exponent
+    for price in (0.00001, 3e-05, 1e16, 2.5e20, 0.1, 4.04, 7):
+        document = {"_id": ObjectId(), "upc": "1", "name": "Tiny", "price": price, "product_type": "food",
+                    "nutrition": {"sodium": price}}
+        assert render_product(document) == render_with_models([document])[1:-1]
+
+
+def test_unexpected_values_go_through_the_model():
+    document = {
+        "_id": ObjectId(),
+        "upc": "1",
+        "name": "Odd",
+        "product_type": "food",
+        "price": "4.50",
+        "tags": ("a", "b"),
+        "metadata": {"nested": {"when": datetime(2024, 5, 1, 12, 30, 0, 123000)}},
+        "unknown_field": object(),
+    }
+    assert render_product(document) == render_with_models([document])[1:-1]
+
+
+def test_missing_fields_and_none_are_left_out():
+    document = {"_id": ObjectId(), "upc": "9780000000001", "name": "Book", "product_type": "book", "author": None}
+    dumped = dump_product(document, BookProduct)
+    assert "author" not in dumped
+    assert dumped["id"] == str(document["_id"])
+
+
+def test_model_is_chosen_from_product_type():
+    food = {"_id": ObjectId(), "upc": "1", "name": "Cereal", "product_type": "food", "brand": "Acme"}
+    book = {"_id": ObjectId(), "upc": "2", "name": "Novel", "product_type": "book", "author": "Doe"}
+    assert dump_product(food) == dump_product(food, FoodProduct)
+    assert dump_product(book) == dump_product(book, BookProduct)
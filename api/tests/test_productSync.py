@@ -0,0 +1,164 @@
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+
+from api.product import productSync
+from api.product.productSync import changes_since, decode_sync_token, encode_sync_token, sync_window
+
+
+class FakeCursor:
+    def __init__(self, documents):
+        self.documents = documents
+
+    def sort(self, keys):
+        field, _ = keys[0]
+        self.documents = sorted(self.documents, key=lambda document: document[field])
+        return self
+
+    def limit(self, count):
+        self.documents = self.documents[:count]
+        return self
+
+    async def to_list(self):
+        return self.documents
+
+
+class FakeCollection:
+    def __init__(self, documents=()):
+        self.documents = list(documents)
+
+    def find(self, query):
+        after = query["sync_seq"]["$gt"]
+        return FakeCursor([document for document in self.documents if document["sync_seq"] > after])
+
+    async def find_one(self, query):
+        return next((document for document in self.documents if document["_id"] == query["_id"]), None)
+
+
+@pytest.fixture
+def catalog(monkeypatch):
+    db = SimpleNamespace(
+        products=FakeCollection(),
+        product_tombstones=FakeCollection(),
+        catalog_state=FakeCollection(),
+    )
+    monkeypatch.setattr(productSync, "db", db)
+    return db
+
+
+def _product(seq, age=60):
+    return {"_id": ObjectId(), "sync_seq": seq, "synced_at": datetime.utcnow() - timedelta(seconds=age)}
+
+
+def _tombstone(seq, age=60):
+    return {**_product(seq, age), "deleted_at": datetime.utcnow() - timedelta(seconds=age)}
+
+
+def test_token_round_trip():
+    issued_at = datetime(2024, 3, 1, 12, 0, 0, 250000)
+    assert decode_sync_token(encode_sync_token(42, issued_at)) == (42, issued_at)
+
+
+def test_no_token_starts_from_scratch():
+    assert decode_sync_token(None) == (0, None)
+
+
+@pytest.mark.parametrize("token", ["not a token", encode_sync_token("42", datetime.utcnow())])
+def test_malformed_token_is_rejected(token):
+    with pytest.raises(HTTPException) as raised:
+        decode_sync_token(token)
+    assert raised.value.status_code == 400
+
+
+def test_token_older_than_tombstones_is_gone(catalog):
+    token = encode_sync_token(5, datetime.utcnow() - timedelta(days=productSync.TOMBSTONE_TTL_DAYS + 1))
+    with pytest.raises(HTTPException) as raised:
+        asyncio.run(sync_window(token))
+    assert raised.value.status_code == 410
+
+
+def test_token_from_before_a_reset_is_gone(catalog):
+    catalog.catalog_state.documents.append({"_id": "sync_reset", "version": 10})
+    with pytest.raises(HTTPException) as raised:
+        asyncio.run(sync_window(encode_sync_token(5, datetime.utcnow())))
+    assert raised.value.status_code == 410
+
+
+def test_full_sync_starts_after_the_reset(catalog):
+    catalog.catalog_state.documents.append({"_id": "sync_reset", "version": 10})
+    seq, _, settled = asyncio.run(sync_window(None))
+    assert seq == 10
+    assert settled < datetime.utcnow()
+
+
+def test_changes_merge_products_and_tombstones_in_sequence_order(catalog):
+    catalog.products.documents = [_product(1), _product(4), _product(2)]
+    catalog.product_tombstones.documents = [_tombstone(3)]
+
+    changes, token, has_more = asyncio.run(changes_since(None, 10))
+
+    assert [change["sync_seq"] for change in changes] == [1, 2, 3, 4]
+    assert "deleted_at" in changes[2]
+    assert decode_sync_token(token)[0] == 4
+    assert has_more is False
+
+
+def test_changes_continue_after_the_token(catalog):
+    catalog.products.documents = [_product(1), _product(2), _product(3)]
+    changes, _, _ = asyncio.run(changes_since(encode_sync_token(2, datetime.utcnow()), 10))
+    assert [change["sync_seq"] for change in changes] == [3]
+
+
+def test_changes_are_paged(catalog):
+    catalog.products.documents = [_product(seq) for seq in range(1, 6)]
+
+    changes, token, has_more = asyncio.run(changes_since(None, 2))
+    assert [change["sync_seq"] for change in changes] == [1, 2]
+    assert has_more is True
+
+    changes, token, has_more = asyncio.run(changes_since(token, 10))
+    assert [change["sync_seq"] for change in changes] == [3, 4, 5]
+    assert has_more is False
+
+
+def test_unsettled_changes_are_held_back(catalog):
+    # Sequence 3 may still be followed by a write stamped 2 that has not landed
+    catalog.products.documents = [_product(1), _product(3, age=0)]
+
+    changes, token, has_more = asyncio.run(changes_since(None, 10))
+
+    assert [change["sync_seq"] for change in changes] == [1]
+    assert decode_sync_token(token)[0] == 1
+    assert has_more is False
+
+
+def test_no_changes_keep_the_position(catalog):
+    changes, token, _ = asyncio.run(changes_since(encode_sync_token(7, datetime.utcnow()), 10))
+    assert changes == []
+    assert decode_sync_token(token)[0] == 7
+
+
+def test_delete_leaves_a_stamped_tombstone(catalog, monkeypatch):
+    stored = {}
+
+    async def allocate(count=1):
+        return 12
+
+    async def replace_one(query, document, upsert=False):
+        stored[query["_id"]] = document
+
+    monkeypatch.setattr(productSync, "_allocate", allocate)
+    catalog.product_tombstones.replace_one = replace_one
+    product = {"_id": ObjectId(), "upc": "0123", "name": "Gone"}
+
+    tombstone = asyncio.run(productSync.record_delete(product))
+
+    assert tombstone["_id"] == product["_id"]
+    assert tombstone["upc"] == "0123"
+    assert tombstone["sync_seq"] == 12
+    assert tombstone["deleted_at"] == tombstone["synced_at"]
+    assert stored[product["_id"]] == {key: value for key, value in tombstone.items() if key != "_id"}
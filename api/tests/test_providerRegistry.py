@@ -0,0 +1,191 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from util import providerRegistry
+from util.lookupErrors import CircuitOpenError, ProviderUnavailableError
+from util.providerRegistry import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, LookupProvider, ProviderRegistry
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Replace the clock of the circuit breakers with one the test moves."""
+    now = SimpleNamespace(value=1000.0)
+    monkeypatch.setattr(providerRegistry, "time", SimpleNamespace(monotonic=lambda: now.value))
+    return now
+
+
+def _open(breaker):
+    for _ in range(breaker.failure_threshold):
+        assert breaker.allow()
+        breaker.record_failure()
+
+
+def test_opens_after_failures_in_a_row(clock):
+    breaker = CircuitBreaker("x", failure_threshold=3, reset_timeout=30)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    assert breaker.opened == 1
+
+
+def test_success_resets_the_failure_count(clock):
+    breaker = CircuitBreaker("x", failure_threshold=3)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+    assert breaker.failures == 1
+
+
+def test_half_open_after_the_reset_timeout(clock):
+    breaker = CircuitBreaker("x", failure_threshold=1, reset_timeout=30)
+    _open(breaker)
+    clock.value += 29
+    assert not breaker.allow()
+    clock.value += 1
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+
+
+def test_only_one_probe_at_a_time(clock):
+    breaker = CircuitBreaker("x", failure_threshold=1, reset_timeout=30)
+    _open(breaker)
+    clock.value += 30
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.probe_done()
+    assert breaker.allow()
+
+
+def test_successful_probe_closes(clock):
+    breaker = CircuitBreaker("x", failure_threshold=1, reset_timeout=30)
+    _open(breaker)
+    clock.value += 30
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+
+
+def test_failed_probe_opens_again(clock):
+    breaker = CircuitBreaker("x", failure_threshold=5, reset_timeout=30)
+    _open(breaker)
+    clock.value += 30
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert breaker.opened == 2
+    assert not breaker.allow()
+
+
+def _provider(lookup, **options):
+    return LookupProvider("x", ("food",), lookup, breaker=CircuitBreaker("x", failure_threshold=1), **options)
+
+
+def test_open_circuit_skips_the_provider():
+    calls = []
+
+    async def failing(query):
+        calls.append(query)
+        raise ProviderUnavailableError("x", "HTTP 502")
+
+    async def run():
+        provider = _provider(failing)
+        with pytest.raises(ProviderUnavailableError):
+            await provider.call("1")
+        with pytest.raises(CircuitOpenError):
+            await provider.call("2")
+        return provider
+
+    provider = asyncio.run(run())
+    assert calls == ["1"]
+    assert provider.stats()["skipped"] == 1
+
+
+def test_own_timeout_counts_against_the_circuit():
+    async def hanging(query):
+        await asyncio.sleep(1)
+
+    async def run():
+        provider = _provider(hanging, timeout=0.01)
+        with pytest.raises(ProviderUnavailableError):
+            await provider.call("1")
+        return provider.breaker.state
+
+    assert asyncio.run(run()) == OPEN
+
+
+def test_running_out_of_budget_does_not_count_against_the_circuit():
+    async def hanging(query):
+        await asyncio.sleep(1)
+
+    async def run():
+        provider = _provider(hanging, timeout=5)
+        deadline = asyncio.get_running_loop().time() + 0.01
+        with pytest.raises(ProviderUnavailableError):
+            await provider.call("1", deadline)
+        return provider.breaker.state
+
+    assert asyncio.run(run()) == CLOSED
+
+
+def test_waiting_for_a_slot_does_not_use_the_provider_timeout():
+    async def slow(query):
+        await asyncio.sleep(0.05)
+        return query
+
+    async def run():
+        provider = _provider(slow, timeout=0.08, max_concurrency=1)
+        deadline = asyncio.get_running_loop().time() + 5
+        results = await asyncio.gather(*(provider.call(i, deadline) for i in range(3)))
+        return results, provider
+
+    results, provider = asyncio.run(run())
+    assert results == [0, 1, 2]
+    assert provider.stats()["timeouts"] == 0
+    assert provider.breaker.state == CLOSED
+
+
+def test_budget_running_out_in_the_slot_queue_does_not_count_against_the_circuit():
+    async def slow(query):
+        await asyncio.sleep(0.1)
+        return query
+
+    async def run():
+        provider = _provider(slow, max_concurrency=1)
+        deadline = asyncio.get_running_loop().time() + 0.05
+        results = await asyncio.gather(provider.call(1), provider.call(2, deadline), return_exceptions=True)
+        return results, provider
+
+    results, provider = asyncio.run(run())
+    assert results[0] == 1
+    assert isinstance(results[1], ProviderUnavailableError)
+    assert provider.stats()["slot_timeouts"] == 1
+    assert provider.breaker.failures == 0
+
+
+def test_sequential_lookup_skips_an_open_circuit():
+    async def failing(query):
+        raise ProviderUnavailableError("first", "HTTP 502")
+
+    async def found(query):
+        return {"upc": query}
+
+    async def run():
+        registry = ProviderRegistry(breaker_failures=1)
+        registry.register("first", ("food",), failing)
+        registry.register("second", ("food",), found)
+        first = await registry.lookup("food", "0123")
+        second = await registry.lookup("food", "0123")
+        return first, second, registry.providers("food")[0].stats()
+
+    first, second, stats = asyncio.run(run())
+    assert first == second == ("second", {"upc": "0123"})
+    assert stats["calls"] == 1
+    assert stats["skipped"] == 1
@@ -1,18 +1,36 @@
+import asyncio
 import logging
-from typing import Optional
+import os
+import time
+from typing import Any, Dict, List, Optional
 from urllib.parse import quote_plus
 import re
-import asyncio
-from concurrent.futures import ThreadPoolExecutor
-import threading
+
+from playwright.async_api import ElementHandle, Page, TimeoutError as PlaywrightTimeoutError
+
+try:
+    from util.browserPool import browser_pool
+except ImportError:
+    from .browserPool import browser_pool
 
 logger = logging.getLogger(__name__)
 
-from playwright.sync_api import sync_playwright, TimeoutError as PlaywrightTimeoutError
-from playwright.async_api import async_playwright, TimeoutError as AsyncPlaywrightTimeoutError
 
-# Thread pool for running sync Playwright in async context
-_thread_pool = ThreadPoolExecutor(max_workers=5, thread_name_prefix="amazon_search")
+# Seconds to wait for the first product card once the page has loaded
+AMAZON_RESULTS_TIMEOUT = float(os.environ.get('AMAZON_RESULTS_TIMEOUT', '10'))
+
+# Amazon uses various selectors for product cards
+PRODUCT_SELECTORS = [
+    '[data-component-type="s-search-result"]',
+    '.s-result-item[data-asin]',
+    'div[data-component-type="s-search-result"]',
+    '.s-result-item',
+]
+
+
+def _with_asin(selector: str) -> str:
+    """Narrow a product card selector to cards carrying an ASIN, which skips placeholders."""
+    return f'{selector}[data-asin]:not([data-asin=""])'
 
 
 class AmazonSearchResult:
@@ -24,258 +42,249 @@ class AmazonSearchResult:
         self.asin = None
         self.url = None
 
+    @property
+    def empty(self) -> bool:
+        """True if the search found nothing usable."""
+        return self.price is None and self.image_url is None and self.asin is None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "price": self.price,
+            "image_url": self.image_url,
+            "title": self.title,
+            "asin": self.asin,
+            "url": self.url,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'AmazonSearchResult':
+        result = cls()
+        for field in ("price", "image_url", "title", "asin", "url"):
+            setattr(result, field, data.get(field))
+        return result
+
 
 class AmazonUtil:
     """
     Utility class for searching Amazon products and extracting pricing/images.
     Uses Playwright to handle Amazon's dynamic content.
 
-    Provides both sync and async methods:
-    - search_by_name(): Synchronous search for use in non-async code
-    - search_by_name_async(): Async search for use in FastAPI and async contexts
-
-    The async version runs Playwright in a thread pool to avoid blocking the event loop.
+    Searches run on pages borrowed from the shared browser pool, so a search
+    costs a page navigation rather than a browser launch.
     """
 
     def __init__(self):
         self.base_url = "https://www.amazon.com"
+        # Per product selector: searches it matched first in and its time to match
+        self._selector_stats: Dict[str, Dict[str, float]] = {
+            selector: {"matches": 0, "total_ms": 0.0} for selector in PRODUCT_SELECTORS
+        }
+        self._selector_timeouts = 0
 
-    def search_by_name(self, product_name: str) -> AmazonSearchResult:
+    async def search_by_name_async(self, product_name: str, raise_errors: bool = False) -> AmazonSearchResult:
         """
         Search for a product by name on Amazon and return the first result.
 
-        Note: This is a synchronous wrapper. When called from async context,
-        it runs the search in a thread pool to avoid blocking the event loop.
-
         Args:
             product_name: The product name to search for
+            raise_errors: Raise when the search failed instead of returning an
+                empty result, so callers can tell a failure from no result
 
         Returns:
             AmazonSearchResult object with price and image_url (may be None if not found)
         """
-        result = AmazonSearchResult()
-
         if not product_name:
             logger.warning("Empty product name provided")
-            return result
+            return AmazonSearchResult()
 
-        # Check if we're running inside an asyncio event loop
         try:
-            loop = asyncio.get_running_loop()
-            # We're in an async context - this is a blocking call but unavoidable
-            # The caller should use search_by_name_async() for true async behavior
-            logger.warning("search_by_name() called from async context - use search_by_name_async() for better performance")
-            future = loop.run_in_executor(_thread_pool, self._search_sync, product_name)
-            # This creates a future but we need to return synchronously
-            # This is not ideal - callers in async context should use the async version
-            return asyncio.run_coroutine_threadsafe(
-                asyncio.wrap_future(future),
-                loop
-            ).result(timeout=120)
-        except RuntimeError:
-            # No event loop running, use sync version directly
-            pass
+            async with browser_pool.page() as page:
+                return await self._search(page, product_name)
         except Exception as e:
-            logger.error(f"Error running Amazon search: {e}")
-            return result
+            logger.error(f"Error searching Amazon: {e}")
+            if raise_errors:
+                raise
+            return AmazonSearchResult()
+
+    def _average_ms(self, selector: str) -> Optional[float]:
+        stats = self._selector_stats[selector]
+        return stats["total_ms"] / stats["matches"] if stats["matches"] else None
 
-        return self._search_sync(product_name)
+    def _ordered_selectors(self) -> List[str]:
+        """Product selectors, the ones that matched most often and fastest first."""
+        def rank(selector):
+            average = self._average_ms(selector)
+            return (-self._selector_stats[selector]["matches"], average if average is not None else float('inf'))
+        return sorted(PRODUCT_SELECTORS, key=rank)
 
-    async def search_by_name_async(self, product_name: str) -> AmazonSearchResult:
+    async def _wait_for_product(self, page: Page) -> Optional[ElementHandle]:
         """
-        Async version of search_by_name for use in async contexts.
-        Runs the sync Playwright code in a thread pool executor.
+        Wait for the first product card with an ASIN.
 
-        Args:
-            product_name: The product name to search for
+        Every product selector is waited for separately and at the same time,
+        so the search continues the moment any of them matches, within a
+        single AMAZON_RESULTS_TIMEOUT deadline. The selectors that matched
+        first are recorded with the time they took, the others are stopped.
+        When several match at once the card is taken from the most reliable.
 
         Returns:
-            AmazonSearchResult object with price and image_url (may be None if not found)
+            The first product card, or None if none appeared in time
         """
-        if not product_name:
-            logger.warning("Empty product name provided")
-            return AmazonSearchResult()
+        selectors = self._ordered_selectors()
+        started = time.monotonic()
 
-        try:
-            loop = asyncio.get_running_loop()
-            logger.info("Running Amazon search in thread pool (async)")
-            result = await loop.run_in_executor(_thread_pool, self._search_sync, product_name)
-            return result
-        except Exception as e:
-            logger.error(f"Error in async Amazon search: {e}")
-            return AmazonSearchResult()
+        async def wait(selector: str):
+            card = await page.wait_for_selector(_with_asin(selector), timeout=AMAZON_RESULTS_TIMEOUT * 1000)
+            return card, (time.monotonic() - started) * 1000
 
-    def _search_sync(self, product_name: str) -> AmazonSearchResult:
-        """Synchronous version of Amazon search using sync Playwright API."""
+        waits = {asyncio.ensure_future(wait(selector)): selector for selector in selectors}
+        pending = set(waits)
+        first_product = None
+        try:
+            while pending and first_product is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in sorted(done, key=lambda task: selectors.index(waits[task])):
+                    if isinstance(task.exception(), PlaywrightTimeoutError):
+                        continue
+                    card, elapsed_ms = task.result()
+                    if card is None:
+                        continue
+                    stats = self._selector_stats[waits[task]]
+                    stats["matches"] += 1
+                    stats["total_ms"] += elapsed_ms
+                    if first_product is None:
+                        first_product = card
+                        logger.info(f"Product cards ready after {elapsed_ms:.0f}ms")
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+        if first_product is None:
+            self._selector_timeouts += 1
+            logger.warning(f"No product card appeared within {AMAZON_RESULTS_TIMEOUT}s")
+        return first_product
+
+    def selector_stats(self) -> Dict[str, Any]:
+        """How often each product selector matched first and how fast, most reliable first."""
+        return {
+            "selectors": [
+                {
+                    "selector": selector,
+                    "matches": int(self._selector_stats[selector]["matches"]),
+                    "avg_ms": self._average_ms(selector),
+                }
+                for selector in self._ordered_selectors()
+            ],
+            "timeouts": self._selector_timeouts,
+        }
+
+    async def _search(self, page: Page, product_name: str) -> AmazonSearchResult:
+        """Run one search on a pooled page. Errors propagate so the page is not reused."""
         result = AmazonSearchResult()
         search_url = f"{self.base_url}/s?k={quote_plus(product_name)}"
 
+        logger.info(f"Searching Amazon for: {product_name}")
+
         try:
-            with sync_playwright() as p:
-                # Launch browser with anti-detection measures
-                browser = p.chromium.launch(
-                    headless=True,
-                    args=[
-                        '--disable-blink-features=AutomationControlled',
-                        '--no-sandbox',
-                        '--disable-dev-shm-usage',
-                    ]
-                )
-
-                context = browser.new_context(
-                    user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                    viewport={'width': 1920, 'height': 1080},
-                    locale='en-US',
-                    timezone_id='America/New_York'
-                )
-
-                # Set additional headers
-                context.set_extra_http_headers({
-                    'Accept-Language': 'en-US,en;q=0.9',
-                    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-                    'Accept-Encoding': 'gzip, deflate, br',
-                })
-
-                page = context.new_page()
-
-                logger.info(f"Searching Amazon for: {product_name}")
-
-                try:
-                    page.goto(search_url, wait_until='domcontentloaded', timeout=30000)
-                except PlaywrightTimeoutError:
-                    logger.warning("Amazon page load timed out, continuing anyway")
-
-                # Wait for search results to load
-                page.wait_for_timeout(3000)
-
-                # Try to find the first product result
-                # Amazon uses various selectors for product cards
-                product_selectors = [
-                    '[data-component-type="s-search-result"]',
-                    '.s-result-item[data-asin]',
-                    'div[data-component-type="s-search-result"]',
-                    '.s-result-item',
-                ]
-
-                first_product = None
-                for selector in product_selectors:
-                    try:
-                        page.wait_for_selector(selector, timeout=5000)
-                        # Get all matching elements and find the first valid one
-                        elements = page.query_selector_all(selector)
-                        for elem in elements:
-                            # Skip sponsored results if possible
-                            asin = elem.get_attribute('data-asin')
-                            if asin and asin != '':
-                                first_product = elem
-                                result.asin = asin
-                                logger.info(f"Found product with ASIN: {asin}")
-                                break
-                        if first_product:
-                            break
-                    except PlaywrightTimeoutError:
-                        continue
+            await page.goto(search_url, wait_until='domcontentloaded', timeout=30000)
+        except PlaywrightTimeoutError:
+            logger.warning("Amazon page load timed out, continuing anyway")
+
+        # Wait until any kind of product card is on the page
+        first_product = await self._wait_for_product(page)
+        if first_product is None:
+            logger.warning("No product found in Amazon search results")
+            return result
 
-                if not first_product:
-                    logger.warning("No product found in Amazon search results")
-                    browser.close()
-                    return result
-
-                # Extract price
-                price_selectors = [
-                    '.a-price .a-offscreen',
-                    'span.a-price-whole',
-                    '.a-price span[aria-hidden="true"]',
-                    'span[data-a-color="price"]',
-                    '.a-color-price',
-                ]
-
-                for price_sel in price_selectors:
-                    price_elem = first_product.query_selector(price_sel)
-                    if price_elem:
-                        price_text = price_elem.inner_text().strip()
-                        # Extract numeric value (e.g., "$12.99" -> 12.99 or "12 99" -> 12.99)
-                        price_match = re.search(r'[\$]?\s*(\d+)[.,\s]?(\d{0,2})', price_text)
-                        if price_match:
-                            dollars = price_match.group(1)
-                            cents = price_match.group(2) if price_match.group(2) else '00'
-                            # Pad cents to 2 digits
-                            cents = cents.ljust(2, '0')
-                            result.price = float(f"{dollars}.{cents}")
-                            logger.info(f"Found price: ${result.price}")
-                            break
-
-                # Extract image URL
-                img_selectors = [
-                    'img.s-image',
-                    'img[data-image-latency="s-product-image"]',
-                    '.s-product-image-container img',
-                    'img',
-                ]
-
-                for img_sel in img_selectors:
-                    img_elem = first_product.query_selector(img_sel)
-                    if img_elem:
-                        # Try different image attributes
-                        img_url = (img_elem.get_attribute('src') or
-                                  img_elem.get_attribute('data-src') or
-                                  img_elem.get_attribute('srcset'))
-
-                        if img_url:
-                            # If srcset, take the first URL
-                            if ',' in img_url:
-                                img_url = img_url.split(',')[0].strip().split(' ')[0]
-
-                            # Skip placeholder images
-                            if 'data:image' not in img_url and 'transparent-pixel' not in img_url:
-                                result.image_url = img_url
-                                logger.info(f"Found image URL: {img_url[:80]}...")
-                                break
-
-                # Extract title
-                title_selectors = [
-                    'h2 a span',
-                    'h2 span',
-                    '.a-size-medium.a-color-base.a-text-normal',
-                ]
-
-                for title_sel in title_selectors:
-                    title_elem = first_product.query_selector(title_sel)
-                    if title_elem:
-                        result.title = title_elem.inner_text().strip()
-                        logger.info(f"Found title: {result.title[:60]}...")
+        result.asin = await first_product.get_attribute('data-asin')
+        logger.info(f"Found product with ASIN: {result.asin}")
+
+        # Extract price
+        price_selectors = [
+            '.a-price .a-offscreen',
+            'span.a-price-whole',
+            '.a-price span[aria-hidden="true"]',
+            'span[data-a-color="price"]',
+            '.a-color-price',
+        ]
+
+        for price_sel in price_selectors:
+            price_elem = await first_product.query_selector(price_sel)
+            if price_elem:
+                price_text = (await price_elem.inner_text()).strip()
+                # Extract numeric value (e.g., "$12.99" -> 12.99 or "12 99" -> 12.99)
+                price_match = re.search(r'[\$]?\s*(\d+)[.,\s]?(\d{0,2})', price_text)
+                if price_match:
+                    dollars = price_match.group(1)
+                    cents = price_match.group(2) if price_match.group(2) else '00'
+                    # Pad cents to 2 digits
+                    cents = cents.ljust(2, '0')
+                    result.price = float(f"{dollars}.{cents}")
+                    logger.info(f"Found price: ${result.price}")
+                    break
+
+        # Extract image URL
+        img_selectors = [
+            'img.s-image',
+            'img[data-image-latency="s-product-image"]',
+            '.s-product-image-container img',
+            'img',
+        ]
+
+        for img_sel in img_selectors:
+            img_elem = await first_product.query_selector(img_sel)
+            if img_elem:
+                # Try different image attributes
+                img_url = (await img_elem.get_attribute('src') or
+                           await img_elem.get_attribute('data-src') or
+                           await img_elem.get_attribute('srcset'))
+
+                if img_url:
+                    # If srcset, take the first URL
+                    if ',' in img_url:
+                        img_url = img_url.split(',')[0].strip().split(' ')[0]
+
+                    # Skip placeholder images
+                    if 'data:image' not in img_url and 'transparent-pixel' not in img_url:
+                        result.image_url = img_url
+                        logger.info(f"Found image URL: {img_url[:80]}...")
                         break
 
-                # Extract product URL
-                link_elem = first_product.query_selector('h2 a, a.a-link-normal')
-                if link_elem:
-                    href = link_elem.get_attribute('href')
-                    if href:
-                        # Make URL absolute
-                        if href.startswith('/'):
-                            result.url = self.base_url + href
-                        else:
-                            result.url = href
-
-                browser.close()
-
-                if not result.price and not result.image_url:
-                    logger.warning("Could not extract price or image from Amazon result")
-
-                return result
-
-        except PlaywrightTimeoutError as e:
-            logger.error(f"Timeout while searching Amazon: {e}")
-            return result
-        except Exception as e:
-            logger.error(f"Error searching Amazon: {e}")
-            return result
+        # Extract title
+        title_selectors = [
+            'h2 a span',
+            'h2 span',
+            '.a-size-medium.a-color-base.a-text-normal',
+        ]
+
+        for title_sel in title_selectors:
+            title_elem = await first_product.query_selector(title_sel)
+            if title_elem:
+                result.title = (await title_elem.inner_text()).strip()
+                logger.info(f"Found title: {result.title[:60]}...")
+                break
+
+        # Extract product URL
+        link_elem = await first_product.query_selector('h2 a, a.a-link-normal')
+        if link_elem:
+            href = await link_elem.get_attribute('href')
+            if href:
+                # Make URL absolute
+                if href.startswith('/'):
+                    result.url = self.base_url + href
+                else:
+                    result.url = href
+
+        if not result.price and not result.image_url:
+            logger.warning("Could not extract price or image from Amazon result")
+
+        return result
 
 
 if __name__ == "__main__":
     # Test the AmazonUtil
-    import sys
-    import os
+    import asyncio
 
     # Enable logging
     logging.basicConfig(level=logging.INFO)
@@ -285,24 +294,29 @@ if __name__ == "__main__":
     # Test search
     test_products = ["goldfish crackers", "organic milk", "iPhone"]
 
-    for product in test_products:
-        print(f"\n{'='*60}")
-        print(f"Searching for: {product}")
-        print('='*60)
-
-        result = amazon.search_by_name(product)
-
-        if result.price or result.image_url:
-            print(f"✓ Result found:")
-            if result.title:
-                print(f"  Title: {result.title}")
-            if result.price:
-                print(f"  Price: ${result.price}")
-            if result.image_url:
-                print(f"  Image: {result.image_url[:100]}...")
-            if result.asin:
-                print(f"  ASIN: {result.asin}")
-            if result.url:
-                print(f"  URL: {result.url[:100]}...")
-        else:
-            print("✗ No result found")
+    async def run():
+        for product in test_products:
+            print(f"\n{'='*60}")
+            print(f"Searching for: {product}")
+            print('='*60)
+
+            result = await amazon.search_by_name_async(product)
+
+            if result.price or result.image_url:
+                print(f"✓ Result found:")
+                if result.title:
+                    print(f"  Title: {result.title}")
+                if result.price:
+                    print(f"  Price: ${result.price}")
+                if result.image_url:
+                    print(f"  Image: {result.image_url[:100]}...")
+                if result.asin:
+                    print(f"  ASIN: {result.asin}")
+                if result.url:
+                    print(f"  URL: {result.url[:100]}...")
+            else:
+                print("✗ No result found")
+
+        await browser_pool.close()
+
+    asyncio.run(run())
@@ -1,10 +1,28 @@
-import requests
-from typing import Optional, Dict, Any, List
+import httpx
+from typing import Optional, Dict, Any
 import logging
+import os
+
+try:
+    from util.httpClient import http_client
+    from util.lookupErrors import ProviderUnavailableError
+    from util.providerRegistry import provider_registry
+except ImportError:
+    from .httpClient import http_client
+    from .lookupErrors import ProviderUnavailableError
+    from .providerRegistry import provider_registry
 
 logger = logging.getLogger(__name__)
 
 
+# 'hedged' queries Open Library and Google Books at the same time,
+# 'sequential' only asks Google Books once Open Library has no answer
+BOOK_LOOKUP_MODE = os.environ.get('BOOK_LOOKUP_MODE', 'hedged')
+
+# Seconds a hedged lookup waits for Open Library before taking the first answer
+BOOK_LOOKUP_GRACE = float(os.environ.get('BOOK_LOOKUP_GRACE', '0.5'))
+
+
 class BookLookup:
     """
     Utility class for looking up books using ISBN/UPC.
@@ -12,49 +30,65 @@ class BookLookup:
     with Google Books API as fallback.
     """
 
-    def __init__(self):
+    def __init__(self, mode: str = 'hedged', grace: float = 0.5):
+        """
+        Args:
+            mode: 'hedged' or 'sequential', see BOOK_LOOKUP_MODE
+            grace: Seconds to wait for the preferred source in hedged mode
+        """
         self.openlibrary_url = "https://openlibrary.org/api/books"
         self.google_books_url = "https://www.googleapis.com/books/v1/volumes"
         self.headers = {
             'User-Agent': 'IzzyMart/1.0 (Book Lookup Service)',
         }
+        self.mode = mode
+        self.grace = grace
 
-    def lookup_by_isbn(self, isbn: str) -> Optional[Dict[str, Any]]:
+    async def lookup_by_isbn(self, isbn: str, deadline: Optional[float] = None) -> Optional[Dict[str, Any]]:
         """
-        Look up a book by ISBN using Open Library first, then Google Books as fallback.
+        Look up a book by ISBN, preferring Open Library over Google Books.
+
+        Both sources are registered as 'book' providers. In hedged mode both
+        are queried at once. Open Library's answer is taken if it arrives
+        within the grace window, otherwise the first book found by either
+        source, and the other request is cancelled. A scan then waits for the
+        fastest source instead of both in a row. A source whose circuit is
+        open is skipped.
 
         Args:
             isbn: ISBN-10 or ISBN-13 number
+            deadline: Event loop time by which the answer is needed, see provider_registry.deadline
 
         Returns:
-            Complete book information dictionary or None
+            Complete book information dictionary, or None if no source knows the ISBN
+
+        Raises:
+            ProviderUnavailableError: If the book was not found and at least one
+                source could not be queried, so the result is not a definitive miss
         """
         try:
             logger.info(f"Looking up ISBN {isbn}")
-
-            # Try Open Library first (free, no key required)
-            book_data = self._lookup_openlibrary(isbn)
-
-            if book_data:
-                logger.info(f"Book found in Open Library: {book_data.get('name')}")
-                return book_data
-
-            # Fallback to Google Books
-            logger.info("Book not found in Open Library, trying Google Books...")
-            book_data = self._lookup_google_books(isbn)
-
-            if book_data:
-                logger.info(f"Book found in Google Books: {book_data.get('name')}")
-                return book_data
-
-            logger.warning(f"Book not found in any source for ISBN: {isbn}")
-            return None
-
+            source, book_data = await provider_registry.lookup(
+                'book',
+                isbn,
+                deadline=deadline,
+                hedged=self.mode != 'sequential',
+                grace=self.grace
+            )
+        except ProviderUnavailableError:
+            raise
         except Exception as e:
             logger.error(f"Unexpected error in book lookup: {str(e)}")
-            return None
+            raise ProviderUnavailableError('books', str(e))
 
-    def _lookup_openlibrary(self, isbn: str) -> Optional[Dict[str, Any]]:
+        if book_data:
+            logger.info(f"Book found in {source}: {book_data.get('name')}")
+            return book_data
+
+        logger.warning(f"Book not found in any source for ISBN: {isbn}")
+        return None
+
+    async def _lookup_openlibrary(self, isbn: str) -> Optional[Dict[str, Any]]:
         """
         Look up a book using Open Library API.
 
@@ -62,16 +96,19 @@ class BookLookup:
             isbn: ISBN number
 
         Returns:
-            Book information dictionary or None
+            Book information dictionary or None if not found
+
+        Raises:
+            ProviderUnavailableError: If Open Library could not be queried
         """
         try:
             # Open Library API: https://openlibrary.org/dev/docs/api/books
             url = f"{self.openlibrary_url}?bibkeys=ISBN:{isbn}&format=json&jscmd=data"
-            response = requests.get(url, headers=self.headers, timeout=10)
+            response = await http_client.get(url, headers=self.headers)
 
             if response.status_code != 200:
                 logger.warning(f"Open Library returned status {response.status_code} for ISBN {isbn}")
-                return None
+                raise ProviderUnavailableError('openlibrary', f"HTTP {response.status_code}")
 
             data = response.json()
             key = f"ISBN:{isbn}"
@@ -83,14 +120,16 @@ class BookLookup:
             book = data[key]
             return self._extract_openlibrary_data(book, isbn)
 
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             logger.error(f"Error fetching from Open Library for ISBN {isbn}: {str(e)}")
-            return None
+            raise ProviderUnavailableError('openlibrary', str(e))
+        except ProviderUnavailableError:
+            raise
         except Exception as e:
             logger.error(f"Error parsing Open Library response: {str(e)}")
-            return None
+            raise ProviderUnavailableError('openlibrary', str(e))
 
-    def _lookup_google_books(self, isbn: str) -> Optional[Dict[str, Any]]:
+    async def _lookup_google_books(self, isbn: str) -> Optional[Dict[str, Any]]:
         """
         Look up a book using Google Books API.
 
@@ -98,16 +137,19 @@ class BookLookup:
             isbn: ISBN number
 
         Returns:
-            Book information dictionary or None
+            Book information dictionary or None if not found
+
+        Raises:
+            ProviderUnavailableError: If Google Books could not be queried
         """
         try:
             # Google Books API: https://developers.google.com/books/docs/v1/using
             url = f"{self.google_books_url}?q=isbn:{isbn}"
-            response = requests.get(url, headers=self.headers, timeout=10)
+            response = await http_client.get(url, headers=self.headers)
 
             if response.status_code != 200:
                 logger.warning(f"Google Books returned status {response.status_code} for ISBN {isbn}")
-                return None
+                raise ProviderUnavailableError('googlebooks', f"HTTP {response.status_code}")
 
             data = response.json()
 
@@ -119,12 +161,14 @@ class BookLookup:
             book = data['items'][0]
             return self._extract_google_books_data(book, isbn)
 
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             logger.error(f"Error fetching from Google Books for ISBN {isbn}: {str(e)}")
-            return None
+            raise ProviderUnavailableError('googlebooks', str(e))
+        except ProviderUnavailableError:
+            raise
         except Exception as e:
             logger.error(f"Error parsing Google Books response: {str(e)}")
-            return None
+            raise ProviderUnavailableError('googlebooks', str(e))
 
     def _extract_openlibrary_data(self, book: Dict, isbn: str) -> Dict[str, Any]:
         """Extract and format book data from Open Library response."""
@@ -245,17 +289,25 @@ class BookLookup:
 
 
 # Global instance
-book_lookup = BookLookup()
+book_lookup = BookLookup(mode=BOOK_LOOKUP_MODE, grace=BOOK_LOOKUP_GRACE)
 
+# In order of preference
+provider_registry.register('openlibrary', ('book',), book_lookup._lookup_openlibrary, timeout=10)
+provider_registry.register('googlebooks', ('book',), book_lookup._lookup_google_books, timeout=10)
 
-def lookup_book_by_isbn(isbn: str) -> Optional[Dict[str, Any]]:
+
+async def lookup_book_by_isbn(isbn: str, deadline: Optional[float] = None) -> Optional[Dict[str, Any]]:
     """
     Convenience function to lookup a book by ISBN.
 
     Args:
         isbn: ISBN-10 or ISBN-13 number
+        deadline: Event loop time by which the answer is needed
 
     Returns:
         Complete book information or None
+
+    Raises:
+        ProviderUnavailableError: If no definitive answer could be obtained
     """
-    return book_lookup.lookup_by_isbn(isbn)
+    return await book_lookup.lookup_by_isbn(isbn, deadline)
@@ -1,11 +1,19 @@
-import requests
+import httpx
 from typing import Optional, Dict, Any, List
 import logging
 
 try:
-    from util.AmazonUtil import AmazonUtil
+    from util.AmazonUtil import AmazonUtil, AmazonSearchResult
+    from util.amazonResultCache import amazon_result_cache
+    from util.httpClient import http_client
+    from util.lookupErrors import ProviderUnavailableError
+    from util.providerRegistry import provider_registry
 except ImportError:
-    from .AmazonUtil import AmazonUtil
+    from .AmazonUtil import AmazonUtil, AmazonSearchResult
+    from .amazonResultCache import amazon_result_cache
+    from .httpClient import http_client
+    from .lookupErrors import ProviderUnavailableError
+    from .providerRegistry import provider_registry
 
 
 logger = logging.getLogger(__name__)
@@ -25,122 +33,138 @@ class OpenFoodFactsLookup:
 
         self.amazon_util = AmazonUtil()
 
-    def lookup_by_upc(self, upc: str, include_stores: bool = True) -> Optional[Dict[str, Any]]:
+    async def lookup_by_upc_async(
+        self,
+        upc: str,
+        include_stores: bool = True,
+        deadline: Optional[float] = None
+    ) -> Optional[Dict[str, Any]]:
         """
-        Look up a product by UPC using Open Food Facts.
+        Look up a product by UPC with the 'food' providers (Open Food Facts).
         Optionally search stores for pricing and availability.
 
         Args:
             upc: Universal Product Code
             include_stores: Whether to search stores for additional info
+            deadline: Event loop time by which the answer is needed, see provider_registry.deadline
 
         Returns:
-            Complete product information dictionary or None
+            Complete product information dictionary, or None if Open Food Facts
+            does not know the UPC
+
+        Raises:
+            ProviderUnavailableError: If Open Food Facts could not be reached,
+                returned an error or is skipped by its circuit breaker, so the
+                caller does not treat it as a miss
         """
         try:
-            logger.info(f"Looking up UPC {upc} on Open Food Facts")
-
-            # Query Open Food Facts API
-            url = f"{self.base_url}/product/{upc}.json"
-            response = requests.get(url, headers=self.headers, timeout=10)
-
-            if response.status_code != 200:
-                logger.warning(f"Open Food Facts returned status {response.status_code} for UPC {upc}")
-                return None
-
-            data = response.json()
+            logger.info(f"Looking up UPC {upc} on Open Food Facts (async)")
 
-            if data.get('status') != 1:
-                logger.warning(f"Product not found in Open Food Facts: {upc}")
+            _, product_data = await provider_registry.lookup('food', upc, deadline=deadline)
+            if product_data is None:
                 return None
 
-            # Extract product information
-            product_data = self._extract_product_data(data.get('product', {}), upc)
-
             # Only search Amazon if include_stores is True
+            if include_stores:
+                amazonResults = await self.search_stores_async(product_data, deadline)
 
-            amazonResults = self.amazon_util.search_by_name(product_data['name'])
+                # Use Amazon price if found, otherwise set a default
+                if amazonResults.price is not None:
+                    product_data['price'] = amazonResults.price
+                else:
+                    product_data['price'] = 4.04  # Default price when not found
 
-            # Use Amazon price if found, otherwise set a default
-            if amazonResults.price is not None:
-                product_data['price'] = amazonResults.price
+                # Use Amazon image if found and we don't already have one
+                if amazonResults.image_url is not None:
+                    product_data['image_url'] = amazonResults.image_url
             else:
-                product_data['price'] = 4.04  # Default price when not found
-
-            # Use Amazon image if found and we don't already have one
-            if amazonResults.image_url is not None:
-                product_data['image_url'] = amazonResults.image_url
-
+                # Set default price when not using store lookups
+                product_data['price'] = 4.04
 
             return product_data
 
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Error fetching from Open Food Facts for UPC {upc}: {str(e)}")
-            return None
+        except ProviderUnavailableError:
+            raise
         except Exception as e:
-            logger.error(f"Unexpected error in Open Food Facts lookup: {str(e)}")
-            return None
+            logger.error(f"Unexpected error in Open Food Facts lookup (async): {str(e)}")
+            raise ProviderUnavailableError('openfoodfacts', str(e))
 
-    async def lookup_by_upc_async(self, upc: str, include_stores: bool = True) -> Optional[Dict[str, Any]]:
+    async def _fetch_product(self, upc: str) -> Optional[Dict[str, Any]]:
         """
-        Async version of lookup_by_upc for use in FastAPI and other async contexts.
+        Fetch a product from the Open Food Facts API, the 'openfoodfacts' provider.
 
         Args:
             upc: Universal Product Code
-            include_stores: Whether to search stores for additional info
 
         Returns:
-            Complete product information dictionary or None
+            Product information without store data, or None if Open Food Facts
+            does not know the UPC
+
+        Raises:
+            ProviderUnavailableError: If Open Food Facts could not be reached or
+                returned an error
         """
         try:
-            logger.info(f"Looking up UPC {upc} on Open Food Facts (async)")
-
-            # Query Open Food Facts API
             url = f"{self.base_url}/product/{upc}.json"
-            response = requests.get(url, headers=self.headers, timeout=10)
+            response = await http_client.get(url, headers=self.headers)
+        except httpx.HTTPError as e:
+            logger.error(f"Error fetching from Open Food Facts for UPC {upc}: {str(e)}")
+            raise ProviderUnavailableError('openfoodfacts', str(e))
 
-            if response.status_code != 200:
-                logger.warning(f"Open Food Facts returned status {response.status_code} for UPC {upc}")
-                return None
+        if response.status_code == 404:
+            logger.warning(f"Product not found in Open Food Facts: {upc}")
+            return None
 
-            data = response.json()
+        if response.status_code != 200:
+            logger.warning(f"Open Food Facts returned status {response.status_code} for UPC {upc}")
+            raise ProviderUnavailableError('openfoodfacts', f"HTTP {response.status_code}")
 
-            if data.get('status') != 1:
-                logger.warning(f"Product not found in Open Food Facts: {upc}")
-                return None
+        data = response.json()
 
-            # Extract product information
-            product_data = self._extract_product_data(data.get('product', {}), upc)
+        if data.get('status') != 1:
+            logger.warning(f"Product not found in Open Food Facts: {upc}")
+            return None
 
-            # Only search Amazon if include_stores is True
-            if include_stores:
-                # Use async version of Amazon search
+        return self._extract_product_data(data.get('product', {}), upc)
 
-                search_name = product_data['brand'] + " " + product_data['name']
+    async def _search_amazon(self, query: str) -> Optional[AmazonSearchResult]:
+        """Search Amazon, the 'amazon' provider. None if the search found nothing."""
+        result = await self.amazon_util.search_by_name_async(query, raise_errors=True)
+        return None if result.empty else result
 
-                amazonResults = await self.amazon_util.search_by_name_async(search_name)
+    async def search_stores_async(self, product_data: Dict[str, Any], deadline: Optional[float] = None) -> AmazonSearchResult:
+        """
+        Search the stores (the 'price' providers) for the price and image of
+        a product found on Open Food Facts.
 
-                # Use Amazon price if found, otherwise set a default
-                if amazonResults.price is not None:
-                    product_data['price'] = amazonResults.price
-                else:
-                    product_data['price'] = 4.04  # Default price when not found
+        Results are cached by the normalized brand and name, so another size
+        of the same product or a repeat lookup does not search Amazon again.
 
-                # Use Amazon image if found and we don't already have one
-                if amazonResults.image_url is not None:
-                    product_data['image_url'] = amazonResults.image_url
-            else:
-                # Set default price when not using store lookups
-                product_data['price'] = 4.04
+        Args:
+            product_data: Product information returned by lookup_by_upc_async
+            deadline: Event loop time by which the answer is needed, None for
+                the store providers' own timeouts only
 
-            return product_data
+        Returns:
+            Amazon search result, empty if nothing was found or the search failed
+        """
+        search_name = " ".join(part for part in (product_data.get('brand'), product_data.get('name')) if part)
+        if not search_name:
+            return AmazonSearchResult()
 
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Error fetching from Open Food Facts for UPC {upc}: {str(e)}")
-            return None
+        async def search(query: str, deadline: Optional[float] = deadline) -> AmazonSearchResult:
+            _, result = await provider_registry.lookup('price', query, deadline=deadline)
+            return result or AmazonSearchResult()
+
+        async def refresh(query: str) -> AmazonSearchResult:
+            # A refresh of a stale price runs after this lookup answered, with a budget of its own
+            return await search(query, provider_registry.deadline())
+
+        try:
+            return await amazon_result_cache.search(search_name, search, refresh)
         except Exception as e:
-            logger.error(f"Unexpected error in Open Food Facts lookup (async): {str(e)}")
-            return None
+            logger.error(f"Store search failed for '{search_name}': {str(e)}")
+            return AmazonSearchResult()
 
     def _extract_product_data(self, product: Dict, upc: str) -> Dict[str, Any]:
         """Extract and format product data from Open Food Facts response."""
@@ -219,22 +243,10 @@ class OpenFoodFactsLookup:
 
         return nutrition
 
-    
-
 
 # Global instance
 openfoodfacts_lookup = OpenFoodFactsLookup()
 
-
-def lookup_product_by_upc(upc: str, include_stores: bool = True) -> Optional[Dict[str, Any]]:
-    """
-    Convenience function to lookup a product by UPC using Open Food Facts.
-
-    Args:
-        upc: Universal Product Code
-        include_stores: Whether to search stores for pricing info
-
-    Returns:
-        Complete product information or None
-    """
-    return openfoodfacts_lookup.lookup_by_upc(upc, include_stores=include_stores)
+provider_registry.register('openfoodfacts', ('food',), openfoodfacts_lookup._fetch_product, timeout=10)
+# A search loads a full results page in a browser
+provider_registry.register('amazon', ('price',), openfoodfacts_lookup._search_amazon, timeout=30, max_concurrency=4)
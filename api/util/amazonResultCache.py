@@ -0,0 +1,263 @@
+"""
+Cache of Amazon search results keyed by the normalized search query.
+
+A store search drives a browser through a full Amazon results page and
+takes seconds, while the same brand and name are searched again and again
+(size variants of one product, re-lookups of a UPC). Results are stored in
+the ``amazon_results`` collection, with a TTL index on ``expires_at``
+(declared in config/indexes.py), so they survive restarts and are shared by
+every API replica. Recent results are also memoized in process, so a repeat
+search costs a dictionary lookup.
+
+Images, titles and ASINs hardly change, prices do. Results are kept for
+AMAZON_CACHE_TTL seconds, but once a result is older than
+AMAZON_PRICE_MAX_AGE its price counts as stale and AMAZON_STALE_PRICE
+decides what happens:
+
+    revalidate  answer with the cached result and search again in the background
+    refresh     search again before answering
+    serve       answer with the cached result until it expires
+
+Searches that found nothing are kept for AMAZON_CACHE_EMPTY_TTL seconds
+only, and failed searches are never stored.
+"""
+import asyncio
+from datetime import datetime, timedelta
+import logging
+import os
+import re
+import unicodedata
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+from config.db import db
+from util.AmazonUtil import AmazonSearchResult
+from util.lruCache import LruTtlCache
+from util.singleFlight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+
+# Seconds a search result is kept, and a search that found nothing
+AMAZON_CACHE_TTL = float(os.environ.get('AMAZON_CACHE_TTL', str(30 * 86400)))
+AMAZON_CACHE_EMPTY_TTL = float(os.environ.get('AMAZON_CACHE_EMPTY_TTL', '21600'))
+
+# Seconds after which the price of a cached result is stale, and what to do then
+AMAZON_PRICE_MAX_AGE = float(os.environ.get('AMAZON_PRICE_MAX_AGE', '86400'))
+AMAZON_STALE_PRICE = os.environ.get('AMAZON_STALE_PRICE', 'revalidate')
+
+STALE_PRICE_POLICIES = ("revalidate", "refresh", "serve")
+
+_APOSTROPHES = re.compile(r"['’]")
+_SEPARATORS = re.compile(r"[^\w]+")
+
+
+def normalize_query(query: str) -> str:
+    """
+    Cache key of a search query.
+
+    Case, compatibility forms (full width letters, ligatures), apostrophes,
+    punctuation and whitespace do not change what Amazon finds, so
+    "Kellogg's Corn-Flakes" and "kelloggs  corn flakes" share an entry. The
+    words keep their order and count, "pack of 2 x 2" is not "pack of 2 x".
+    """
+    text = _APOSTROPHES.sub("", unicodedata.normalize("NFKC", query).casefold())
+    words = [word for word in _SEPARATORS.split(text.replace("_", " ")) if word]
+    return " ".join(words)
+
+
+class AmazonResultCache:
+    """
+    Mongo backed cache of Amazon search results, see the module docstring.
+    """
+
+    def __init__(
+        self,
+        collection,
+        ttl: float = 30 * 86400,
+        empty_ttl: float = 21600,
+        price_max_age: float = 86400,
+        stale_price: str = "revalidate",
+        memo_size: int = 10000,
+        memo_ttl: float = 300
+    ):
+        """
+        Args:
+            collection: MongoDB collection holding the results
+            ttl: Seconds a search result is kept
+            empty_ttl: Seconds a search that found nothing is kept
+            price_max_age: Seconds after which the price of a result is stale
+            stale_price: 'revalidate', 'refresh' or 'serve', see the module docstring
+            memo_size: Maximum number of results memoized in process
+            memo_ttl: Seconds a result is memoized in process before Mongo is checked again
+        """
+        if stale_price not in STALE_PRICE_POLICIES:
+            raise ValueError(f"Unknown stale price policy: {stale_price}")
+        self.collection = collection
+        self.ttl = ttl
+        self.empty_ttl = empty_ttl
+        self.price_max_age = price_max_age
+        self.stale_price = stale_price
+        self.memo = LruTtlCache(max_size=memo_size, ttl=memo_ttl)
+        self._flights = SingleFlight()
+        self._revalidations: Set[asyncio.Task] = set()
+        self._hits = 0
+        self._misses = 0
+        self._stale = 0
+
+    async def _get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self.memo.get(key)
+        if entry is not None:
+            return entry
+
+        now = datetime.utcnow()
+        entry = await self.collection.find_one(
+            {"_id": key, "expires_at": {"$gt": now}},
+            {"result": 1, "fetched_at": 1, "expires_at": 1}
+        )
+        if entry is None:
+            return None
+
+        remaining = (entry["expires_at"] - now).total_seconds()
+        self.memo.set(key, entry, ttl=min(self.memo.ttl, remaining))
+        return entry
+
+    async def _store(self, key: str, query: str, result: AmazonSearchResult) -> Dict[str, Any]:
+        now = datetime.utcnow()
+        entry = {
+            "_id": key,
+            "query": query,
+            "result": result.to_dict(),
+            "fetched_at": now,
+            "expires_at": now + timedelta(seconds=self.empty_ttl if result.empty else self.ttl),
+        }
+        await self.collection.replace_one({"_id": key}, entry, upsert=True)
+        self.memo.set(key, entry, ttl=min(self.memo.ttl, (entry["expires_at"] - now).total_seconds()))
+        return entry
+
+    def _price_is_stale(self, entry: Dict[str, Any]) -> bool:
+        age = (datetime.utcnow() - entry["fetched_at"]).total_seconds()
+        return age > self.price_max_age and not AmazonSearchResult.from_dict(entry["result"]).empty
+
+    async def search(
+        self,
+        query: str,
+        fetch: Callable[[str], Awaitable[AmazonSearchResult]],
+        background_fetch: Optional[Callable[[str], Awaitable[AmazonSearchResult]]] = None
+    ) -> AmazonSearchResult:
+        """
+        Answer a search from the cache, searching only when needed.
+
+        Args:
+            query: Search text as it would be sent to Amazon
+            fetch: Runs the search, raising if it failed
+            background_fetch: Runs the background search of a stale result
+                (default: fetch). It outlives the caller, so it must not be
+                bound to the caller's deadline.
+
+        Returns:
+            The cached or fresh search result
+
+        Raises:
+            Exception: Whatever fetch raised, if there is no cached result to fall back to
+        """
+        key = normalize_query(query)
+        entry = await self._get(key)
+
+        if entry is not None:
+            if not self._price_is_stale(entry) or self.stale_price == "serve":
+                self._hits += 1
+                return AmazonSearchResult.from_dict(entry["result"])
+
+            self._stale += 1
+            if self.stale_price == "revalidate":
+                self._revalidate(key, query, background_fetch or fetch, entry)
+                return AmazonSearchResult.from_dict(entry["result"])
+        else:
+            self._misses += 1
+
+        # Concurrent searches for the same product share one browser search
+        entry = await self._flights.do(key, lambda: self._fetch(key, query, fetch, entry))
+        return AmazonSearchResult.from_dict(entry["result"])
+
+    async def _fetch(
+        self,
+        key: str,
+        query: str,
+        fetch: Callable[[str], Awaitable[AmazonSearchResult]],
+        stale: Optional[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        try:
+            result = await fetch(query)
+        except Exception as e:
+            if stale is None:
+                raise
+            logger.warning(f"Amazon search for '{query}' failed, keeping the cached result: {str(e)}")
+            return stale
+
+        if result.empty and stale is not None and not AmazonSearchResult.from_dict(stale["result"]).empty:
+            # One empty results page does not outweigh a result that was found before
+            logger.warning(f"Amazon search for '{query}' found nothing, keeping the cached result")
+            return stale
+
+        return await self._store(key, query, result)
+
+    def _revalidate(
+        self,
+        key: str,
+        query: str,
+        fetch: Callable[[str], Awaitable[AmazonSearchResult]],
+        stale: Dict[str, Any]
+    ):
+        """Search again in the background, the caller is answered from the cache."""
+        async def run():
+            try:
+                await self._flights.do(key, lambda: self._fetch(key, query, fetch, stale))
+            except Exception as e:
+                logger.error(f"Background Amazon search for '{query}' failed: {str(e)}")
+
+        # Keep a reference, the event loop only holds tasks weakly
+        task = asyncio.ensure_future(run())
+        self._revalidations.add(task)
+        task.add_done_callback(self._revalidations.discard)
+
+    async def purge(self, query: Optional[str] = None) -> int:
+        """
+        Forget cached results.
+
+        Args:
+            query: Only purge the result of this search text
+
+        Returns:
+            Number of results removed from MongoDB
+        """
+        selector: Dict[str, Any] = {} if query is None else {"_id": normalize_query(query)}
+        result = await self.collection.delete_many(selector)
+        self.memo.clear()
+        return result.deleted_count
+
+    async def stats(self) -> Dict[str, Any]:
+        """Return the number of stored results, the hit counters and the in-process memo counters."""
+        return {
+            "ttl": self.ttl,
+            "empty_ttl": self.empty_ttl,
+            "price_max_age": self.price_max_age,
+            "stale_price": self.stale_price,
+            "stored": await self.collection.count_documents({}),
+            "hits": self._hits,
+            "misses": self._misses,
+            "stale": self._stale,
+            "revalidating": len(self._revalidations),
+            "searches": self._flights.stats(),
+            "memo": self.memo.stats(),
+        }
+
+
+# Global instance
+amazon_result_cache = AmazonResultCache(
+    db.amazon_results,
+    ttl=AMAZON_CACHE_TTL,
+    empty_ttl=AMAZON_CACHE_EMPTY_TTL,
+    price_max_age=AMAZON_PRICE_MAX_AGE,
+    stale_price=AMAZON_STALE_PRICE,
+    memo_ttl=float(os.environ.get('AMAZON_CACHE_MEMO_TTL', '300'))
+)
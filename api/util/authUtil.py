@@ -14,6 +14,8 @@ from config.db import db
 from api.users.userModels import UserModel
 
 from util.configUtil import getConfiguration
+from util.changeWatcher import change_watcher
+from util.lruCache import LruTtlCache
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
@@ -21,6 +23,13 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 default_root_passwd = os.getenv('ROOT_PASSWD', 'root')
 
+# Users by username, only used while the change watcher invalidates it
+_user_cache = LruTtlCache(
+    max_size=int(os.environ.get('USER_CACHE_SIZE', '1000')),
+    ttl=float(os.environ.get('USER_CACHE_TTL', '60'))
+)
+_user_generation = 0
+
 
 role_hierarchy = {
     "root":100,
@@ -41,8 +50,8 @@ class TokenData(BaseModel):
     username: str | None = None
 
 
-def checkAndCreateAdmin():
-    if db.users.count_documents({}) == 0:
+async def checkAndCreateAdmin():
+    if await db.users.count_documents({}) == 0:
         # Bcrypt has a 72-byte limit, truncate the password bytes if necessary
         passwd_bytes = default_root_passwd.encode('utf-8')
         if len(passwd_bytes) > 72:
@@ -57,30 +66,49 @@ def checkAndCreateAdmin():
             "password": pwd_context.hash(passwd_to_hash),
         }
 
-        db.users.insert_one(newUser)
+        await db.users.insert_one(newUser)
+
 
+async def get_user( username: str):
+    if change_watcher.running:
+        cached = _user_cache.get(username)
+        if cached is not None:
+            return cached.model_copy()
 
-def get_user( username: str):
-    user = db.users.find_one({"username": username})
+    generation = _user_generation
+    user = await db.users.find_one({"username": username})
     
     if user is not None:
         user_dict = serializeDict(user)
-        return UserModel(**user_dict)
+        user = UserModel(**user_dict)
+        # Not cached if a user changed while it was read
+        if change_watcher.running and generation == _user_generation:
+            _user_cache.set(username, user.model_copy())
+        return user
+
+
+async def _users_changed(event):
+    """Drop the cached users when any replica writes one."""
+    global _user_generation
+    _user_generation += 1
+    _user_cache.clear()
+
+change_watcher.subscribe('users', _users_changed)
 
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
-def authenticate_user(username: str, password: str):
-    user = get_user( username)
+async def authenticate_user(username: str, password: str):
+    user = await get_user( username)
     if not user:
         return False
     if not verify_password(password, user.password):
         return False
     return user
 
-def create_access_token(data: dict, expires_delta: timedelta | None = None, expires : datetime | None = None):
+async def create_access_token(data: dict, expires_delta: timedelta | None = None, expires : datetime | None = None):
     to_encode = data.copy()
-    currentConfig = getConfiguration()
+    currentConfig = await getConfiguration()
 
     expire = None
 
@@ -93,7 +121,7 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None, expi
     encoded_jwt = jwt.encode(to_encode, currentConfig['secret_key'], algorithm= currentConfig['algorithm'])
     return encoded_jwt
 
-def get_token_user(token: Annotated[str, Depends(oauth2_scheme)]):
+async def get_token_user(token: Annotated[str, Depends(oauth2_scheme)]):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -102,7 +130,7 @@ def get_token_user(token: Annotated[str, Depends(oauth2_scheme)]):
 
     
 
-    currentConfig = getConfiguration()
+    currentConfig = await getConfiguration()
 
     try:
         payload = jwt.decode(token, currentConfig['secret_key'], algorithms=[currentConfig['algorithm'] ])
@@ -113,7 +141,7 @@ def get_token_user(token: Annotated[str, Depends(oauth2_scheme)]):
         token_data = TokenData(username=username)
     except JWTError:
         raise credentials_exception
-    user = get_user( username=token_data.username)
+    user = await get_user( username=token_data.username)
     if user is None:
         raise credentials_exception
     return user
@@ -124,7 +152,7 @@ def get_token_user(token: Annotated[str, Depends(oauth2_scheme)]):
 
 def get_current_user( role: Optional[str] = None):
 
-    def role_checker(token: Annotated[str, Depends(oauth2_scheme)]):
+    async def role_checker(token: Annotated[str, Depends(oauth2_scheme)]):
     
 
         user = None
@@ -134,11 +162,11 @@ def get_current_user( role: Optional[str] = None):
             requiredLevel = role_hierarchy[role]
 
         #If there are no users, then behave as admin
-        if db.users.count_documents({}) == 1:
-            resp = db.users.find_one()
+        if await db.users.count_documents({}) == 1:
+            resp = await db.users.find_one()
             user = UserModel(**resp)
         else:
-            user = get_token_user(token)
+            user = await get_token_user(token)
 
         level = role_hierarchy[user.role]
 
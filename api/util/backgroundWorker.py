@@ -0,0 +1,85 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundWorker:
+    """
+    Runs coroutine functions on a fixed number of worker tasks, outside of
+    the request that submitted them.
+
+    The queue lives in process memory, so work that must survive a restart
+    has to be recorded somewhere durable (e.g. a status field on the
+    document) and submitted again on startup.
+    """
+
+    def __init__(self, name: str, concurrency: int = 2, max_queue: int = 1000):
+        """
+        Args:
+            name: Name used in log messages
+            concurrency: Number of jobs run at the same time
+            max_queue: Jobs waiting to run before submit starts refusing new ones
+        """
+        self.name = name
+        self.concurrency = concurrency
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self._tasks: List[asyncio.Task] = []
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+
+    def start(self):
+        """Start the worker tasks. Must be called from the running event loop."""
+        if self._tasks:
+            return
+        self._tasks = [asyncio.create_task(self._run()) for _ in range(self.concurrency)]
+        logger.info(f"Started {self.concurrency} {self.name} workers")
+
+    async def stop(self):
+        """Cancel the worker tasks. Jobs still queued are dropped."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, fn: Callable[..., Awaitable[Any]], *args) -> bool:
+        """
+        Queue a job.
+
+        Args:
+            fn: Coroutine function to run
+            args: Arguments passed to fn
+
+        Returns:
+            False if the queue is full and the job was dropped
+        """
+        try:
+            self._queue.put_nowait((fn, args))
+            return True
+        except asyncio.QueueFull:
+            self._rejected += 1
+            logger.warning(f"{self.name} queue is full, dropping job")
+            return False
+
+    async def _run(self):
+        while True:
+            fn, args = await self._queue.get()
+            try:
+                await fn(*args)
+                self._completed += 1
+            except Exception as e:
+                self._failed += 1
+                logger.error(f"{self.name} job failed: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "workers": len(self._tasks),
+            "queued": self._queue.qsize(),
+            "completed": self._completed,
+            "failed": self._failed,
+            "rejected": self._rejected,
+        }
@@ -0,0 +1,303 @@
+"""
+Pool of long-lived headless Chromium browsers for scraping pages.
+
+Launching Chromium takes seconds and hundreds of MB, so browsers are
+started once and kept. Pages are handed out with
+``async with browser_pool.page() as page:``, each in a context of its own
+that is closed when the page comes back, so a search costs a new context
+and a page navigation instead of a launch, and no cookies or storage carry
+over from one search to the next.
+
+Browsers are recycled after BROWSER_MAX_USES pages were handed out or when
+their processes use more than BROWSER_MAX_MEMORY_MB, and a background
+health check replaces browsers that crashed or stopped answering.
+"""
+import asyncio
+import contextlib
+import logging
+import os
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from playwright.async_api import async_playwright, Browser, Page, Playwright
+
+logger = logging.getLogger(__name__)
+
+
+# Browsers kept running, and pages each of them serves at the same time
+BROWSER_POOL_SIZE = int(os.environ.get('BROWSER_POOL_SIZE', '2'))
+BROWSER_PAGES_PER_BROWSER = int(os.environ.get('BROWSER_PAGES_PER_BROWSER', '2'))
+
+# Recycle a browser after this many pages were handed out from it
+BROWSER_MAX_USES = int(os.environ.get('BROWSER_MAX_USES', '200'))
+
+# Recycle a browser whose processes use more memory than this
+BROWSER_MAX_MEMORY_MB = float(os.environ.get('BROWSER_MAX_MEMORY_MB', '1024'))
+
+# Seconds between health checks
+BROWSER_HEALTH_INTERVAL = float(os.environ.get('BROWSER_HEALTH_INTERVAL', '60'))
+
+LAUNCH_ARGS = [
+    '--disable-blink-features=AutomationControlled',
+    '--no-sandbox',
+    '--disable-dev-shm-usage',
+]
+
+CONTEXT_OPTIONS: Dict[str, Any] = {
+    'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'viewport': {'width': 1920, 'height': 1080},
+    'locale': 'en-US',
+    'timezone_id': 'America/New_York',
+    'extra_http_headers': {
+        'Accept-Language': 'en-US,en;q=0.9',
+        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+        'Accept-Encoding': 'gzip, deflate, br',
+    },
+}
+
+
+class _PooledBrowser:
+    """One running browser and the number of its pages in use."""
+
+    def __init__(self, browser: Browser):
+        self.browser = browser
+        self.in_use = 0
+        self.uses = 0
+        self.launched_at = time.monotonic()
+        self.memory_mb: Optional[float] = None
+        # Set once the browser should be closed as soon as its pages come back
+        self.retiring = False
+
+    @property
+    def available(self) -> bool:
+        return not self.retiring and self.browser.is_connected()
+
+
+class BrowserPool:
+    """
+    Long-lived Chromium browsers handing out pages, see the module docstring.
+
+    Playwright is started on first use, on the event loop of the first caller.
+    """
+
+    def __init__(
+        self,
+        size: int = 2,
+        pages_per_browser: int = 2,
+        max_uses: int = 200,
+        max_memory_mb: float = 1024,
+        health_interval: float = 60,
+        launch_args: Optional[List[str]] = None,
+        context_options: Optional[Dict[str, Any]] = None
+    ):
+        """
+        Args:
+            size: Browsers kept running
+            pages_per_browser: Pages each browser serves at the same time
+            max_uses: Pages handed out by a browser before it is recycled
+            max_memory_mb: Memory of a browser's processes above which it is recycled
+            health_interval: Seconds between health checks
+            launch_args: Chromium command line arguments
+            context_options: Options of the browser context every page is opened in
+        """
+        self.size = size
+        self.pages_per_browser = pages_per_browser
+        self.max_uses = max_uses
+        self.max_memory_mb = max_memory_mb
+        self.health_interval = health_interval
+        self.launch_args = launch_args or []
+        self.context_options = context_options or {}
+
+        self._playwright: Optional[Playwright] = None
+        self._browsers: List[_PooledBrowser] = []
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._launching: Optional[asyncio.Task] = None
+        self._health_task: Optional[asyncio.Task] = None
+        self._launches = 0
+        self._recycles = 0
+        self._pages_handed_out = 0
+
+    async def _ensure_started(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+            self._slots = asyncio.Semaphore(self.size * self.pages_per_browser)
+        if self._playwright is None:
+            async with self._lock:
+                if self._playwright is None:
+                    self._playwright = await async_playwright().start()
+                    self._health_task = asyncio.create_task(self._health_loop())
+
+    @contextlib.asynccontextmanager
+    async def page(self) -> AsyncIterator[Page]:
+        """
+        Borrow a page for one navigation. Waits while every page is in use.
+
+        Yields:
+            An open page of a pooled browser
+        """
+        await self._ensure_started()
+        async with self._slots:
+            pooled, page = await self._acquire()
+            try:
+                yield page
+            finally:
+                await self._release(pooled, page)
+
+    async def _acquire(self):
+        while True:
+            async with self._lock:
+                candidates = [pooled for pooled in self._browsers if pooled.available and pooled.in_use < self.pages_per_browser]
+                if candidates:
+                    pooled = min(candidates, key=lambda pooled: pooled.in_use)
+                    pooled.in_use += 1
+                    pooled.uses += 1
+                    self._pages_handed_out += 1
+                    if pooled.uses >= self.max_uses:
+                        logger.info(f"Recycling browser after {pooled.uses} uses")
+                        pooled.retiring = True
+                    break
+
+                if self._launching is None:
+                    self._launching = asyncio.create_task(self._launch())
+                launching = self._launching
+
+            # Launched outside the lock so pages of running browsers are still
+            # handed out meanwhile. Every caller waiting for a browser shares
+            # the launch, and one giving up does not cancel it for the others.
+            await asyncio.shield(launching)
+
+        # Undone on cancellation too, or the browser would count a page that
+        # is never returned
+        try:
+            context = await pooled.browser.new_context(**self.context_options)
+            try:
+                page = await context.new_page()
+            except BaseException:
+                with contextlib.suppress(Exception):
+                    await context.close()
+                raise
+        except BaseException as e:
+            pooled.in_use -= 1
+            if isinstance(e, Exception):
+                pooled.retiring = True
+            await self._close_if_drained(pooled)
+            raise
+        return pooled, page
+
+    async def _release(self, pooled: _PooledBrowser, page: Page):
+        pooled.in_use -= 1
+        with contextlib.suppress(Exception):
+            await page.context.close()
+        await self._close_if_drained(pooled)
+
+    async def _launch(self) -> _PooledBrowser:
+        try:
+            browser = await self._playwright.chromium.launch(headless=True, args=self.launch_args)
+        finally:
+            self._launching = None
+
+        pooled = _PooledBrowser(browser)
+        browser.on("disconnected", lambda _: setattr(pooled, 'retiring', True))
+        self._browsers.append(pooled)
+        self._launches += 1
+        logger.info(f"Launched pooled browser ({len(self._browsers)} running)")
+        return pooled
+
+    async def _close_if_drained(self, pooled: _PooledBrowser):
+        """Close a retiring browser once none of its pages is in use."""
+        if not pooled.retiring or pooled.in_use > 0 or pooled not in self._browsers:
+            return
+        self._browsers.remove(pooled)
+        self._recycles += 1
+        with contextlib.suppress(Exception):
+            await pooled.browser.close()
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            for pooled in list(self._browsers):
+                try:
+                    await self._check(pooled)
+                except Exception as e:
+                    logger.warning(f"Pooled browser failed its health check, recycling it: {str(e)}")
+                    pooled.retiring = True
+                await self._close_if_drained(pooled)
+
+    async def _check(self, pooled: _PooledBrowser):
+        if not pooled.available:
+            return
+
+        # Also tells whether the browser still answers
+        pooled.memory_mb = await asyncio.wait_for(self._memory_mb(pooled.browser), 10)
+        if pooled.memory_mb is not None and pooled.memory_mb > self.max_memory_mb:
+            logger.info(f"Recycling browser using {pooled.memory_mb:.0f} MB")
+            pooled.retiring = True
+
+    async def _memory_mb(self, browser: Browser) -> Optional[float]:
+        """Resident memory of all processes of a browser, None where /proc is not available."""
+        session = await browser.new_browser_cdp_session()
+        try:
+            info = await asyncio.wait_for(session.send("SystemInfo.getProcessInfo"), 5)
+        finally:
+            await session.detach()
+
+        total_kb = 0
+        for process in info.get("processInfo", []):
+            try:
+                with open(f"/proc/{process['id']}/status") as status_file:
+                    for line in status_file:
+                        if line.startswith("VmRSS:"):
+                            total_kb += int(line.split()[1])
+                            break
+            except (OSError, ValueError):
+                return None
+        return total_kb / 1024
+
+    async def close(self):
+        """Close every browser and stop Playwright (on shutdown)."""
+        if self._health_task is not None:
+            self._health_task.cancel()
+            self._health_task = None
+        if self._launching is not None:
+            # A browser that finished launching meanwhile joins the pool and is closed below
+            self._launching.cancel()
+            await asyncio.gather(self._launching, return_exceptions=True)
+        for pooled in self._browsers:
+            with contextlib.suppress(Exception):
+                await pooled.browser.close()
+        self._browsers = []
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            "browsers": [
+                {
+                    "uses": pooled.uses,
+                    "in_use": pooled.in_use,
+                    "age_seconds": round(now - pooled.launched_at),
+                    "memory_mb": pooled.memory_mb,
+                    "retiring": pooled.retiring,
+                }
+                for pooled in self._browsers
+            ],
+            "launching": self._launching is not None,
+            "launches": self._launches,
+            "recycles": self._recycles,
+            "pages_handed_out": self._pages_handed_out,
+        }
+
+
+# Global instance
+browser_pool = BrowserPool(
+    size=BROWSER_POOL_SIZE,
+    pages_per_browser=BROWSER_PAGES_PER_BROWSER,
+    max_uses=BROWSER_MAX_USES,
+    max_memory_mb=BROWSER_MAX_MEMORY_MB,
+    health_interval=BROWSER_HEALTH_INTERVAL,
+    launch_args=LAUNCH_ARGS,
+    context_options=CONTEXT_OPTIONS
+)
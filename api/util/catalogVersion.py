@@ -0,0 +1,100 @@
+import logging
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+from pymongo import ReturnDocument
+
+from config.db import db
+from util.changeWatcher import change_watcher
+
+logger = logging.getLogger(__name__)
+
+
+class CatalogVersion:
+    """
+    Named version counters that move on every catalog write.
+
+    Counters live in a MongoDB collection so every API replica sees the same
+    versions. Reads are memoized in process for a short refresh interval, so
+    a version check normally costs no database round trip. The change
+    watcher drops the memoized version when another replica bumps it;
+    without the watcher a replica may keep reporting the previous version
+    for up to the refresh interval.
+    """
+
+    def __init__(self, collection, refresh: float = 1.0):
+        """
+        Args:
+            collection: MongoDB collection holding one document per counter
+            refresh: Seconds a version read from MongoDB is reused
+        """
+        self.collection = collection
+        self.refresh = refresh
+        self._versions: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+    async def current(self, name: str = 'products') -> int:
+        """
+        Get the current version of a counter.
+
+        Args:
+            name: Counter name
+
+        Returns:
+            Version number, 0 if the counter was never bumped
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._versions.get(name)
+        if entry is not None and entry[1] > now:
+            return entry[0]
+
+        document = await self.collection.find_one({"_id": name}, {"version": 1})
+        version = document["version"] if document else 0
+        with self._lock:
+            # A bump may have completed while the read was in flight
+            entry = self._versions.get(name)
+            if entry is not None and entry[0] > version:
+                return entry[0]
+            self._versions[name] = (version, now + self.refresh)
+        return version
+
+    def invalidate(self, name: Optional[str] = None):
+        """Forget the memoized version of a counter (all counters if name is None)."""
+        with self._lock:
+            if name is None:
+                self._versions.clear()
+            else:
+                self._versions.pop(name, None)
+
+    async def bump(self, *names: str):
+        """
+        Move one or more counters to a new version.
+
+        Args:
+            names: Counter names (default: 'products')
+        """
+        for name in names or ('products',):
+            document = await self.collection.find_one_and_update(
+                {"_id": name},
+                {"$inc": {"version": 1}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+            with self._lock:
+                self._versions[name] = (document["version"], time.monotonic() + self.refresh)
+
+
+# Global instance
+catalog_version = CatalogVersion(
+    db.catalog_state,
+    refresh=float(os.environ.get('CATALOG_VERSION_REFRESH', '1'))
+)
+
+
+async def _catalog_state_changed(event):
+    catalog_version.invalidate(event["id"])
+
+change_watcher.subscribe('catalog_state', _catalog_state_changed)
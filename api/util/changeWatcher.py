@@ -0,0 +1,345 @@
+import asyncio
+from datetime import datetime
+import logging
+import os
+import socket
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure, PyMongoError
+
+from config.db import db
+
+logger = logging.getLogger(__name__)
+
+
+# Server error codes meaning a stream cannot be resumed from the stored token
+_UNRESUMABLE_CODES = {
+    260,  # InvalidResumeToken
+    280,  # ChangeStreamFatalError
+    286,  # ChangeStreamHistoryLost
+}
+
+# Change stream operations after which a whole collection must be treated as changed
+_RESET_OPERATIONS = {"drop", "rename", "dropDatabase", "invalidate"}
+
+ChangeCallback = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+class ChangeWatcher:
+    """
+    Tells in-process caches about writes made to MongoDB by any replica.
+
+    Caches subscribe to a collection with an async callback. On a replica
+    set the watcher runs one change stream over the subscribed collections
+    and passes every change on as an event::
+
+        {"collection": "products", "operation": "update", "id": ObjectId(...),
+         "document": {...}, "updated_fields": ["price"]}
+
+    ``document`` is the document after the change, or None for deletes, and
+    ``updated_fields`` lists the fields an update set.
+    The stream position (resume token) is stored in MongoDB, so the watcher
+    picks up where it left off after a reconnect or a restart.
+
+    A standalone mongod has no change streams. The watcher then polls a
+    fingerprint of every subscribed collection and sends a ``reset`` event
+    (no id or document) when it moves, meaning anything in the collection
+    may have changed. Subscribers must handle ``reset`` by dropping
+    everything they cached from that collection.
+
+    Collections whose writes stamp an increasing sequence number are polled
+    by that number instead: every document stamped after the last one seen
+    is passed on as an ``update`` event with ``updated_fields`` None, as the
+    changed fields are not known. Numbers handed out before a write can land
+    after higher ones, so documents stay in the poll for ``poll_settle``
+    seconds after they were first seen. Their fingerprint is only polled
+    when one is given, and should only move on changes that leave no
+    stamped document behind (bulk deletes).
+
+    ``running`` is only True while events are being received, so caches that
+    are only safe with invalidation can fall back to reading MongoDB.
+    """
+
+    def __init__(self, database, state_collection, name: str, mode: str = 'auto',
+                 poll_interval: float = 5.0, save_interval: float = 5.0,
+                 poll_settle: float = 10.0, poll_batch: int = 1000):
+        """
+        Args:
+            database: Database to watch
+            state_collection: Collection the resume token is stored in
+            name: Key of the stored resume token, unique per replica
+            mode: 'auto' (change streams, polling on a standalone server), 'poll' or 'off'
+            poll_interval: Seconds between fingerprint checks when polling
+            save_interval: Minimum seconds between two resume token writes
+            poll_settle: Seconds a polled document is read again, for writes landing out of sequence order
+            poll_batch: Documents read per query when polling by sequence number
+        """
+        self.database = database
+        self.state_collection = state_collection
+        self.name = name
+        self.mode = mode
+        self.poll_interval = poll_interval
+        self.save_interval = save_interval
+        self.poll_settle = poll_settle
+        self.poll_batch = poll_batch
+        self.running = False
+        self.active_mode: Optional[str] = None
+        self._subscribers: Dict[str, List[ChangeCallback]] = {}
+        self._fingerprints: Dict[str, Callable[[], Awaitable[Any]]] = {}
+        self._sequence_fields: Dict[str, str] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._token_saved_at = 0.0
+        self._events = 0
+        self._resets = 0
+        self._errors = 0
+        self._last_event_at: Optional[datetime] = None
+
+    def subscribe(self, collection: str, callback: ChangeCallback,
+                  fingerprint: Optional[Callable[[], Awaitable[Any]]] = None,
+                  sequence_field: Optional[str] = None):
+        """
+        Register a callback for the changes of a collection. Subscribe before start().
+
+        Args:
+            collection: Collection name
+            callback: Async function called with each change event
+            fingerprint: Async function returning a value that moves whenever the
+                collection changes, used when polling (default: the dbHash of the collection)
+            sequence_field: Field every write stamps with an increasing number, polled
+                for per-document events, see the class docstring
+        """
+        self._subscribers.setdefault(collection, []).append(callback)
+        if fingerprint is not None:
+            self._fingerprints[collection] = fingerprint
+        if sequence_field is not None:
+            self._sequence_fields[collection] = sequence_field
+
+    async def start(self):
+        """Start watching in the background, using change streams when the server supports them."""
+        if self._task is not None or self.mode == 'off' or not self._subscribers:
+            return
+
+        use_streams = False
+        if self.mode == 'auto':
+            try:
+                hello = await self.database.client.admin.command('hello')
+                use_streams = 'setName' in hello or hello.get('msg') == 'isdbgrid'
+            except PyMongoError as e:
+                logger.error(f"Could not detect the MongoDB deployment type: {str(e)}")
+
+        if use_streams:
+            self._task = asyncio.create_task(self._watch())
+        else:
+            self._task = asyncio.create_task(self._poll())
+        logger.info(f"Watching {', '.join(sorted(self._subscribers))} "
+                    f"using {'change streams' if use_streams else 'polling'}")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self.running = False
+
+    async def _dispatch(self, event: Dict[str, Any]):
+        self._events += 1
+        self._last_event_at = datetime.utcnow()
+        for callback in self._subscribers.get(event["collection"], []):
+            try:
+                await callback(event)
+            except Exception as e:
+                logger.error(f"Change callback for {event['collection']} failed: {str(e)}")
+
+    async def _reset_all(self):
+        """Tell every subscriber that changes may have been missed."""
+        self._resets += 1
+        for collection in list(self._subscribers):
+            await self._dispatch({"collection": collection, "operation": "reset", "id": None, "document": None})
+
+    async def _load_token(self) -> Optional[Dict[str, Any]]:
+        state = await self.state_collection.find_one({"_id": self.name})
+        return state.get("token") if state else None
+
+    async def _save_token(self, token: Optional[Dict[str, Any]], force: bool = False):
+        now = time.monotonic()
+        if token is None or (not force and now - self._token_saved_at < self.save_interval):
+            return
+        await self.state_collection.update_one(
+            {"_id": self.name},
+            {"$set": {"token": token, "updated_at": datetime.utcnow()}},
+            upsert=True
+        )
+        self._token_saved_at = now
+
+    async def _forget_token(self) -> None:
+        await self.state_collection.delete_one({"_id": self.name})
+        return None
+
+    async def _watch(self):
+        pipeline = [{"$match": {"ns.coll": {"$in": sorted(self._subscribers)}}}]
+        token = await self._load_token()
+        delay = 1.0
+
+        while True:
+            try:
+                async with await self.database.watch(
+                    pipeline,
+                    full_document='updateLookup',
+                    resume_after=token,
+                    max_await_time_ms=1000
+                ) as stream:
+                    self.running = True
+                    self.active_mode = 'change_stream'
+                    delay = 1.0
+
+                    while stream.alive:
+                        change = await stream.try_next()
+                        if change is not None and change["operationType"] == "invalidate":
+                            # The stream cannot continue, open a new one from now
+                            token = await self._forget_token()
+                            await self._reset_all()
+                            break
+                        elif change is not None and change["operationType"] in _RESET_OPERATIONS:
+                            await self._reset_all()
+                        elif change is not None:
+                            await self._dispatch({
+                                "collection": change["ns"]["coll"],
+                                "operation": change["operationType"],
+                                "id": change.get("documentKey", {}).get("_id"),
+                                "document": change.get("fullDocument"),
+                                "updated_fields": list(change.get("updateDescription", {}).get("updatedFields", {})),
+                            })
+                        token = stream.resume_token
+                        await self._save_token(token)
+                    await self._save_token(token, force=True)
+
+            except asyncio.CancelledError:
+                await self._save_token(token, force=True)
+                raise
+            except OperationFailure as e:
+                self._errors += 1
+                if e.code in _UNRESUMABLE_CODES:
+                    # The stored position is gone from the oplog, start from now
+                    logger.warning(f"Cannot resume change stream, starting over: {str(e)}")
+                    token = await self._forget_token()
+                    self.running = False
+                    await self._reset_all()
+                    continue
+                logger.error(f"Change stream failed: {str(e)}")
+            except PyMongoError as e:
+                self._errors += 1
+                logger.error(f"Change stream interrupted: {str(e)}")
+
+            self.running = False
+            # Resumed from the token, so nothing is lost while waiting
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30.0)
+
+    async def _fingerprint(self, collection: str) -> Any:
+        if collection in self._fingerprints:
+            return await self._fingerprints[collection]()
+        result = await self.database.command('dbHash', collections=[collection])
+        return result["collections"].get(collection)
+
+    async def _last_sequence(self, collection: str) -> int:
+        field = self._sequence_fields[collection]
+        document = await self.database[collection].find_one(
+            {field: {"$exists": True}}, {field: 1}, sort=[(field, DESCENDING)]
+        )
+        return document[field] if document else 0
+
+    async def _poll_sequence(self, collection: str, position: Dict[str, Any]):
+        """
+        Pass on the documents of a collection stamped after position["settled"].
+
+        Documents seen less than poll_settle seconds ago are read again, so
+        one with a lower number landing late is still passed on, but only
+        once per sequence number.
+        """
+        field = self._sequence_fields[collection]
+        seen: Dict[int, float] = position["seen"]
+        after = position["settled"]
+
+        while True:
+            documents = await self.database[collection].find(
+                {field: {"$gt": after}}
+            ).sort([(field, ASCENDING)]).limit(self.poll_batch).to_list()
+
+            for document in documents:
+                if document[field] in seen:
+                    continue
+                seen[document[field]] = time.monotonic()
+                await self._dispatch({
+                    "collection": collection,
+                    "operation": "update",
+                    "id": document.get("_id"),
+                    "document": document,
+                    "updated_fields": None,
+                })
+
+            if len(documents) < self.poll_batch:
+                break
+            after = documents[-1][field]
+
+        settled = time.monotonic() - self.poll_settle
+        for seq in sorted(seen):
+            if seen[seq] > settled:
+                break
+            position["settled"] = seq
+            del seen[seq]
+
+    async def _poll(self):
+        self.active_mode = 'polling'
+        fingerprints: Dict[str, Any] = {}
+        positions: Dict[str, Dict[str, Any]] = {}
+
+        while True:
+            healthy = True
+            for collection in list(self._subscribers):
+                sequenced = collection in self._sequence_fields
+                try:
+                    if not sequenced or collection in self._fingerprints:
+                        value = await self._fingerprint(collection)
+                        if collection in fingerprints and fingerprints[collection] != value:
+                            await self._dispatch({"collection": collection, "operation": "reset", "id": None, "document": None})
+                            # Everything up to now is covered by the reset
+                            positions.pop(collection, None)
+                        fingerprints[collection] = value
+
+                    if sequenced:
+                        if collection not in positions:
+                            positions[collection] = {"settled": await self._last_sequence(collection), "seen": {}}
+                        else:
+                            await self._poll_sequence(collection, positions[collection])
+                except PyMongoError as e:
+                    self._errors += 1
+                    healthy = False
+                    logger.error(f"Could not poll {collection} for changes: {str(e)}")
+
+            self.running = healthy
+            await asyncio.sleep(self.poll_interval)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.active_mode,
+            "running": self.running,
+            "collections": sorted(self._subscribers),
+            "sequenced": sorted(self._sequence_fields),
+            "events": self._events,
+            "resets": self._resets,
+            "errors": self._errors,
+            "last_event_at": self._last_event_at,
+        }
+
+
+# Global instance
+change_watcher = ChangeWatcher(
+    db,
+    db.change_stream_state,
+    name=os.environ.get('CHANGE_WATCHER_NAME', socket.gethostname()),
+    mode=os.environ.get('CHANGE_WATCHER_MODE', 'auto'),
+    poll_interval=float(os.environ.get('CHANGE_WATCHER_POLL_INTERVAL', '5')),
+    poll_settle=float(os.environ.get('CHANGE_WATCHER_POLL_SETTLE', '10'))
+)
@@ -0,0 +1,251 @@
+"""
+Negotiated response compression.
+
+``CompressionMiddleware`` compresses JSON, NDJSON and other text responses
+with zstd, brotli or gzip, whichever the client accepts and this server
+prefers. Responses that already carry a Content-Encoding (pre-compressed
+bodies such as the produce snapshot) and responses of types that are
+compressed already or must not be buffered (images, tar.gz bundles,
+server-sent events) pass through untouched.
+
+Streamed responses are compressed as they are sent, and the compressed
+output is flushed after every chunk the application sends, so each NDJSON
+line (a batch lookup result, a listed product) reaches the client as soon
+as it is ready. The compressor keeps its history across flushes, so a
+flush costs a few bytes, not the compression of the stream.
+
+brotli and zstd are optional, without their packages only gzip is offered.
+"""
+import logging
+import os
+import zlib
+from typing import Dict, List, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is optional
+    brotli = None
+
+try:
+    from compression import zstd
+except ImportError:
+    try:
+        from backports import zstd
+    except ImportError:  # pragma: no cover - zstd is optional
+        zstd = None
+
+logger = logging.getLogger(__name__)
+
+
+# Bodies smaller than this are sent uncompressed, streamed bodies are
+# always compressed as their size is not known up front
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', '1024'))
+
+# Encodings offered, in order of preference
+COMPRESSION_ENCODINGS = [
+    encoding.strip()
+    for encoding in os.environ.get('COMPRESSION_ENCODINGS', 'zstd,br,gzip').split(',')
+    if encoding.strip()
+]
+
+# Media types worth compressing. text/event-stream is left out on purpose:
+# events must reach the client as soon as they are sent.
+_COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/x-ndjson",
+    "application/xml",
+    "application/javascript",
+    "image/svg+xml",
+    "text/html",
+    "text/plain",
+    "text/css",
+    "text/csv",
+    "text/javascript",
+    "text/xml",
+)
+
+
+class _Encoder:
+    """Incremental compressor for one encoding."""
+
+    def __init__(self, encoding: str, best: bool = False):
+        self.encoding = encoding
+        if encoding == "gzip":
+            # wbits 31 writes a gzip header and trailer
+            self._compressor = zlib.compressobj(9 if best else 6, zlib.DEFLATED, 31)
+        elif encoding == "br":
+            self._compressor = brotli.Compressor(quality=11 if best else 4)
+        elif encoding == "zstd":
+            self._compressor = zstd.ZstdCompressor(level=19 if best else 3)
+        else:
+            raise ValueError(f"Unsupported encoding: {encoding}")
+
+    def compress(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.process(data)
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        """Emit everything compressed so far, keeping the stream open."""
+        if self.encoding == "gzip":
+            return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        if self.encoding == "br":
+            return self._compressor.flush()
+        return self._compressor.flush(zstd.ZstdCompressor.FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+
+def available_encodings() -> List[str]:
+    """Configured encodings whose compressor is installed, in order of preference."""
+    installed = {"gzip": True, "br": brotli is not None, "zstd": zstd is not None}
+    return [encoding for encoding in COMPRESSION_ENCODINGS if installed.get(encoding)]
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    Pick the content encoding of a response.
+
+    Args:
+        accept_encoding: Accept-Encoding header of the request
+
+    Returns:
+        The encoding with the highest q-value the client accepts, server
+        preference breaking ties, or None to send the body as is
+    """
+    if not accept_encoding:
+        return None
+
+    weights: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        weight = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key.lower() == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        if name:
+            weights[name.strip().lower()] = weight
+
+    best = None
+    best_weight = 0.0
+    for encoding in available_encodings():
+        weight = weights.get(encoding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+def compress_bytes(data: bytes, encoding: str) -> bytes:
+    """Compress a whole body once at the best level, for bodies cached in memory."""
+    encoder = _Encoder(encoding, best=True)
+    return encoder.compress(data) + encoder.finish()
+
+
+def _is_compressible(headers: Headers) -> bool:
+    if "content-encoding" in headers:
+        return False
+    if "no-transform" in headers.get("cache-control", "").lower():
+        return False
+    content_type = headers.get("content-type", "").partition(";")[0].strip().lower()
+    return content_type in _COMPRESSIBLE_TYPES or content_type.endswith("+json")
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing responses, see the module docstring.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = COMPRESSION_MIN_SIZE):
+        """
+        Args:
+            app: Application to wrap
+            minimum_size: Bodies smaller than this many bytes are sent uncompressed
+        """
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding"))
+        responder = _CompressingResponder(send, encoding, self.minimum_size)
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressingResponder:
+    """Compresses the messages of one response on their way to the client."""
+
+    def __init__(self, send: Send, encoding: Optional[str], minimum_size: int):
+        self._send = send
+        self._encoding = encoding
+        self._minimum_size = minimum_size
+        self._start: Optional[Message] = None
+        self._encoder: Optional[_Encoder] = None
+        self._passthrough = False
+
+    async def send(self, message: Message):
+        if message["type"] == "http.response.start":
+            headers = Headers(raw=message["headers"])
+            if not _is_compressible(headers) or message["status"] in (204, 304):
+                self._passthrough = True
+                await self._send(message)
+                return
+
+            # The body depends on Accept-Encoding whether or not it ends up compressed
+            MutableHeaders(raw=message["headers"]).add_vary_header("Accept-Encoding")
+            content_length = headers.get("content-length")
+            if self._encoding is None or (content_length is not None and int(content_length) < self._minimum_size):
+                self._passthrough = True
+                await self._send(message)
+                return
+
+            self._start = message
+            return
+
+        if message["type"] != "http.response.body" or self._passthrough:
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self._encoder is None:
+            # A body sent in one message can be measured, a stream is not held
+            # back to find out how long it gets
+            if not more_body and len(body) < self._minimum_size:
+                # Too small to be worth it, send it as it came
+                await self._send(self._start)
+                await self._send({"type": "http.response.body", "body": body, "more_body": False})
+                return
+
+            headers = MutableHeaders(raw=self._start["headers"])
+            headers["Content-Encoding"] = self._encoding
+            if "content-length" in headers:
+                del headers["content-length"]
+            etag = headers.get("etag")
+            if etag is not None and not etag.startswith("W/"):
+                # Same content, different bytes
+                headers["ETag"] = "W/" + etag
+            await self._send(self._start)
+            self._encoder = _Encoder(self._encoding)
+
+        data = self._encoder.compress(body)
+        if not more_body:
+            data += self._encoder.finish()
+        elif body:
+            data += self._encoder.flush()
+
+        if data or not more_body:
+            await self._send({"type": "http.response.body", "body": data, "more_body": more_body})
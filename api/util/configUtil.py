@@ -8,19 +8,25 @@ from api.serializeObjects import serializeDict, serializeList
 import secrets
 
 from api.config.configModel import ConfigModel
+from util.changeWatcher import change_watcher
 
 
 currentConfig = None
+configGeneration = 0
 
-def getConfiguration(useCache=False):
+async def getConfiguration(useCache=True):
     global currentConfig
 
-    useCache = False
+    # The cached copy is only kept current while the change watcher runs
+    useCache = useCache and change_watcher.running
+
+    config = currentConfig
     
-    if currentConfig is None or not useCache:
-        currentConfig =  db.config.find_one()
+    if config is None or not useCache:
+        generation = configGeneration
+        config = await db.config.find_one()
 
-    if currentConfig is None:
+    if config is None:
         print("No configuration found, creating default configuration")
 
         #generate secret key
@@ -34,9 +40,22 @@ def getConfiguration(useCache=False):
 
         newConfig = ConfigModel(**obj)
 
-        inserted = db.config.insert_one(newConfig.model_dump())    
-        currentConfig = db.config.find_one({"_id": inserted.inserted_id})
+        inserted = await db.config.insert_one(newConfig.model_dump())
+        config = await db.config.find_one({"_id": inserted.inserted_id})
+
+    # Not cached if the configuration changed while it was read
+    if config is not currentConfig and generation == configGeneration:
+        currentConfig = config
+
+    configModel = ConfigModel(**config)
+
+    return configModel.model_dump()
+
 
-    configModel = ConfigModel(**currentConfig)
+async def configChanged(event):
+    """Drop the cached configuration when any replica writes it."""
+    global currentConfig, configGeneration
+    configGeneration += 1
+    currentConfig = None
 
-    return configModel.model_dump()
\ No newline at end of file
+change_watcher.subscribe('config', configChanged)
@@ -0,0 +1,150 @@
+import asyncio
+import json
+import logging
+import os
+from typing import Any, Dict, Iterable, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+def format_event(event: str, data: Any, id: Optional[str] = None) -> bytes:
+    """
+    Encode one server-sent event.
+
+    Args:
+        event: Event name
+        data: Payload, bytes are sent as is (must be single-line JSON), anything else is JSON encoded
+        id: Event ID, returned by the client as Last-Event-ID when it reconnects
+    """
+    if not isinstance(data, bytes):
+        data = json.dumps(data, separators=(",", ":"), default=str).encode("utf-8")
+
+    frame = b""
+    if id is not None:
+        frame += b"id: " + id.encode("utf-8") + b"\n"
+    return frame + b"event: " + event.encode("utf-8") + b"\ndata: " + data + b"\n\n"
+
+
+class Subscription:
+    """Events of a set of topics waiting to be sent to one client."""
+
+    def __init__(self, topics: Set[str], max_queue: int):
+        self.topics = topics
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.overflowed = False
+
+    @property
+    def done(self) -> bool:
+        """True once the subscription overflowed and everything queued was handed out."""
+        return self.overflowed and self.queue.empty()
+
+    async def next(self, timeout: float) -> Optional[bytes]:
+        """
+        Wait for the next event frame.
+
+        Returns:
+            The frame, or None if nothing arrived within the timeout
+        """
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class EventBus:
+    """
+    In-process publish/subscribe for pushing events to connected clients.
+
+    Events are encoded once when published and the same bytes are queued for
+    every subscriber of the topic, so an event costs one encode plus a queue
+    put per interested connection and idle connections cost nothing.
+
+    A subscriber that does not keep up is dropped once its queue is full
+    instead of holding up the others. Its stream then ends with a
+    ``resync`` event and the client reconnects and catches up.
+    """
+
+    def __init__(self, max_queue: int = 256):
+        """
+        Args:
+            max_queue: Events queued per subscriber before it is dropped
+        """
+        self.max_queue = max_queue
+        self._topics: Dict[str, Set[Subscription]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._published = 0
+        self._delivered = 0
+        self._overflows = 0
+
+    def subscribe(self, topics: Iterable[str]) -> Subscription:
+        """Subscribe to one or more topics. Must be called from the event loop."""
+        self._loop = asyncio.get_running_loop()
+        subscription = Subscription(set(topics), self.max_queue)
+        for topic in subscription.topics:
+            self._topics.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        for topic in subscription.topics:
+            subscribers = self._topics.get(topic)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._topics[topic]
+
+    def publish(self, topics: Iterable[str], event: str, data: Any, id: Optional[str] = None):
+        """
+        Send an event to the subscribers of any of the topics, each subscriber
+        receives it once. Safe to call from worker threads.
+
+        Args:
+            topics: Topics the event belongs to
+            event: Event name
+            data: Payload (see format_event), or a function returning it, which
+                is only called when the event has subscribers
+            id: Event ID
+        """
+        topics = [topic for topic in topics if topic in self._topics]
+        if not topics:
+            return
+
+        frame = format_event(event, data() if callable(data) else data, id)
+        self._published += 1
+
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+
+        if running is self._loop:
+            self._deliver(topics, frame)
+        elif self._loop is not None:
+            self._loop.call_soon_threadsafe(self._deliver, topics, frame)
+
+    def _deliver(self, topics: Iterable[str], frame: bytes):
+        subscribers = set()
+        for topic in topics:
+            subscribers.update(self._topics.get(topic, ()))
+
+        for subscription in subscribers:
+            try:
+                subscription.queue.put_nowait(frame)
+                self._delivered += 1
+            except asyncio.QueueFull:
+                logger.warning("Event subscriber is not keeping up, dropping it")
+                subscription.overflowed = True
+                self._overflows += 1
+                self.unsubscribe(subscription)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "subscribers": len({subscription for subscribers in self._topics.values() for subscription in subscribers}),
+            "topics": {topic: len(subscribers) for topic, subscribers in sorted(self._topics.items())},
+            "published": self._published,
+            "delivered": self._delivered,
+            "overflows": self._overflows,
+        }
+
+
+# Global instance
+event_bus = EventBus(max_queue=int(os.environ.get('EVENT_QUEUE_SIZE', '256')))
@@ -0,0 +1,161 @@
+"""
+Shared async HTTP client for calls to external services.
+
+Every outgoing request (Open Food Facts, Open Library, Google Books, image
+downloads) goes through one ``httpx.AsyncClient``, so connections are kept
+alive and reused across lookups instead of being opened per request, and
+waiting on a slow service never blocks the event loop.
+
+Connections per host are capped on top of the pool size, so a burst of
+lookups against one slow service cannot take every pooled connection from
+the others. HTTP/2 is used when the ``h2`` package is installed.
+"""
+import asyncio
+import importlib.util
+import logging
+import os
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+# Connection pool size across all hosts, and the share of one host
+HTTP_MAX_CONNECTIONS = int(os.environ.get('HTTP_MAX_CONNECTIONS', '100'))
+HTTP_MAX_CONNECTIONS_PER_HOST = int(os.environ.get('HTTP_MAX_CONNECTIONS_PER_HOST', '10'))
+
+# Seconds to connect, to wait for each read, and to wait for a free connection
+HTTP_CONNECT_TIMEOUT = float(os.environ.get('HTTP_CONNECT_TIMEOUT', '5'))
+HTTP_READ_TIMEOUT = float(os.environ.get('HTTP_READ_TIMEOUT', '10'))
+HTTP_POOL_TIMEOUT = float(os.environ.get('HTTP_POOL_TIMEOUT', '5'))
+
+
+class HttpClient:
+    """
+    Lazily created shared AsyncClient with a per-host connection cap.
+
+    The client belongs to the event loop it was created on and is created
+    again if used from another loop (tests, scripts calling asyncio.run).
+    """
+
+    def __init__(
+        self,
+        max_connections: int = 100,
+        max_connections_per_host: int = 10,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 10.0,
+        pool_timeout: float = 5.0
+    ):
+        """
+        Args:
+            max_connections: Open connections across all hosts
+            max_connections_per_host: Requests in flight to one host
+            connect_timeout: Seconds to establish a connection
+            read_timeout: Seconds to wait for each chunk of a response
+            pool_timeout: Seconds to wait for a free connection
+        """
+        self.max_connections = max_connections
+        self.max_connections_per_host = max_connections_per_host
+        self.timeout = httpx.Timeout(
+            connect=connect_timeout,
+            read=read_timeout,
+            write=read_timeout,
+            pool=pool_timeout
+        )
+        self.http2 = importlib.util.find_spec("h2") is not None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._hosts: Dict[str, asyncio.Semaphore] = {}
+        self._in_flight: Dict[str, int] = {}
+        self._requests = 0
+        self._errors = 0
+
+    def client(self) -> httpx.AsyncClient:
+        """Return the shared client, creating it on first use on this event loop."""
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            self._client = httpx.AsyncClient(
+                http2=self.http2,
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections
+                ),
+                follow_redirects=True
+            )
+            self._loop = loop
+            self._hosts = {}
+        return self._client
+
+    async def get(self, url: str, **kwargs: Any) -> httpx.Response:
+        """
+        Send a GET request through the shared client.
+
+        Args:
+            url: URL to fetch
+            kwargs: Passed on to httpx.AsyncClient.get (headers, params, timeout...)
+
+        Returns:
+            The response, with its body read
+
+        Raises:
+            httpx.HTTPError: If the request failed or timed out, including
+                waiting longer than the pool timeout for a connection to the host
+        """
+        return await self.request("GET", url, **kwargs)
+
+    async def request(self, method: str, url: str, **kwargs: Any) -> httpx.Response:
+        client = self.client()
+        host, slots = self._host_slots(url)
+
+        try:
+            await asyncio.wait_for(slots.acquire(), self.timeout.pool)
+        except asyncio.TimeoutError:
+            self._errors += 1
+            raise httpx.PoolTimeout(f"No free connection to {host}")
+
+        self._requests += 1
+        self._in_flight[host] = self._in_flight.get(host, 0) + 1
+        try:
+            return await client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self._errors += 1
+            raise
+        finally:
+            self._in_flight[host] -= 1
+            slots.release()
+
+    def _host_slots(self, url: str) -> Tuple[str, asyncio.Semaphore]:
+        host = urlsplit(url).netloc.lower()
+        slots = self._hosts.get(host)
+        if slots is None:
+            slots = self._hosts[host] = asyncio.Semaphore(self.max_connections_per_host)
+        return host, slots
+
+    async def close(self):
+        """Close the pooled connections (on shutdown)."""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            self._loop = None
+            self._hosts = {}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "http2": self.http2,
+            "requests": self._requests,
+            "errors": self._errors,
+            "in_flight": {host: count for host, count in self._in_flight.items() if count},
+        }
+
+
+# Global instance
+http_client = HttpClient(
+    max_connections=HTTP_MAX_CONNECTIONS,
+    max_connections_per_host=HTTP_MAX_CONNECTIONS_PER_HOST,
+    connect_timeout=HTTP_CONNECT_TIMEOUT,
+    read_timeout=HTTP_READ_TIMEOUT,
+    pool_timeout=HTTP_POOL_TIMEOUT
+)
@@ -2,6 +2,11 @@
 from uuid import uuid4
 import os
 
+try:
+    from util.eventBus import event_bus
+except ImportError:
+    from .eventBus import event_bus
+
 
 class JobCallback:
     def __init__(self, callback, kwargs = None):
@@ -49,6 +54,7 @@ class Job:
 
         self.status = status
         self.log.append(status)
+        event_bus.publish(["jobs", f"job:{self.uuid}"], "job.status", self.toDict)
         if status in self.statusCallbacks:
             print("Running status callback for ", status)
             self.statusCallbacks[status].run()
@@ -0,0 +1,22 @@
+class ProviderUnavailableError(Exception):
+    """
+    Raised by a lookup provider that could not give a definitive answer
+    (network error, timeout, rate limit, server error).
+
+    Distinguishes "the provider is down" from "the provider does not know
+    this barcode", which lookups report by returning None.
+    """
+
+    def __init__(self, provider: str, message: str = ""):
+        self.provider = provider
+        super().__init__(f"{provider} unavailable: {message}" if message else f"{provider} unavailable")
+
+
+class CircuitOpenError(ProviderUnavailableError):
+    """
+    Raised instead of calling a provider whose circuit breaker is open
+    because its recent calls failed.
+    """
+
+    def __init__(self, provider: str):
+        super().__init__(provider, "circuit open after repeated failures")
@@ -0,0 +1,114 @@
+from datetime import datetime, timedelta
+import logging
+import os
+from typing import Any, Dict, Optional
+
+from config.db import db
+from util.lruCache import LruTtlCache
+
+logger = logging.getLogger(__name__)
+
+
+class LookupMissCache:
+    """
+    Remembers barcodes an external provider definitively does not know.
+
+    Misses are stored in a MongoDB collection with a TTL index on
+    ``expires_at`` (declared in config/indexes.py) so they survive restarts, are shared by every API replica
+    and expire on their own. Known misses are also memoized in process so a
+    repeat scan of an unknown item does not even need a database round trip.
+    """
+
+    def __init__(self, collection, ttl: float = 86400, memo_size: int = 10000, memo_ttl: float = 60):
+        """
+        Args:
+            collection: MongoDB collection holding the misses
+            ttl: Seconds a miss is remembered
+            memo_size: Maximum number of misses memoized in process
+            memo_ttl: Seconds a miss is memoized in process before Mongo is checked again
+        """
+        self.collection = collection
+        self.ttl = ttl
+        self.memo = LruTtlCache(max_size=memo_size, ttl=memo_ttl)
+
+    @staticmethod
+    def _key(upc: str, provider: str) -> str:
+        return f"{provider}:{upc}"
+
+    async def is_miss(self, upc: str, provider: str) -> bool:
+        """
+        Check whether a provider is known not to have a barcode.
+
+        Args:
+            upc: Barcode that was scanned
+            provider: Lookup provider name (e.g. 'openfoodfacts', 'books')
+
+        Returns:
+            True if an unexpired miss is recorded
+        """
+        key = self._key(upc, provider)
+        if self.memo.get(key):
+            return True
+
+        now = datetime.utcnow()
+        record = await self.collection.find_one({"_id": key, "expires_at": {"$gt": now}}, {"expires_at": 1})
+        if record is None:
+            return False
+
+        remaining = (record["expires_at"] - now).total_seconds()
+        self.memo.set(key, True, ttl=min(self.memo.ttl, remaining))
+        return True
+
+    async def record(self, upc: str, provider: str):
+        """Remember that a provider does not know a barcode."""
+        now = datetime.utcnow()
+        key = self._key(upc, provider)
+        await self.collection.update_one(
+            {"_id": key},
+            {"$set": {
+                "upc": upc,
+                "provider": provider,
+                "created_at": now,
+                "expires_at": now + timedelta(seconds=self.ttl),
+            }},
+            upsert=True
+        )
+        self.memo.set(key, True)
+        logger.info(f"Recorded lookup miss for UPC {upc} ({provider})")
+
+    async def purge(self, upc: Optional[str] = None, provider: Optional[str] = None) -> int:
+        """
+        Forget recorded misses.
+
+        Args:
+            upc: Only purge misses for this barcode
+            provider: Only purge misses for this provider
+
+        Returns:
+            Number of misses removed from MongoDB
+        """
+        query: Dict[str, Any] = {}
+        if upc is not None:
+            query["upc"] = upc
+        if provider is not None:
+            query["provider"] = provider
+
+        result = await self.collection.delete_many(query)
+        self.memo.clear()
+        return result.deleted_count
+
+    async def stats(self) -> Dict[str, Any]:
+        """Return the number of stored misses and the in-process memo counters."""
+        return {
+            "ttl": self.ttl,
+            "stored": await self.collection.count_documents({}),
+            "memo": self.memo.stats(),
+        }
+
+
+# Global instance
+lookup_miss_cache = LookupMissCache(
+    db.lookup_misses,
+    ttl=float(os.environ.get('LOOKUP_MISS_TTL', '86400')),
+    memo_ttl=float(os.environ.get('LOOKUP_MISS_MEMO_TTL', '60'))
+)
@@ -0,0 +1,98 @@
+from collections import OrderedDict
+import threading
+import time
+from typing import Any, Dict, Hashable, Optional
+
+
+class LruTtlCache:
+    """
+    Size bounded in-process cache with least-recently-used eviction and a
+    time-to-live on every entry.
+
+    Safe to use from the event loop and from worker threads. Keeps hit, miss,
+    eviction and expiration counters so the size and TTL can be tuned.
+    """
+
+    def __init__(self, max_size: int = 1000, ttl: float = 300.0):
+        """
+        Args:
+            max_size: Maximum number of entries, the least recently used entry is evicted beyond it
+            ttl: Seconds an entry stays valid after it was stored (0 disables expiry)
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the cached value for key, or default if missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """
+        Store a value, evicting the least recently used entries if the cache is full.
+
+        Args:
+            key: Cache key
+            value: Value to store
+            ttl: Override of the cache TTL for this entry
+        """
+        if self.max_size <= 0:
+            return
+
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> bool:
+        """Remove a key. Returns True if it was cached."""
+        with self._lock:
+            return self._entries.pop(key, None) is not None
+
+    def clear(self):
+        """Remove every entry. Counters are kept."""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the cache size, configuration and counters."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else None,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
@@ -0,0 +1,420 @@
+"""
+Registry of the external lookup providers.
+
+Every source (Open Food Facts, Open Library, Google Books, Amazon) is
+registered with the capabilities it answers for ('food', 'book' or
+'price') and gets its own timeout, concurrency limit and circuit breaker.
+``provider_registry.lookup`` asks the providers of a capability in order of
+registration, one after the other or hedged, all within one deadline taken
+from the lookup's latency budget (LOOKUP_BUDGET seconds).
+
+A provider whose calls keep failing (errors, or timing out on its own
+timeout) opens its circuit after LOOKUP_BREAKER_FAILURES failures in a row
+and is skipped straight away, so scans stop paying its timeout. After
+LOOKUP_BREAKER_RESET seconds one call is let through as a probe; it closes
+the circuit when it succeeds and opens it again when it fails.
+
+Timeout and concurrency of a provider can be overridden with
+LOOKUP_<NAME>_TIMEOUT and LOOKUP_<NAME>_CONCURRENCY, e.g.
+LOOKUP_AMAZON_TIMEOUT=20.
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+try:
+    from util.lookupErrors import CircuitOpenError, ProviderUnavailableError
+except ImportError:
+    from .lookupErrors import CircuitOpenError, ProviderUnavailableError
+
+logger = logging.getLogger(__name__)
+
+
+# Seconds one lookup may take across all the providers it asks
+LOOKUP_BUDGET = float(os.environ.get('LOOKUP_BUDGET', '20'))
+
+# Failures in a row that open a circuit, and seconds before it is probed again
+LOOKUP_BREAKER_FAILURES = int(os.environ.get('LOOKUP_BREAKER_FAILURES', '5'))
+LOOKUP_BREAKER_RESET = float(os.environ.get('LOOKUP_BREAKER_RESET', '30'))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Stops calls to a failing provider, see the module docstring.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30, half_open_probes: int = 1):
+        """
+        Args:
+            name: Name of the provider, used in log messages
+            failure_threshold: Failures in a row that open the circuit
+            reset_timeout: Seconds the circuit stays open before it is probed
+            half_open_probes: Calls let through at the same time while probing
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_probes = half_open_probes
+        self.state = CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        self.opened = 0
+
+    def allow(self) -> bool:
+        """Whether a call may go through now. A call let through while half open is a probe."""
+        if self.state == OPEN:
+            if time.monotonic() - self._opened_at < self.reset_timeout:
+                return False
+            self.state = HALF_OPEN
+            self._probes = 0
+
+        if self.state == HALF_OPEN:
+            if self._probes >= self.half_open_probes:
+                return False
+            self._probes += 1
+        return True
+
+    def probe_done(self):
+        """A probe finished, whatever its outcome."""
+        self._probes = max(0, self._probes - 1)
+
+    def record_success(self):
+        self.failures = 0
+        if self.state != CLOSED:
+            logger.info(f"Circuit of {self.name} closed after a successful call")
+        self.state = CLOSED
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+            self.state = OPEN
+            self._opened_at = time.monotonic()
+            self.opened += 1
+            logger.warning(f"Circuit of {self.name} opened after {self.failures} failures, skipping it for {self.reset_timeout:g}s")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "opened": self.opened,
+        }
+
+
+class LookupProvider:
+    """
+    One external source with its timeout, concurrency limit and circuit breaker.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        capabilities: Iterable[str],
+        lookup: Callable[[Any], Awaitable[Optional[Any]]],
+        timeout: float = 10,
+        max_concurrency: int = 10,
+        breaker: Optional[CircuitBreaker] = None
+    ):
+        """
+        Args:
+            name: Provider name, used in errors and stats
+            capabilities: What the provider answers for ('food', 'book', 'price')
+            lookup: Coroutine function returning the answer for a query, None
+                if the provider definitively does not know it, and raising
+                ProviderUnavailableError if it could not answer
+            timeout: Seconds a call may take
+            max_concurrency: Calls in flight at the same time
+            breaker: Circuit breaker, a default one if None
+        """
+        self.name = name
+        self.capabilities = frozenset(capabilities)
+        self.lookup = lookup
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.breaker = breaker or CircuitBreaker(name)
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._in_flight = 0
+        self._calls = 0
+        self._found = 0
+        self._failures = 0
+        self._timeouts = 0
+        self._slot_timeouts = 0
+        self._skipped = 0
+        self._total_ms = 0.0
+
+    async def call(self, query: Any, deadline: Optional[float] = None) -> Optional[Any]:
+        """
+        Ask the provider, within its own timeout and the deadline.
+
+        A call first waits for one of the provider's max_concurrency slots,
+        bounded by the deadline only. The provider's timeout starts once the
+        call has a slot, and running out of budget while waiting for one does
+        not count against the provider's circuit.
+
+        Args:
+            query: Passed on to the provider's lookup
+            deadline: Event loop time by which the answer is needed, None for no deadline
+
+        Returns:
+            The answer, or None if the provider does not know the query
+
+        Raises:
+            CircuitOpenError: If the provider is skipped because it keeps failing
+            ProviderUnavailableError: If the provider failed, timed out, or the
+                deadline passed before it answered
+        """
+        loop = asyncio.get_running_loop()
+        if deadline is not None and deadline <= loop.time():
+            raise ProviderUnavailableError(self.name, "lookup budget exhausted")
+
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+
+        try:
+            async with asyncio.timeout_at(deadline):
+                await self._slots.acquire()
+        except TimeoutError:
+            self._slot_timeouts += 1
+            raise ProviderUnavailableError(self.name, "lookup budget exhausted waiting for a free slot")
+
+        try:
+            return await self._call(query, deadline, loop)
+        finally:
+            self._slots.release()
+
+    async def _call(self, query: Any, deadline: Optional[float], loop: asyncio.AbstractEventLoop) -> Optional[Any]:
+        """Ask the provider while holding a slot."""
+        timeout = self.timeout
+        if deadline is not None:
+            timeout = min(timeout, deadline - loop.time())
+            if timeout <= 0:
+                raise ProviderUnavailableError(self.name, "lookup budget exhausted")
+
+        if not self.breaker.allow():
+            self._skipped += 1
+            raise CircuitOpenError(self.name)
+        probe = self.breaker.state == HALF_OPEN
+
+        self._calls += 1
+        self._in_flight += 1
+        started = time.monotonic()
+        try:
+            async with asyncio.timeout(timeout):
+                result = await self.lookup(query)
+        except TimeoutError:
+            self._timeouts += 1
+            # Only the provider's own timeout says something about the provider,
+            # running out of budget after slower providers does not
+            if timeout >= self.timeout:
+                self.breaker.record_failure()
+            raise ProviderUnavailableError(self.name, f"no answer within {timeout:.2f}s")
+        except Exception as e:
+            self._failures += 1
+            self.breaker.record_failure()
+            if isinstance(e, ProviderUnavailableError):
+                raise
+            raise ProviderUnavailableError(self.name, str(e)) from e
+        finally:
+            self._in_flight -= 1
+            self._total_ms += (time.monotonic() - started) * 1000
+            if probe:
+                self.breaker.probe_done()
+
+        self.breaker.record_success()
+        if result is not None:
+            self._found += 1
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "capabilities": sorted(self.capabilities),
+            "timeout": self.timeout,
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self._in_flight,
+            "calls": self._calls,
+            "found": self._found,
+            "failures": self._failures,
+            "timeouts": self._timeouts,
+            "slot_timeouts": self._slot_timeouts,
+            "skipped": self._skipped,
+            "avg_ms": round(self._total_ms / self._calls, 1) if self._calls else None,
+            "breaker": self.breaker.stats(),
+        }
+
+
+class ProviderRegistry:
+    """
+    Registered lookup providers and the orchestration of a lookup across them.
+    """
+
+    def __init__(self, budget: float = 20, breaker_failures: int = 5, breaker_reset: float = 30):
+        """
+        Args:
+            budget: Seconds one lookup may take across all the providers it asks
+            breaker_failures: Failures in a row that open a provider's circuit
+            breaker_reset: Seconds before an open circuit is probed
+        """
+        self.budget = budget
+        self.breaker_failures = breaker_failures
+        self.breaker_reset = breaker_reset
+        self._providers: List[LookupProvider] = []
+
+    def register(
+        self,
+        name: str,
+        capabilities: Iterable[str],
+        lookup: Callable[[Any], Awaitable[Optional[Any]]],
+        timeout: float = 10,
+        max_concurrency: int = 10
+    ) -> LookupProvider:
+        """
+        Register a provider, after the ones already registered for its capabilities.
+
+        Args:
+            name: Provider name, LOOKUP_<NAME>_TIMEOUT and LOOKUP_<NAME>_CONCURRENCY override the defaults
+            capabilities: What the provider answers for
+            lookup: See LookupProvider
+            timeout: Default seconds a call may take
+            max_concurrency: Default calls in flight at the same time
+
+        Returns:
+            The registered provider
+        """
+        prefix = f"LOOKUP_{name.upper()}_"
+        provider = LookupProvider(
+            name,
+            capabilities,
+            lookup,
+            timeout=float(os.environ.get(prefix + 'TIMEOUT', str(timeout))),
+            max_concurrency=int(os.environ.get(prefix + 'CONCURRENCY', str(max_concurrency))),
+            breaker=CircuitBreaker(name, self.breaker_failures, self.breaker_reset)
+        )
+        self._providers = [existing for existing in self._providers if existing.name != name] + [provider]
+        return provider
+
+    def providers(self, capability: str) -> List[LookupProvider]:
+        """Providers answering for a capability, in order of preference."""
+        return [provider for provider in self._providers if capability in provider.capabilities]
+
+    def deadline(self, budget: Optional[float] = None) -> float:
+        """Event loop time at which a lookup starting now runs out of budget."""
+        return asyncio.get_running_loop().time() + (self.budget if budget is None else budget)
+
+    async def lookup(
+        self,
+        capability: str,
+        query: Any,
+        deadline: Optional[float] = None,
+        hedged: bool = False,
+        grace: float = 0.0
+    ) -> Tuple[Optional[str], Optional[Any]]:
+        """
+        Ask the providers of a capability for a query until one has an answer.
+
+        Sequentially, each provider is only asked once the ones before it
+        have no answer. Hedged, all of them are asked at once; the first
+        provider's answer is taken if it arrives within the grace window,
+        otherwise the first answer from any of them, and the other calls
+        are cancelled.
+
+        Args:
+            capability: 'food', 'book' or 'price'
+            query: Passed on to each provider
+            deadline: Event loop time by which the answer is needed, see deadline()
+            hedged: Ask all providers at once instead of one after the other
+            grace: Seconds the first provider gets before other answers are taken
+
+        Returns:
+            (provider name, answer), or (None, None) if every provider
+            definitively does not know the query
+
+        Raises:
+            ProviderUnavailableError: If no provider had an answer and at least
+                one of them could not be asked or failed, so the result is not
+                a definitive miss
+        """
+        providers = self.providers(capability)
+        if hedged and len(providers) > 1:
+            return await self._lookup_hedged(providers, query, deadline, grace)
+        return await self._lookup_sequential(providers, query, deadline)
+
+    async def _lookup_sequential(
+        self,
+        providers: List[LookupProvider],
+        query: Any,
+        deadline: Optional[float]
+    ) -> Tuple[Optional[str], Optional[Any]]:
+        unavailable = None
+        for provider in providers:
+            try:
+                result = await provider.call(query, deadline)
+            except ProviderUnavailableError as e:
+                logger.warning(str(e))
+                unavailable = e
+                continue
+            if result:
+                return provider.name, result
+
+        if unavailable is not None:
+            raise unavailable
+        return None, None
+
+    async def _lookup_hedged(
+        self,
+        providers: List[LookupProvider],
+        query: Any,
+        deadline: Optional[float],
+        grace: float
+    ) -> Tuple[Optional[str], Optional[Any]]:
+        tasks = [asyncio.create_task(provider.call(query, deadline)) for provider in providers]
+        unavailable = None
+
+        try:
+            await asyncio.wait(tasks[:1], timeout=grace)
+
+            pending = set(tasks)
+            while pending:
+                done = {task for task in pending if task.done()}
+                if not done:
+                    done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                pending -= done
+
+                # Providers that finished together are taken in order of preference
+                for task in sorted(done, key=tasks.index):
+                    try:
+                        result = task.result()
+                    except ProviderUnavailableError as e:
+                        logger.warning(str(e))
+                        unavailable = e
+                        continue
+                    if result:
+                        return providers[tasks.index(task)].name, result
+        finally:
+            for task in tasks:
+                task.cancel()
+            # Collect the cancelled calls and any error nobody looked at
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        if unavailable is not None:
+            raise unavailable
+        return None, None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "budget": self.budget,
+            "providers": {provider.name: provider.stats() for provider in self._providers},
+        }
+
+
+# Global instance
+provider_registry = ProviderRegistry(
+    budget=LOOKUP_BUDGET,
+    breaker_failures=LOOKUP_BREAKER_FAILURES,
+    breaker_reset=LOOKUP_BREAKER_RESET
+)
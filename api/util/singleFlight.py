@@ -0,0 +1,142 @@
+import asyncio
+from datetime import datetime, timedelta
+import logging
+import os
+import socket
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+from uuid import uuid4
+
+from pymongo.errors import DuplicateKeyError
+
+from config.db import db
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key into a single execution.
+
+    The first caller for a key starts the work as a task, every caller that
+    arrives while it is in flight awaits the same task and gets the same
+    result or exception. The task is shielded so one caller going away
+    (client disconnect) does not cancel the work for the others.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.started = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run fn for key, or join the call already in flight for key.
+
+        Args:
+            key: Identifies identical work
+            fn: Coroutine function doing the work
+
+        Returns:
+            The result of fn
+        """
+        task = self._inflight.get(key)
+
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            self.started += 1
+
+            def forget(done, key=key):
+                if self._inflight.get(key) is done:
+                    del self._inflight[key]
+
+            task.add_done_callback(forget)
+        else:
+            self.coalesced += 1
+
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": len(self._inflight),
+            "started": self.started,
+            "coalesced": self.coalesced,
+        }
+
+
+class MongoLease:
+    """
+    Short lived named leases stored in MongoDB.
+
+    Lets API replicas agree on which one performs a piece of work. A lease
+    is a document keyed by name with an owner and an expiry. It is taken by
+    inserting the document (or by taking over an expired one) and released
+    by deleting it. Leases of a crashed replica expire, and a TTL index on
+    ``expires_at`` (declared in config/indexes.py) removes them.
+    """
+
+    def __init__(self, collection, ttl: float = 60, poll_interval: float = 0.25):
+        """
+        Args:
+            collection: MongoDB collection holding the leases
+            ttl: Seconds a lease is held before other replicas may take it over
+            poll_interval: Seconds between checks while waiting for a lease
+        """
+        self.collection = collection
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:8]}"
+
+    async def acquire(self, name: str) -> bool:
+        """
+        Try to take the lease.
+
+        Returns:
+            True if this process now holds the lease
+        """
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=self.ttl)
+
+        try:
+            await self.collection.insert_one({"_id": name, "owner": self.owner, "expires_at": expires_at})
+            return True
+        except DuplicateKeyError:
+            pass
+
+        # Take over a lease whose holder did not release it in time
+        taken = await self.collection.find_one_and_update(
+            {"_id": name, "expires_at": {"$lte": now}},
+            {"$set": {"owner": self.owner, "expires_at": expires_at}}
+        )
+        return taken is not None
+
+    async def release(self, name: str):
+        """Release the lease if this process still holds it."""
+        await self.collection.delete_one({"_id": name, "owner": self.owner})
+
+    async def wait(self, name: str, timeout: Optional[float] = None):
+        """
+        Wait until the lease is released or has expired.
+
+        Args:
+            name: Lease name
+            timeout: Maximum seconds to wait (defaults to the lease TTL)
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + (self.ttl if timeout is None else timeout)
+
+        while loop.time() < deadline:
+            lease = await self.collection.find_one({"_id": name}, {"expires_at": 1})
+            if lease is None or lease["expires_at"] <= datetime.utcnow():
+                return
+            await asyncio.sleep(self.poll_interval)
+
+
+# Global instances. Barcode lookups are always coalesced within a process,
+# LOOKUP_COALESCE_MODE=mongo also coordinates them across replicas.
+lookup_flights = SingleFlight()
+lookup_lease = MongoLease(
+    db.lookup_leases,
+    ttl=float(os.environ.get('LOOKUP_LEASE_TTL', '60')),
+    poll_interval=float(os.environ.get('LOOKUP_LEASE_POLL_INTERVAL', '0.25'))
+) if os.environ.get('LOOKUP_COALESCE_MODE', 'local') == 'mongo' else None
@@ -44,17 +44,21 @@ class ApiService {
     return response.data
   }
 
-  async searchProducts(query: string): Promise<Product[]> {
-    // Get all products - no authentication required
-    const response = await axios.get<Product[]>(`${API_URL}/products`)
-
-    // Filter locally by name
-    const allProducts = response.data
-    const lowerQuery = query.toLowerCase()
-    return allProducts.filter(p =>
-      p.name.toLowerCase().includes(lowerQuery) ||
-      p.brand?.toLowerCase().includes(lowerQuery)
+  async searchProducts(query: string, limit: number = 50): Promise<Product[]> {
+    // Ranked server-side search - no authentication required
+    const response = await axios.get<{ items: Product[], next_cursor: string | null }>(
+      `${API_URL}/products/search`,
+      { params: { q: query, limit } }
     )
+    return response.data.items
+  }
+
+  async getProduct(productId: string): Promise<Product> {
+    const response = await axios.get<Product>(
+      `${API_URL}/products/${productId}`,
+      { headers: this.getHeaders() }
+    )
+    return response.data
   }
 
   async getProduceItems(): Promise<Product[]> {